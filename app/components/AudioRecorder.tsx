@@ -1,12 +1,15 @@
 'use client';
 
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 
 interface AudioRecorderProps {
   isRecording: boolean;
   onStartRecording: () => void;
   onStopRecording: () => void;
   onRecordingComplete: (audioBlob: Blob) => void;
+  // Se presente, la registrazione viene consegnata a blocchi mentre è in corso
+  onChunk?: (chunk: Blob) => void;
+  chunkInterval?: number;
   darkMode?: boolean;
 }
 
@@ -15,11 +18,18 @@ const AudioRecorder: React.FC<AudioRecorderProps> = ({
   onStartRecording,
   onStopRecording,
   onRecordingComplete,
+  onChunk,
+  chunkInterval = 2000,
   darkMode = false
 }) => {
   const [recordingTime, setRecordingTime] = useState(0);
   const [mediaRecorder, setMediaRecorder] = useState<MediaRecorder | null>(null);
   const [audioChunks, setAudioChunks] = useState<Blob[]>([]);
+  const onChunkRef = useRef(onChunk);
+  
+  useEffect(() => {
+    onChunkRef.current = onChunk;
+  }, [onChunk]);
   
   // Stili condizionali per la dark mode
   const buttonBgActive = darkMode ? 'bg-red-700' : 'bg-red-600';
@@ -57,6 +67,7 @@ const AudioRecorder: React.FC<AudioRecorderProps> = ({
         recorder.addEventListener('dataavailable', (event) => {
           if (event.data.size > 0) {
             setAudioChunks(prev => [...prev, event.data]);
+            onChunkRef.current?.(event.data);
           }
         });
         
@@ -84,12 +95,13 @@ const AudioRecorder: React.FC<AudioRecorderProps> = ({
 
   useEffect(() => {
     if (isRecording && mediaRecorder && mediaRecorder.state === 'inactive') {
-      mediaRecorder.start();
+      // Con lo streaming attivo MediaRecorder produce un blocco ogni chunkInterval ms
+      mediaRecorder.start(onChunkRef.current ? chunkInterval : undefined);
       setAudioChunks([]);
     } else if (!isRecording && mediaRecorder && mediaRecorder.state === 'recording') {
       mediaRecorder.stop();
     }
-  }, [isRecording, mediaRecorder]);
+  }, [isRecording, mediaRecorder, chunkInterval]);
 
   const formatTime = (seconds: number) => {
     const mins = Math.floor(seconds / 60);
@@ -150,6 +150,12 @@ export default function SystemStatus({ darkMode = false }: SystemStatusProps) {
               <span className={darkMode ? 'text-gray-300' : 'text-gray-600'}>{ollamaStatus?.current_model?.name || 'Non disponibile'}</span>
             </p>
           )}
+          {ollamaStatus?.status === 'online' && ollamaStatus.gpu_check && (
+            <p className="text-sm">
+              <span className="font-semibold">Esecuzione LLM:</span>{' '}
+              <span className={darkMode ? 'text-gray-300' : 'text-gray-600'}>{ollamaStatus.gpu_check}</span>
+            </p>
+          )}
         </div>
       </div>
       
@@ -13,6 +13,8 @@ import {
   generateReport, 
   correctGrammar, 
   cleanTranscript, 
+  startStreamingTranscription,
+  StreamingTranscription,
   ReportMetadata as ReportMetadataType,
   TranscriptionResult,
   ReportResult 
@@ -25,6 +27,8 @@ export default function Home() {
   const [transcript, setTranscript] = useState<string | null>(null);
   const [originalTranscript, setOriginalTranscript] = useState<string | null>(null);
   const [editedTranscript, setEditedTranscript] = useState<string | null>(null);
+  // Sessione salvata sul server: report e correzioni vengono aggiunti alla stessa
+  const [sessionId, setSessionId] = useState<string | null>(null);
   const [report, setReport] = useState<string | null>(null);
   const [reportMethod, setReportMethod] = useState<'ollama' | 'local' | null>(null);
   const [isLoading, setIsLoading] = useState(false);
@@ -35,6 +39,12 @@ export default function Home() {
   const transcriptTextareaRef = useRef<HTMLTextAreaElement>(null);
   const [darkMode, setDarkMode] = useState(false);
   
+  // Trascrizione in tempo reale durante la registrazione
+  const [liveTranscription, setLiveTranscription] = useState(true);
+  const [liveTranscript, setLiveTranscript] = useState<string | null>(null);
+  const streamingRef = useRef<StreamingTranscription | null>(null);
+  const pendingChunksRef = useRef<Blob[]>([]);
+  
   // Nuovi stati per le nuove funzionalità
   const [selectedTemplate, setSelectedTemplate] = useState<string>("lab_report");
   const [grammarCorrectionStatus, setGrammarCorrectionStatus] = useState<'idle' | 'loading' | 'success' | 'error'>('idle');
@@ -96,9 +106,52 @@ export default function Home() {
     }
   };
 
-  const startRecording = () => {
+  const startRecording = async () => {
     setIsRecording(true);
     setAudioFile(null); // Clear uploaded file when recording starts
+    setLiveTranscript(null);
+    pendingChunksRef.current = [];
+    
+    if (!liveTranscription) return;
+    
+    try {
+      const stream = await startStreamingTranscription({
+        onPartial: (text) => setLiveTranscript(text),
+        onFinal: (result) => {
+          streamingRef.current = null;
+          setTranscript(result.transcript);
+          setOriginalTranscript(result.originalTranscript);
+          setEditedTranscript(result.transcript);
+          setSessionId(result.sessionId ?? null);
+          setIsLoading(false);
+          setStep(3);
+        },
+        onError: (err) => {
+          streamingRef.current?.close();
+          streamingRef.current = null;
+          setIsLoading(false);
+          setStep(1);
+          setError(`Errore nella trascrizione in tempo reale: ${err.message}. Puoi comunque trascrivere la registrazione al termine.`);
+        }
+      }, true);
+      
+      // Invia i blocchi registrati prima che la sessione fosse pronta
+      pendingChunksRef.current.forEach(chunk => stream.sendChunk(chunk));
+      pendingChunksRef.current = [];
+      streamingRef.current = stream;
+    } catch (err) {
+      // Senza streaming si ricade sulla trascrizione al termine della registrazione
+      console.error("Error starting streaming transcription:", err);
+      streamingRef.current = null;
+    }
+  };
+  
+  const handleAudioChunk = (chunk: Blob) => {
+    if (streamingRef.current) {
+      streamingRef.current.sendChunk(chunk);
+    } else {
+      pendingChunksRef.current.push(chunk);
+    }
   };
 
   const stopRecording = () => {
@@ -113,13 +166,26 @@ export default function Home() {
       const audioUrl = URL.createObjectURL(audioBlob);
       audioRef.current.src = audioUrl;
     }
+    
+    // Con lo streaming attivo resta da trascrivere solo l'ultima parte
+    if (streamingRef.current) {
+      setIsLoading(true);
+      setStep(2);
+      streamingRef.current.finish().catch((err: any) => {
+        streamingRef.current?.close();
+        streamingRef.current = null;
+        setIsLoading(false);
+        setStep(1);
+        setError(`Errore nella trascrizione in tempo reale: ${err.message}`);
+      });
+    }
   };  // Nuova funzione per correggere la grammatica
   const handleCorrectGrammar = async () => {
     if (!editedTranscript) return;
     
     try {
       setGrammarCorrectionStatus('loading');
-      const result = await correctGrammar(editedTranscript);
+      const result = await correctGrammar(editedTranscript, 'academic', undefined, sessionId ?? undefined);
       
       // Verifica se il risultato è un oggetto con un flag di timeout
       if (typeof result === 'object' && 'timedOut' in result) {
@@ -153,7 +219,7 @@ export default function Home() {
     
     try {
       setIsLoading(true);
-      const result = await cleanTranscript(editedTranscript);
+      const result = await cleanTranscript(editedTranscript, sessionId ?? undefined);
       
       // Verifica se il risultato è un oggetto con un flag di timeout
       if (typeof result === 'object' && 'timedOut' in result) {
@@ -195,6 +261,7 @@ export default function Home() {
       setTranscript(result.transcript);
       setOriginalTranscript(result.originalTranscript);
       setEditedTranscript(result.transcript); // Initialize edited transcript with processed one
+      setSessionId(result.sessionId ?? null);
       setStep(3); // Move to editing step
       
     } catch (err: any) {
@@ -221,11 +288,17 @@ export default function Home() {
         institution: institution || "Università"
       };
       
-      // Generate report using API
+      // Generate report using API: il report viene mostrato mentre viene generato
       const result = await generateReport(
         editedTranscript,
         selectedTemplate,
-        metadata
+        metadata,
+        (partialReport) => {
+          setReport(partialReport);
+          setStep(4);
+        },
+        'auto',
+        sessionId ?? undefined
       );
       
       setReport(result.report);
@@ -296,8 +369,10 @@ export default function Home() {
     setTranscript(null);
     setOriginalTranscript(null);
     setEditedTranscript(null);
+    setSessionId(null);
     setReport(null);
     setReportMethod(null);
+    setLiveTranscript(null);
     setError(null);
     setStep(1);
     setUserName("Studente");
@@ -493,8 +568,26 @@ export default function Home() {
                 onStartRecording={startRecording}
                 onStopRecording={stopRecording}
                 onRecordingComplete={handleRecordingComplete}
+                onChunk={liveTranscription ? handleAudioChunk : undefined}
                 darkMode={darkMode}
               />
+              
+              <label className={`flex items-center justify-center mt-4 text-sm ${darkMode ? 'text-gray-400' : 'text-gray-600'}`}>
+                <input
+                  type="checkbox"
+                  className="mr-2"
+                  checked={liveTranscription}
+                  disabled={isRecording}
+                  onChange={(e) => setLiveTranscription(e.target.checked)}
+                />
+                Trascrizione in tempo reale durante la registrazione
+              </label>
+              
+              {isRecording && liveTranscript && (
+                <div className={`mt-4 p-3 rounded-md text-sm ${darkMode ? 'bg-gray-700 text-gray-200' : 'bg-gray-50 text-gray-700'}`}>
+                  {liveTranscript}
+                </div>
+              )}
             </div>
             
             {/* Continue button */}
@@ -528,6 +621,9 @@ export default function Home() {
             <div className="animate-spin rounded-full h-16 w-16 border-b-2 border-blue-600 mx-auto mb-6"></div>
             <h2 className={`text-2xl font-semibold mb-4 ${darkMode ? 'text-white' : 'text-gray-800'}`}>Trascrizione in corso...</h2>
             <p className={`${darkMode ? 'text-gray-300' : 'text-gray-600'} mb-4`}>Stiamo analizzando il file audio. Questo processo potrebbe richiedere alcuni minuti.</p>
+            {liveTranscript && (
+              <p className={`text-sm text-left max-w-2xl mx-auto ${darkMode ? 'text-gray-400' : 'text-gray-500'}`}>{liveTranscript}</p>
+            )}
           </div>
         )}
         
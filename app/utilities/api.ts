@@ -1,7 +1,13 @@
 // utilities/api.ts
 export const API_BASE_URL = 'http://localhost:5000';
 
-export const transcribeAudio = async (audioFile: File | Blob, cleanFillerWords: boolean = true): Promise<TranscriptionResult> => {
+export type TranscriptionProfile = 'fast' | 'balanced' | 'accurate';
+
+export const transcribeAudio = async (
+  audioFile: File | Blob,
+  cleanFillerWords: boolean = true,
+  profile?: TranscriptionProfile
+): Promise<TranscriptionResult> => {
   // Create FormData object
   const formData = new FormData();
   
@@ -15,34 +21,23 @@ export const transcribeAudio = async (audioFile: File | Blob, cleanFillerWords:
   
   // Add clean_filler_words parameter
   formData.append('clean_filler_words', cleanFillerWords.toString());
+  // Profilo di velocità (se assente il server usa quello predefinito)
+  if (profile) {
+    formData.append('profile', profile);
+  }
   
   try {
-    // Utilizziamo un controller per il timeout con un tempo più lungo per la trascrizione
-    const controller = new AbortController();
-    const timeoutId = setTimeout(() => controller.abort(), 300000); // 5 minuti di timeout per la trascrizione
-    
-    const response = await fetch(`${API_BASE_URL}/api/transcribe`, {
-      method: 'POST',
-      body: formData,
-      signal: controller.signal
-    });
-    
-    clearTimeout(timeoutId); // Pulisce il timeout se la chiamata ha successo
-    
-    if (!response.ok) {
-      throw new Error(`Server responded with ${response.status}: ${response.statusText}`);
-    }
-    
-    const data = await response.json();
-    
-    if (data.error) {
-      throw new Error(data.error);
-    }
+    // La trascrizione viene accodata come job: il server risponde subito con l'ID
+    const job = await submitTranscriptionJob(formData);
+    const data = await waitForTranscriptionJob(job.job_id);
     
     return {
       transcript: data.transcript,
       originalTranscript: data.original_transcript,
-      cleaned: data.cleaned
+      cleaned: data.cleaned,
+      profile: data.profile,
+      rtf: data.rtf,
+      sessionId: data.session_id
     };
   } catch (error: any) {
     console.error('Error transcribing audio:', error);
@@ -56,14 +51,329 @@ export const transcribeAudio = async (audioFile: File | Blob, cleanFillerWords:
   }
 };
 
+export interface BatchTranscriptionResult {
+  files: (TranscriptionResult & { filename: string })[];
+  mergedTranscript?: string;
+}
+
+// Trascrive più clip della stessa sessione in una sola richiesta (un solo modello residente)
+export const transcribeAudioBatch = async (
+  audioFiles: File[],
+  cleanFillerWords: boolean = true,
+  merge: boolean = true
+): Promise<BatchTranscriptionResult> => {
+  const formData = new FormData();
+  audioFiles.forEach(file => formData.append('files', file));
+  formData.append('clean_filler_words', cleanFillerWords.toString());
+  formData.append('merge', merge.toString());
+  
+  const response = await fetch(`${API_BASE_URL}/api/transcribe/batch`, {
+    method: 'POST',
+    body: formData
+  });
+  
+  if (response.status === 429) {
+    const data = await response.json();
+    throw new Error(`Il server è occupato con altre trascrizioni. Riprova tra ${data.retry_after} secondi.`);
+  }
+  
+  if (!response.ok) {
+    throw new Error(`Server responded with ${response.status}: ${response.statusText}`);
+  }
+  
+  const data = await response.json();
+  return {
+    files: data.files.map((file: any) => ({
+      filename: file.filename,
+      transcript: file.transcript,
+      originalTranscript: file.original_transcript,
+      cleaned: file.cleaned
+    })),
+    mergedTranscript: data.merged_transcript
+  };
+};
+
+export interface TranscriptionJob {
+  job_id: string;
+  status: 'queued' | 'running' | 'completed' | 'failed';
+  position?: number;
+  error?: string;
+  result?: any;
+}
+
+export const submitTranscriptionJob = async (formData: FormData): Promise<TranscriptionJob> => {
+  const response = await fetch(`${API_BASE_URL}/api/transcribe/jobs`, {
+    method: 'POST',
+    body: formData
+  });
+  
+  if (response.status === 429) {
+    const data = await response.json();
+    throw new Error(`Il server è occupato con altre trascrizioni. Riprova tra ${data.retry_after} secondi.`);
+  }
+  
+  if (!response.ok) {
+    throw new Error(`Server responded with ${response.status}: ${response.statusText}`);
+  }
+  
+  return response.json();
+};
+
+export const getTranscriptionJob = async (jobId: string): Promise<TranscriptionJob> => {
+  const response = await fetch(`${API_BASE_URL}/api/transcribe/jobs/${jobId}`);
+  
+  if (!response.ok) {
+    throw new Error(`Server responded with ${response.status}: ${response.statusText}`);
+  }
+  
+  return response.json();
+};
+
+export const waitForTranscriptionJob = async (
+  jobId: string,
+  pollInterval: number = 2000,
+  maxWait: number = 3600000 // 1 ora
+): Promise<any> => {
+  const startedAt = Date.now();
+  
+  while (Date.now() - startedAt < maxWait) {
+    const job = await getTranscriptionJob(jobId);
+    
+    if (job.status === 'completed') {
+      return job.result;
+    }
+    if (job.status === 'failed') {
+      throw new Error(job.error || 'Trascrizione non riuscita');
+    }
+    
+    await new Promise(resolve => setTimeout(resolve, pollInterval));
+  }
+  
+  throw new Error('timeout');
+};
+
+export interface StreamingTranscriptionHandlers {
+  onPartial: (transcript: string) => void;
+  onFinal: (result: TranscriptionResult) => void;
+  onError: (error: Error) => void;
+}
+
+export interface StreamingTranscription {
+  sendChunk: (chunk: Blob) => void;
+  finish: () => Promise<void>;
+  close: () => void;
+}
+
+export const startStreamingTranscription = async (
+  handlers: StreamingTranscriptionHandlers,
+  cleanFillerWords: boolean = true
+): Promise<StreamingTranscription> => {
+  const response = await fetch(`${API_BASE_URL}/api/transcribe/stream`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify({ clean_filler_words: cleanFillerWords })
+  });
+  
+  if (!response.ok) {
+    throw new Error(`Server responded with ${response.status}: ${response.statusText}`);
+  }
+  
+  const { session_id: sessionId } = await response.json();
+  const sessionUrl = `${API_BASE_URL}/api/transcribe/stream/${sessionId}`;
+  
+  // Le trascrizioni parziali arrivano come Server-Sent Events
+  const events = new EventSource(`${sessionUrl}/events`);
+  events.addEventListener('partial', (event) => {
+    const data = JSON.parse((event as MessageEvent).data);
+    handlers.onPartial(data.transcript);
+  });
+  events.addEventListener('final', (event) => {
+    const data = JSON.parse((event as MessageEvent).data);
+    events.close();
+    handlers.onFinal({
+      transcript: data.transcript,
+      originalTranscript: data.original_transcript,
+      cleaned: data.cleaned,
+      sessionId: data.session_id
+    });
+  });
+  events.addEventListener('error', (event) => {
+    // Errore inviato dal server oppure connessione persa
+    const message = (event as MessageEvent).data
+      ? JSON.parse((event as MessageEvent).data).error
+      : 'Connessione allo streaming interrotta';
+    events.close();
+    handlers.onError(new Error(message));
+  });
+  
+  // I blocchi devono arrivare al server nell'ordine in cui sono stati registrati
+  let pending: Promise<void> = Promise.resolve();
+  
+  return {
+    sendChunk: (chunk: Blob) => {
+      pending = pending.then(async () => {
+        const chunkResponse = await fetch(`${sessionUrl}/chunks`, {
+          method: 'POST',
+          headers: {
+            'Content-Type': 'application/octet-stream',
+          },
+          body: chunk
+        });
+        if (!chunkResponse.ok) {
+          throw new Error(`Server responded with ${chunkResponse.status}: ${chunkResponse.statusText}`);
+        }
+      }).catch((error) => {
+        console.error('Error sending audio chunk:', error);
+        handlers.onError(error);
+      });
+    },
+    finish: async () => {
+      await pending;
+      const finishResponse = await fetch(`${sessionUrl}/finish`, { method: 'POST' });
+      if (!finishResponse.ok) {
+        throw new Error(`Server responded with ${finishResponse.status}: ${finishResponse.statusText}`);
+      }
+    },
+    close: () => events.close()
+  };
+};
+
 export interface ReportResult {
   report: string;
   template: string;
   method: 'ollama' | 'local';
 }
 
-export const generateReport = async (transcript: string, templateId: string, metadata: ReportMetadata): Promise<ReportResult> => {
+// Legge una risposta Server-Sent Events ottenuta con fetch (EventSource non supporta POST)
+export const readServerSentEvents = async (
+  response: Response,
+  onEvent: (event: string, data: any) => void
+): Promise<void> => {
+  if (!response.body) {
+    throw new Error('Streaming non supportato dal browser');
+  }
+  
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    
+    buffer += decoder.decode(value, { stream: true });
+    
+    let separatorIndex;
+    while ((separatorIndex = buffer.indexOf('\n\n')) !== -1) {
+      const rawEvent = buffer.slice(0, separatorIndex);
+      buffer = buffer.slice(separatorIndex + 2);
+      
+      let event = 'message';
+      const dataLines: string[] = [];
+      for (const line of rawEvent.split('\n')) {
+        if (line.startsWith('event: ')) {
+          event = line.slice(7);
+        } else if (line.startsWith('data: ')) {
+          dataLines.push(line.slice(6));
+        }
+      }
+      
+      if (dataLines.length > 0) {
+        onEvent(event, JSON.parse(dataLines.join('\n')));
+      }
+    }
+  }
+};
+
+// auto: map-reduce solo per le trascrizioni più lunghe del contesto del modello
+export type ReportMode = 'auto' | 'single' | 'mapreduce' | 'sections';
+
+const generateReportStream = async (
+  transcript: string,
+  templateId: string,
+  metadata: ReportMetadata,
+  onProgress: (partialReport: string) => void,
+  mode: ReportMode,
+  sessionId?: string
+): Promise<ReportResult> => {
+  const response = await fetch(`${API_BASE_URL}/api/generate-report/stream`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify({ 
+      transcript, 
+      templateId, 
+      metadata,
+      mode,
+      sessionId
+    })
+  });
+  
+  if (!response.ok) {
+    throw new Error(`Server responded with ${response.status}: ${response.statusText}`);
+  }
+  
+  let partialReport = '';
+  let result = null as ReportResult | null;
+  // Modalità "sections": le sezioni arrivano in ordine di completamento
+  let header = '';
+  let sectionNames: string[] = [];
+  const sectionTexts: Record<number, string> = {};
+  
+  await readServerSentEvents(response, (event, data) => {
+    if (event === 'section') {
+      sectionTexts[data.index] = data.text;
+      const body = sectionNames
+        .map((name, index) => (index in sectionTexts ? `## ${name}\n\n${sectionTexts[index]}` : ''))
+        .filter(Boolean)
+        .join('\n\n');
+      onProgress(header + body);
+    } else if (event === 'progress') {
+      // Trascrizioni lunghe: le parti vengono riassunte prima del report
+      onProgress(`Analisi della trascrizione: parte ${data.completed} di ${data.total}...`);
+    } else if (event === 'start') {
+      header = data.header;
+      sectionNames = data.sections || [];
+      partialReport = data.header;
+      onProgress(partialReport);
+    } else if (event === 'token') {
+      partialReport += data.text;
+      onProgress(partialReport);
+    } else if (event === 'done') {
+      result = {
+        report: data.report,
+        template: data.template,
+        method: data.method || 'local'
+      };
+    } else if (event === 'error') {
+      throw new Error(data.error);
+    }
+  });
+  
+  if (!result) {
+    throw new Error('Generazione del report interrotta');
+  }
+  
+  return result;
+};
+
+export const generateReport = async (
+  transcript: string,
+  templateId: string,
+  metadata: ReportMetadata,
+  onProgress?: (partialReport: string) => void,
+  mode: ReportMode = 'auto',
+  sessionId?: string
+): Promise<ReportResult> => {
   try {
+    // Con onProgress il report viene mostrato man mano che viene generato
+    if (onProgress) {
+      return await generateReportStream(transcript, templateId, metadata, onProgress, mode, sessionId);
+    }
+    
     console.log('Sending report generation request without timeout');
     
     // Non utilizziamo più il controller per il timeout
@@ -75,7 +385,9 @@ export const generateReport = async (transcript: string, templateId: string, met
       body: JSON.stringify({ 
         transcript, 
         templateId, 
-        metadata 
+        metadata,
+        mode,
+        sessionId
       })
       // Rimosso signal: controller.signal per non avere timeout
     });
@@ -123,6 +435,11 @@ export interface TranscriptionResult {
   transcript: string;
   originalTranscript: string;
   cleaned: boolean;
+  profile?: TranscriptionProfile;
+  // Tempo di trascrizione diviso per la durata dell'audio
+  rtf?: number;
+  // Sessione in cui il server ha salvato la trascrizione
+  sessionId?: string;
 }
 
 export interface Template {
@@ -158,8 +475,56 @@ export interface GrammarCorrectionResult {
   timedOut: boolean;
 }
 
-export const correctGrammar = async (text: string, style: string = 'academic'): Promise<string | GrammarCorrectionResult> => {
+const correctGrammarStream = async (
+  text: string,
+  style: string,
+  onProgress: (partialText: string) => void,
+  sessionId?: string
+): Promise<string> => {
+  const response = await fetch(`${API_BASE_URL}/api/correct-text/stream`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify({ text, style, sessionId })
+  });
+  
+  if (!response.ok) {
+    throw new Error(`Server responded with ${response.status}: ${response.statusText}`);
+  }
+  
+  let partialText = '';
+  let correctedText = null as string | null;
+  
+  await readServerSentEvents(response, (event, data) => {
+    if (event === 'token') {
+      partialText += data.text;
+      onProgress(partialText);
+    } else if (event === 'done') {
+      correctedText = data.corrected_text;
+    } else if (event === 'error') {
+      throw new Error(data.error);
+    }
+  });
+  
+  if (correctedText === null) {
+    throw new Error('Correzione del testo interrotta');
+  }
+  
+  return correctedText;
+};
+
+export const correctGrammar = async (
+  text: string,
+  style: string = 'academic',
+  onProgress?: (partialText: string) => void,
+  sessionId?: string
+): Promise<string | GrammarCorrectionResult> => {
   try {
+    if (onProgress) {
+      return await correctGrammarStream(text, style, onProgress, sessionId);
+    }
+    
     console.log('Sending grammar correction request without timeout');
     
     // Non utilizziamo più il controller per il timeout
@@ -168,7 +533,7 @@ export const correctGrammar = async (text: string, style: string = 'academic'):
       headers: {
         'Content-Type': 'application/json',
       },
-      body: JSON.stringify({ text, style })
+      body: JSON.stringify({ text, style, sessionId })
       // Rimosso signal: controller.signal per non avere timeout
     });
     
@@ -204,7 +569,10 @@ export interface TranscriptCleaningResult {
   timedOut: boolean;
 }
 
-export const cleanTranscript = async (text: string): Promise<string | TranscriptCleaningResult> => {
+export const cleanTranscript = async (
+  text: string,
+  sessionId?: string
+): Promise<string | TranscriptCleaningResult> => {
   try {
     console.log('Sending transcript cleaning request without timeout');
     
@@ -214,7 +582,7 @@ export const cleanTranscript = async (text: string): Promise<string | Transcript
       headers: {
         'Content-Type': 'application/json',
       },
-      body: JSON.stringify({ text })
+      body: JSON.stringify({ text, sessionId })
       // Rimosso signal: controller.signal per non avere timeout
     });
     
@@ -256,6 +624,33 @@ export interface MemoryStats {
     cuda_available: boolean;
     device: string;
   };
+  whisper_pool?: WhisperPoolStats;
+  transcript_cache?: {
+    hits: number;
+    misses: number;
+    hit_rate: number;
+    entries: number;
+    bytes: number;
+  };
+  llm_cache?: {
+    hits: number;
+    misses: number;
+    coalesced: number;
+    hit_rate: number;
+    entries: number;
+    bytes: number;
+  };
+}
+
+export interface WhisperPoolStats {
+  hits: number;
+  misses: number;
+  evictions: number;
+  idle_evictions: number;
+  pressure_evictions: number;
+  resident: { size: string; device: string; in_use: number; idle_seconds: number }[];
+  idle_timeout: number;
+  memory_threshold: number;
 }
 
 export const getMemoryStats = async (): Promise<MemoryStats> => {
@@ -284,6 +679,9 @@ export interface OllamaStatus {
   models: any[];
   current_model: any;
   gpu_check: string;
+  running_models?: any[];
+  checked_at?: number;  // timestamp dell'ultimo controllo in background
+  age?: number;
 }
 
 export const getOllamaStatus = async (): Promise<OllamaStatus> => {
@@ -312,3 +710,106 @@ export const getOllamaStatus = async (): Promise<OllamaStatus> => {
     };
   }
 };
+
+export type SessionEntryKind = 'transcription' | 'clean' | 'correction' | 'report';
+
+export interface SessionEntry {
+  id: string;
+  session_id: string;
+  kind: SessionEntryKind;
+  template_id: string | null;
+  created_at: number;
+  metadata: Record<string, any>;
+  content?: string;
+  preview?: string;  // nelle liste, salvo full=true
+}
+
+export interface SessionSummary {
+  id: string;
+  title: string | null;
+  created_at: number;
+  updated_at: number;
+  entries: Partial<Record<SessionEntryKind, number>>;
+}
+
+export interface SessionPage {
+  sessions: SessionSummary[];
+  next_cursor: string | null;
+}
+
+export interface SessionDetail extends Omit<SessionSummary, 'entries'> {
+  // Ultimo risultato di ogni tipo, con il contenuto completo
+  latest: Partial<Record<SessionEntryKind, SessionEntry>>;
+}
+
+// Sessioni salvate dal server, dalla più recente (passare next_cursor per la pagina successiva)
+export const listSessions = async (limit: number = 20, cursor?: string): Promise<SessionPage> => {
+  const params = new URLSearchParams({ limit: limit.toString() });
+  if (cursor) {
+    params.append('cursor', cursor);
+  }
+  const response = await fetch(`${API_BASE_URL}/api/sessions?${params}`);
+  const data = await response.json();
+  if (!response.ok || data.error) {
+    throw new Error(data.error || `Server responded with ${response.status}`);
+  }
+  return data;
+};
+
+// Ripristina una sessione senza ritrascrivere né rigenerare
+export const getSession = async (sessionId: string): Promise<SessionDetail> => {
+  const response = await fetch(`${API_BASE_URL}/api/sessions/${encodeURIComponent(sessionId)}`);
+  const data = await response.json();
+  if (!response.ok || data.error) {
+    throw new Error(data.error || `Server responded with ${response.status}`);
+  }
+  return data;
+};
+
+export interface SearchSegment {
+  index: number;
+  start: number | null;  // secondi dall'inizio (null per i report)
+  end: number | null;
+  text: string;
+  matched_terms: number;
+}
+
+export interface SearchResult {
+  entry_id: string;
+  session_id: string;
+  kind: SessionEntryKind;
+  title: string | null;
+  template_id: string | null;
+  created_at: number;
+  score: number;
+  segments: SearchSegment[];
+}
+
+export interface SearchResponse {
+  query: string;
+  terms: string[];
+  total: number;
+  results: SearchResult[];
+  indexing: boolean;  // indice ancora in costruzione all'avvio del server
+  took_ms: number;
+}
+
+// Ricerca nelle trascrizioni e nei report salvati (un risultato per sessione)
+export const searchSessions = async (
+  query: string,
+  options: { limit?: number; kind?: SessionEntryKind; sessionId?: string } = {}
+): Promise<SearchResponse> => {
+  const params = new URLSearchParams({ q: query, limit: (options.limit ?? 10).toString() });
+  if (options.kind) {
+    params.append('kind', options.kind);
+  }
+  if (options.sessionId) {
+    params.append('session_id', options.sessionId);
+  }
+  const response = await fetch(`${API_BASE_URL}/api/search?${params}`);
+  const data = await response.json();
+  if (!response.ok || data.error) {
+    throw new Error(data.error || `Server responded with ${response.status}`);
+  }
+  return data;
+};
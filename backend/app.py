@@ -1,25 +1,46 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
+from werkzeug.exceptions import HTTPException
 import os
-import tempfile
-import requests
 import json
 import re
+import time
 from dotenv import load_dotenv
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import sys
-import gc  # Per la garbage collection
-import whisper
-import torch
-from memory_utils import free_gpu_memory, load_whisper_model, offload_model, check_gpu_memory
+
+# Load environment variables (prima dei moduli locali, che leggono la configurazione all'import)
+load_dotenv()
+
+from warmup import warmup, default_device, torch_loaded, STARTUP_WARMUP
+from memory_utils import check_gpu_memory
+from model_manager import whisper_pool
+from job_queue import transcription_queue, QueueFullError, COMPLETED, FAILED
+from transcription_profiles import get_profile, decode_options, torch_threads, describe_profiles, DEFAULT_PROFILE
+from batch_transcription import transcribe_batch, BATCH_MAX_FILES, BATCH_DECODE_WORKERS
+from long_audio import transcribe_long_audio, LONG_AUDIO_THRESHOLD, LONG_AUDIO_WORKERS, SAMPLE_RATE
+from streaming_transcription import StreamingTranscriber, StreamTooLargeError
+from ollama_client import OllamaError
+from ollama_router import OllamaRouter, OLLAMA_API_URLS, parse_urls
+from transcript_cache import TranscriptCache, transcript_cache_key
+from whisper_backends import model_id as whisper_model_id, WHISPER_BACKEND
+from audio_io import decode_audio_stream, UploadTooLargeError, AudioTooLongError, MAX_UPLOAD_BYTES
+from llm_cache import LLMResponseCache, llm_cache_key, MISS
+from session_store import SessionStore, KINDS, TRANSCRIPTION, CLEAN, CORRECTION, REPORT
+from search_index import SearchIndex
+from text_cleaner import clean_transcript
+from correction_rules import correct_text_locally
+from report_mapreduce import MapReduceReporter
+from report_sections import SectionReporter, assemble_sections
+from resource_scheduler import ResourceScheduler
+from metrics import (registry as metrics_registry, CONTENT_TYPE as METRICS_CONTENT_TYPE, UPLOAD_DECODE_SECONDS,
+                     TRANSCRIBE_SECONDS, TRANSCRIBE_RTF, CLEAN_SECONDS, SEARCH_SECONDS, GENERATION_METHOD_TOTAL)
 
 # Add debugging prints
 print("Script started")
 sys.stdout.flush()
 
-# Load environment variables
-load_dotenv()
-
 # Add diagnostic print for environment variables
 print("Loaded environment variables:")
 print(f"OLLAMA_API_URL: {os.getenv('OLLAMA_API_URL', 'http://localhost:11434')}")
@@ -28,6 +49,8 @@ sys.stdout.flush()
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
+# Flask rifiuta (413) le richieste dichiaratamente più grandi del limite degli upload audio
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
 print("Flask app created")
 sys.stdout.flush()
 
@@ -42,116 +65,601 @@ MODEL_NAME = os.getenv("MODEL_NAME", "mistral:latest")
 # - "mistral:7b-instruct" (medio-alto)
 # - "mistral:latest" (alto)
 
+# Client condiviso: una o più istanze di Ollama (OLLAMA_API_URLS), ognuna con
+# connessioni persistenti, timeout, retry e circuit breaker; ogni generazione va
+# all'istanza meno carica che ha il modello
+ollama_client = OllamaRouter(parse_urls(OLLAMA_API_URLS, OLLAMA_API_URL), MODEL_NAME)
+# Stato dell'istanza principale controllato in background e servito dalla cache:
+# lo scheduler lo usa per la memoria occupata dall'LLM su questo host
+ollama_health = ollama_client.primary.health
+# Cache delle risposte dell'LLM (report e correzioni)
+llm_cache = LLMResponseCache()
+# Report gerarchici (map-reduce) per le trascrizioni più lunghe del contesto del modello
+report_reducer = MapReduceReporter(lambda prompt: ollama_client.generate(prompt), llm_cache, MODEL_NAME)
+# Generazione per sezioni, più sezioni in parallelo sugli slot di Ollama
+section_reporter = SectionReporter(lambda prompt: _generate_section_cached(prompt))
+
 # Print the model that will be used
 print(f"Using model: {MODEL_NAME}")
+print(f"Ollama instances: {', '.join(instance.url for instance in ollama_client.instances)}")
 sys.stdout.flush()
 
-# Initialize Whisper model (using 'tiny' for faster results, can be changed to 'base', 'small', 'medium', or 'large')
-# For production, you might want to use 'small' or 'medium' for better accuracy
-print("Loading Whisper model...")
-sys.stdout.flush()
-# Check if CUDA (GPU) is available
-device = "cuda" if torch.cuda.is_available() else "cpu"
-if device == "cuda":
-    print(f"Using GPU: {torch.cuda.get_device_name(0)}")
-else:
-    print("GPU not available, using CPU")
-sys.stdout.flush()
+# Il processo padre del reloader di Flask non serve richieste: niente warm-up
+_reloader_parent = (__name__ == '__main__' and os.environ.get('FLASK_DEBUG', 'true').lower() == 'true'
+                    and not os.environ.get('WERKZEUG_RUN_MAIN'))
 
-# Non carichiamo immediatamente il modello Whisper, lo caricheremo solo quando necessario
-whisper_model = None
+# Non carichiamo immediatamente il modello Whisper: il pool lo carica al primo
+# utilizzo e lo mantiene residente finché resta in uso o la memoria lo consente
+WHISPER_MODEL_SIZE = os.getenv("WHISPER_MODEL_SIZE", "medium")
+# Modello e lingua per la trascrizione in streaming (finestre brevi: meglio non
+# affidarsi al riconoscimento automatico della lingua)
+STREAMING_MODEL_SIZE = os.getenv("STREAMING_MODEL_SIZE", WHISPER_MODEL_SIZE)
+STREAMING_LANGUAGE = os.getenv("STREAMING_LANGUAGE", "it")
 
-@app.route('/api/transcribe', methods=['POST'])
-def transcribe_audio():
+# Servizi con effetti all'avvio (file su disco, thread in background), creati
+# da start_services()
+transcript_cache = None
+session_store = None
+search_index = None
+
+def start_services():
+    """
+    Apre la cache delle trascrizioni, l'archivio delle sessioni e l'indice di
+    ricerca e avvia il warm-up dei modelli. Eseguita all'import del modulo
+    tranne che nei processi del pool per l'audio lungo: con "python app.py"
+    lo spawn li avvia reimportando questo script come __mp_main__, e a loro
+    servono solo le funzioni.
+    """
+    global transcript_cache, session_store, search_index
+    # Cache su disco delle trascrizioni, indicizzata per hash dell'audio e parametri
+    transcript_cache = TranscriptCache()
+    # Archivio SQLite di trascrizioni e report, raggruppati in sessioni di lavoro
+    session_store = SessionStore()
+    # Indice di ricerca sui risultati salvati: ricostruito in background all'avvio,
+    # poi aggiornato a ogni salvataggio
+    search_index = SearchIndex()
+    search_index.start_rebuild(session_store)
+    
+    # torch e whisper non vengono importati qui: il warm-up li carica (e rileva
+    # CUDA) mentre le rotte che non usano i modelli rispondono già
+    if STARTUP_WARMUP == "eager":
+        warmup.run()
+    elif STARTUP_WARMUP == "background" and not _reloader_parent:
+        warmup.start()
+    sys.stdout.flush()
+
+if __name__ != '__mp_main__':
+    start_services()
+
+def _save_result(kind, content, session_id=None, template_id=None, metadata=None, title=None):
+    """
+    Salva un risultato nell'archivio delle sessioni e restituisce i campi da
+    aggiungere alla risposta. Un errore dell'archivio non fa fallire la richiesta.
+    """
+    try:
+        session_id, entry_id = session_store.save(kind, content, session_id, template_id, metadata, title)
+        search_index.add({"id": entry_id, "session_id": session_id, "kind": kind, "template_id": template_id,
+                          "content": content, "metadata": metadata or {}, "created_at": time.time()})
+        return {"session_id": session_id, "entry_id": entry_id}
+    except Exception as e:
+        print(f"Error saving {kind} to the session store: {str(e)}")
+        return {}
+
+# Coordina la memoria tra Whisper e l'LLM (occupazione dell'LLM letta da /api/ps)
+resource_scheduler = ResourceScheduler(whisper_pool, ollama_health.model_memory_gb)
+
+def _whisper_transcribe(audio, long_audio='auto', profile_name=None):
+    """
+    Trascrive l'audio già decodificato (float32 a 16 kHz) con Whisper e
+    restituisce il risultato grezzo (senza pulizia), nel formato salvato nella
+    cache delle trascrizioni.
+    
+    Il profilo di velocità sceglie dimensione del modello, lingua e opzioni di
+    decodifica; il risultato riporta il profilo e il real-time factor misurato.
+    """
+    profile_name, profile = get_profile(profile_name)
+    duration = len(audio) / SAMPLE_RATE
+    use_long_mode = long_audio == 'true' or (long_audio == 'auto' and duration > LONG_AUDIO_THRESHOLD)
+    
+    print(f"Transcribing audio ({duration:.0f}s, long audio mode: {use_long_mode}, profile: {profile_name})")
+    device = default_device()
+    options = decode_options(profile, device)
+    use_processes = use_long_mode and device == "cpu" and LONG_AUDIO_WORKERS > 1
+    # Lo scheduler può scegliere un modello più piccolo se la memoria non basta
+    with resource_scheduler.transcription(profile["model_size"], device,
+                                          LONG_AUDIO_WORKERS if use_processes else None) as model_size, \
+            TRANSCRIBE_SECONDS.time(model=model_size, mode="long" if use_long_mode else "standard"):
+        start = time.perf_counter()
+        if use_processes:
+            # I blocchi vengono trascritti dai processi worker, ognuno con il proprio modello
+            result = transcribe_long_audio(audio, model_size, options=options, threads=profile["threads"])
+        else:
+            # Il modello resta residente nel pool tra una richiesta e l'altra
+            with whisper_pool.model(model_size) as (whisper_model, model_size), torch_threads(profile["threads"], device):
+                if whisper_model is None:
+                    raise RuntimeError("Failed to load Whisper model")
+                
+                # Transcribe the audio file using Whisper
+                if use_long_mode:
+                    result = transcribe_long_audio(audio, model_size, device=device, model=whisper_model,
+                                                   options=options)
+                else:
+                    result = whisper_model.transcribe(audio, **options)
+        elapsed = time.perf_counter() - start
+    
+    rtf = elapsed / duration if duration else 0.0
+    TRANSCRIBE_RTF.observe(rtf, profile=profile_name)
+    return {
+        "original_transcript": result["text"],
+        "model_size": model_size,
+        "profile": profile_name,
+        "rtf": round(rtf, 4),
+        "transcription_seconds": round(elapsed, 3),
+        "language": result.get("language"),
+        "duration": duration,
+        "long_audio": use_long_mode,
+        "segments": [
+            {"start": seg["start"], "end": seg["end"], "text": seg["text"]}
+            for seg in result.get("segments", [])
+        ]
+    }
+
+def run_transcription(audio, audio_digest, clean_filler_words=True, long_audio='auto', profile=DEFAULT_PROFILE,
+                      session_id=None):
+    """
+    Esegue la trascrizione dell'audio decodificato con il modello Whisper residente.
+    Usata sia dall'endpoint sincrono sia dai job asincroni.
+    
+    `audio_digest` è lo SHA-256 del file caricato, usato come chiave della cache.
+    `long_audio` può essere 'true', 'false' o 'auto' (a blocchi oltre LONG_AUDIO_THRESHOLD secondi).
+    `profile` è il profilo di velocità (fast, balanced, accurate).
+    Un audio già trascritto con gli stessi parametri viene servito dalla cache.
+    Il risultato viene salvato nella sessione `session_id` (nuova se assente).
+    """
+    profile_name, profile_options = get_profile(profile)
+    # Le opzioni di decodifica risolte (non solo il nome del profilo): cambiare
+    # lingua o parametri del profilo via ambiente invalida le trascrizioni in cache
+    cache_options = {"long_audio": long_audio, "profile": profile_name,
+                     **decode_options(profile_options, default_device())}
+    cache_key = transcript_cache_key(audio_digest, whisper_model_id(profile_options["model_size"]),
+                                     options=cache_options)
+    result = transcript_cache.get(cache_key)
+    cached = result is not None
+    if cached:
+        print(f"Transcript cache hit for {audio_digest[:12]}")
+    else:
+        result = _whisper_transcribe(audio, long_audio, profile_name)
+        if result["model_size"] != profile_options["model_size"]:
+            # Trascritto con un modello più piccolo: va in cache sotto la sua dimensione
+            cache_key = transcript_cache_key(audio_digest, whisper_model_id(result["model_size"]),
+                                             options=cache_options)
+        transcript_cache.put(cache_key, result)
+    
+    result = _finish_transcription(result, clean_filler_words, cached)
+    return {**result, **_save_transcription(result, session_id)}
+
+def _finish_transcription(result, clean_filler_words, cached):
+    """
+    Applica la pulizia richiesta al risultato grezzo (dalla cache o da Whisper).
+    """
+    # Save the original transcript before cleaning
+    original_transcript = result["original_transcript"]
+    transcript = original_transcript
+    
+    # Clean the transcript if requested
+    if clean_filler_words:
+        print("Cleaning transcript (removing filler words)...")
+        with CLEAN_SECONDS.time():
+            transcript = clean_transcript(transcript, result.get("language"))
+    
+    return {
+        **result,
+        "transcript": transcript,
+        "original_transcript": original_transcript,
+        "cleaned": clean_filler_words,
+        "cached": cached
+    }
+
+def _save_transcription(result, session_id=None, filename=None):
+    """
+    Salva una trascrizione (già pulita se richiesto) con i suoi parametri.
+    Il testo originale resta nei metadati quando è stato pulito; i segmenti
+    con i tempi servono alla ricerca.
+    """
+    metadata = {key: result.get(key) for key in ("model_size", "profile", "rtf", "language", "duration", "cleaned",
+                                                 "segments")}
+    if filename:
+        metadata["filename"] = filename
+    if result["cleaned"]:
+        metadata["original_transcript"] = result["original_transcript"]
+    return _save_result(TRANSCRIPTION, result["transcript"], session_id, metadata=metadata)
+
+def run_batch_transcription(names, audios, digests, clean_filler_words=True, language=None, merge=True,
+                            profile=DEFAULT_PROFILE, session_id=None):
+    """
+    Trascrive più file con un solo modello residente, decodificando insieme le
+    finestre da 30 secondi di tutti i file. I file già trascritti vengono
+    serviti dalla cache.
+    """
+    profile_name, profile_options = get_profile(profile)
+    language = language or profile_options["language"]
+    device = default_device()
+    options = {"mode": "batch", "profile": profile_name, **decode_options(profile_options, device),
+               "language": language}
+    results = [None] * len(audios)
+    pending = []
+    for i, digest in enumerate(digests):
+        cached = transcript_cache.get(transcript_cache_key(digest, whisper_model_id(profile_options["model_size"]),
+                                                           options=options))
+        if cached is not None:
+            results[i] = _finish_transcription(cached, clean_filler_words, True)
+        else:
+            pending.append(i)
+    
+    if pending:
+        with resource_scheduler.transcription(profile_options["model_size"], device) as model_size, \
+                TRANSCRIBE_SECONDS.time(model=model_size, mode="batch"):
+            start = time.perf_counter()
+            with whisper_pool.model(model_size) as (whisper_model, model_size), torch_threads(profile_options["threads"], device):
+                if whisper_model is None:
+                    raise RuntimeError("Failed to load Whisper model")
+                batch_results = transcribe_batch(whisper_model, [audios[i] for i in pending], language,
+                                                 options=decode_options(profile_options, device))
+            elapsed = time.perf_counter() - start
+        
+        # Real-time factor dell'intero batch, riportato per ogni file
+        total_duration = sum(len(audios[i]) for i in pending) / SAMPLE_RATE
+        rtf = elapsed / total_duration if total_duration else 0.0
+        TRANSCRIBE_RTF.observe(rtf, profile=profile_name)
+        for i, result in zip(pending, batch_results):
+            result = {
+                "original_transcript": result["text"],
+                "model_size": model_size,
+                "profile": profile_name,
+                "rtf": round(rtf, 4),
+                "language": result.get("language"),
+                "duration": len(audios[i]) / SAMPLE_RATE,
+                "long_audio": False,
+                "segments": result["segments"]
+            }
+            transcript_cache.put(transcript_cache_key(digests[i], whisper_model_id(model_size), options=options), result)
+            results[i] = _finish_transcription(result, clean_filler_words, False)
+    
+    # Tutti i file del batch finiscono nella stessa sessione
+    files = []
+    for name, result in zip(names, results):
+        saved = _save_transcription(result, session_id, name)
+        session_id = saved.get("session_id", session_id)
+        files.append({"filename": name, **result, **saved})
+    response = {"files": files, "session_id": session_id}
+    if merge:
+        response["merged_transcript"] = "\n\n".join(f["transcript"].strip() for f in files if f["transcript"].strip())
+    return response
+
+def _upload_stream():
+    """
+    Stream dell'audio caricato e parametri della richiesta: form multipart con
+    il campo "file", oppure corpo grezzo (Content-Type audio/* o
+    application/octet-stream) con i parametri nella query string, letto
+    direttamente dalla connessione.
+    Restituisce (stream, parametri, None) oppure (None, None, risposta di errore).
+    """
+    if request.mimetype.startswith('audio/') or request.mimetype == 'application/octet-stream':
+        return request.stream, request.args, None
+    
     if 'file' not in request.files:
-        return jsonify({"error": "No file part"}), 400
+        return None, None, (jsonify({"error": "No file part"}), 400)
     
     file = request.files['file']
     if file.filename == '':
-        return jsonify({"error": "No selected file"}), 400
+        return None, None, (jsonify({"error": "No selected file"}), 400)
+    return file.stream, request.form, None
+
+def _submit_transcription_job():
+    """
+    Decodifica in memoria l'audio caricato e accoda la trascrizione.
+    Restituisce (job, None) oppure (None, risposta di errore).
+    """
+    stream, params, error_response = _upload_stream()
+    if error_response is not None:
+        return None, error_response
     
     # Get additional parameters
-    clean_filler_words = request.form.get('clean_filler_words', 'true').lower() == 'true'
-    
-    # Carica il modello Whisper solo quando necessario
-    global whisper_model
-    if whisper_model is None:
-        whisper_model = load_whisper_model("medium")
-        if whisper_model is None:
-            return jsonify({"error": "Failed to load Whisper model"}), 500
+    clean_filler_words = params.get('clean_filler_words', 'true').lower() == 'true'
+    long_audio = params.get('long_audio', 'auto').lower()
+    try:
+        profile, _ = get_profile(params.get('profile'))
+    except ValueError as e:
+        return None, (jsonify({"error": str(e)}), 400)
     
-    # Save uploaded file to a temporary file
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.mp3')
-    file.save(temp_file.name)
-    temp_file.close()
+    # L'upload passa direttamente a ffmpeg: nessun file temporaneo né doppia lettura
+    try:
+        with UPLOAD_DECODE_SECONDS.time():
+            audio, audio_digest, size = decode_audio_stream(stream)
+    except (UploadTooLargeError, AudioTooLongError) as e:
+        return None, (jsonify({"error": str(e)}), 413)
+    except RuntimeError as e:
+        return None, (jsonify({"error": str(e)}), 400)
+    print(f"Decoded upload: {size / (1024 * 1024):.1f} MB, {len(audio) / SAMPLE_RATE:.0f}s of audio")
     
     try:
-        # Transcribe the audio file using Whisper
-        print(f"Transcribing file: {temp_file.name}")
-        result = whisper_model.transcribe(temp_file.name)
-        transcript = result["text"]
-        
-        # Save the original transcript before cleaning
-        original_transcript = transcript
-        
-        # Clean the transcript if requested
-        if clean_filler_words:
-            print("Cleaning transcript (removing filler words)...")
-            transcript = clean_transcript(transcript)
+        job = transcription_queue.submit(run_transcription, audio, audio_digest, clean_filler_words, long_audio,
+                                         profile, params.get('session_id') or None)
+        return job, None
+    except QueueFullError as e:
+        response = jsonify({"error": str(e), "retry_after": e.retry_after})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return None, (response, 429)
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    return jsonify({"error": f"Upload exceeds the maximum size of {MAX_UPLOAD_BYTES // (1024 * 1024)} MB"}), 413
+
+@app.route('/api/transcribe', methods=['POST'])
+def transcribe_audio():
+    try:
+        job, error_response = _submit_transcription_job()
+        if error_response is not None:
+            return error_response
         
-        # Clean up the temporary file
-        os.unlink(temp_file.name)
+        # L'endpoint sincrono passa comunque dal pool limitato e attende il risultato
+        job = transcription_queue.wait(job.id)
+        if job.status == FAILED:
+            print(f"Error during transcription: {job.error}")
+            return jsonify({"error": job.error}), 500
         
-        # Libera memoria dopo l'uso di Whisper
-        # Se abbiamo finito con la trascrizione, possiamo scaricare il modello per liberare memoria
-        print("Offloading Whisper model to free memory...")
-        offload_model(whisper_model)
-        whisper_model = None  # Reset reference
-        free_gpu_memory()  # Forza pulizia memoria GPU
+        return jsonify(job.result)
+    
+    except HTTPException:
+        # Es. upload oltre MAX_CONTENT_LENGTH: risposta 413 dall'errorhandler
+        raise
+    except Exception as e:
+        print(f"Error during transcription: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/transcribe/batch', methods=['POST'])
+def transcribe_batch_endpoint():
+    """
+    Trascrive più file caricati insieme (campo "files" ripetuto). Restituisce
+    la trascrizione di ogni file nell'ordine di caricamento e, con merge=true,
+    anche il testo unito.
+    """
+    files = [f for f in request.files.getlist('files') if f.filename]
+    if not files:
+        return jsonify({"error": "No files provided"}), 400
+    if len(files) > BATCH_MAX_FILES:
+        return jsonify({"error": f"Too many files (max {BATCH_MAX_FILES})"}), 400
+    
+    clean_filler_words = request.form.get('clean_filler_words', 'true').lower() == 'true'
+    merge = request.form.get('merge', 'true').lower() == 'true'
+    language = request.form.get('language') or None
+    session_id = request.form.get('session_id') or None
+    try:
+        profile, _ = get_profile(request.form.get('profile'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    try:
+        # Decodifiche ffmpeg in parallelo, una per file
+        with UPLOAD_DECODE_SECONDS.time(), \
+                ThreadPoolExecutor(max_workers=min(len(files), BATCH_DECODE_WORKERS)) as pool:
+            decoded = list(pool.map(lambda f: decode_audio_stream(f.stream), files))
+    except (UploadTooLargeError, AudioTooLongError) as e:
+        return jsonify({"error": str(e)}), 413
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    names = [f.filename for f in files]
+    audios = [audio for audio, _, _ in decoded]
+    digests = [digest for _, digest, _ in decoded]
+    try:
+        job = transcription_queue.submit(run_batch_transcription, names, audios, digests,
+                                         clean_filler_words, language, merge, profile, session_id,
+                                         kind="batch_transcription")
+        job = transcription_queue.wait(job.id)
+        if job.status == FAILED:
+            print(f"Error during batch transcription: {job.error}")
+            return jsonify({"error": job.error}), 500
+        return jsonify(job.result)
+    except QueueFullError as e:
+        response = jsonify({"error": str(e), "retry_after": e.retry_after})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 429
+    except Exception as e:
+        print(f"Error during batch transcription: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/transcribe/profiles', methods=['GET'])
+def transcription_profiles():
+    """
+    Profili di velocità disponibili per le trascrizioni.
+    """
+    return jsonify({"default": DEFAULT_PROFILE, "profiles": describe_profiles()})
+
+@app.route('/api/transcribe/jobs', methods=['POST'])
+def submit_transcription_job():
+    """
+    Accoda una trascrizione e restituisce subito l'ID del job.
+    """
+    try:
+        job, error_response = _submit_transcription_job()
+        if error_response is not None:
+            return error_response
         
         return jsonify({
-            "transcript": transcript,
-            "original_transcript": original_transcript,
-            "cleaned": clean_filler_words
-        })
+            **job.to_dict(),
+            "position": transcription_queue.position(job.id)
+        }), 202
     
+    except HTTPException:
+        raise
     except Exception as e:
-        # Clean up the temporary file in case of error
-        if os.path.exists(temp_file.name):
-            os.unlink(temp_file.name)
-        
-        # Libera memoria anche in caso di errore
-        offload_model(whisper_model)
-        whisper_model = None  # Reset reference
-        free_gpu_memory()
-        
-        print(f"Error during transcription: {str(e)}")
+        print(f"Error submitting transcription job: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/generate-report', methods=['POST'])
-def generate_report():
-    data = request.json
+@app.route('/api/transcribe/jobs/<job_id>', methods=['GET'])
+def transcription_job_status(job_id):
+    job = transcription_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
     
-    if not data or 'transcript' not in data:
-        return jsonify({"error": "No transcript provided"}), 400
+    return jsonify({
+        **job.to_dict(include_result=True),
+        "position": transcription_queue.position(job_id)
+    })
+
+@app.route('/api/transcribe/jobs/<job_id>/result', methods=['GET'])
+def transcription_job_result(job_id):
+    job = transcription_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
     
-    transcript = data['transcript']
-    # Get templateId from request or use default
-    template_id = data.get('templateId', 'lab_report')
+    if job.status == COMPLETED:
+        return jsonify(job.result)
+    if job.status == FAILED:
+        return jsonify({"error": job.error}), 500
     
-    # Get metadata from request
-    metadata = data.get('metadata', {})
-    user_name = metadata.get('author', 'Studente')
-    institution = metadata.get('institution', 'Università')
-    title = metadata.get('title', 'Relazione di Laboratorio')
+    # Non ancora pronto
+    return jsonify(job.to_dict()), 202
+
+@app.route('/api/transcribe/jobs/<job_id>/events', methods=['GET'])
+def transcription_job_events(job_id):
+    """
+    Invia gli aggiornamenti di stato del job come Server-Sent Events.
+    """
+    if transcription_queue.get(job_id) is None:
+        return jsonify({"error": "Job not found"}), 404
     
-    # Libera memoria prima di eseguire il modello LLM
-    if torch.cuda.is_available():
-        print("Clearing CUDA cache before report generation...")
-        torch.cuda.empty_cache()
-        gc.collect()
-        print("Memory cleared successfully")
+    def events():
+        version = -1
+        while True:
+            job = transcription_queue.wait_for_update(job_id, version, timeout=15)
+            if job is None:
+                return
+            if job.version == version:
+                # Nessun cambiamento: commento di keep-alive
+                yield ": keep-alive\n\n"
+                continue
+            version = job.version
+            payload = {**job.to_dict(include_result=True), "position": transcription_queue.position(job_id)}
+            yield f"event: {job.status}\ndata: {json.dumps(payload)}\n\n"
+            if job.done:
+                return
     
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def _transcribe_stream_window(audio, initial_prompt=None):
+    with resource_scheduler.transcription(STREAMING_MODEL_SIZE, default_device()) as model_size:
+        with whisper_pool.model(model_size) as (whisper_model, model_size), TRANSCRIBE_SECONDS.time(model=model_size, mode="stream"):
+            if whisper_model is None:
+                raise RuntimeError("Failed to load Whisper model")
+            return whisper_model.transcribe(audio, language=STREAMING_LANGUAGE, initial_prompt=initial_prompt,
+                                            condition_on_previous_text=False)
+
+def _save_stream_transcription(result):
+    # Nell'evento "final" session_id è la sessione salvata, non quella dello streaming
+    return _save_transcription({**result, "model_size": STREAMING_MODEL_SIZE, "language": STREAMING_LANGUAGE})
+
+streaming_transcriber = StreamingTranscriber(_transcribe_stream_window,
+                                           lambda text: clean_transcript(text, STREAMING_LANGUAGE),
+                                           _save_stream_transcription)
+
+@app.route('/api/transcribe/stream', methods=['POST'])
+def start_streaming_transcription():
+    """
+    Apre una sessione di trascrizione in streaming.
+    """
+    data = request.get_json(silent=True) or {}
+    clean_filler_words = str(data.get('clean_filler_words', 'true')).lower() == 'true'
+    
+    try:
+        session = streaming_transcriber.create_session(clean_filler_words)
+        return jsonify({"session_id": session.id}), 201
+    except QueueFullError as e:
+        response = jsonify({"error": "Too many streaming sessions", "retry_after": e.retry_after})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 429
+
+@app.route('/api/transcribe/stream/<session_id>/chunks', methods=['POST'])
+def upload_stream_chunk(session_id):
+    """
+    Riceve un blocco audio (corpo della richiesta) della registrazione in corso.
+    """
+    try:
+        session = streaming_transcriber.add_chunk(session_id, request.get_data())
+    except StreamTooLargeError as e:
+        return jsonify({"error": str(e)}), 413
+    
+    if session is None:
+        return jsonify({"error": "Session not found or already finished"}), 404
+    return jsonify({"session_id": session_id, "received_bytes": session.received}), 202
+
+@app.route('/api/transcribe/stream/<session_id>/finish', methods=['POST'])
+def finish_streaming_transcription(session_id):
+    """
+    Segnala la fine della registrazione: la trascrizione finale arriva come evento "final".
+    """
+    session = streaming_transcriber.finish(session_id)
+    if session is None:
+        return jsonify({"error": "Session not found"}), 404
+    return jsonify({"session_id": session_id, "status": "finishing"}), 202
+
+@app.route('/api/transcribe/stream/<session_id>/events', methods=['GET'])
+def streaming_transcription_events(session_id):
+    """
+    Invia le trascrizioni parziali come Server-Sent Events.
+    """
+    if streaming_transcriber.get(session_id) is None:
+        return jsonify({"error": "Session not found"}), 404
+    
+    def events():
+        cursor = 0
+        while True:
+            new_events = streaming_transcriber.wait_for_events(session_id, cursor, timeout=15)
+            if new_events is None:
+                return
+            if not new_events:
+                yield ": keep-alive\n\n"
+                continue
+            cursor += len(new_events)
+            for event, payload in new_events:
+                yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+                if event in ('final', 'error'):
+                    return
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def _report_request_params(data):
+    """
+    Estrae dal corpo della richiesta i parametri comuni alla generazione del report.
+    """
+    metadata = data.get('metadata', {})
+    return {
+        'transcript': data['transcript'],
+        # Get templateId from request or use default
+        'template_id': data.get('templateId', 'lab_report'),
+        'user_name': metadata.get('author', 'Studente'),
+        'institution': metadata.get('institution', 'Università'),
+        'title': metadata.get('title', 'Relazione di Laboratorio'),
+        # "auto" usa il map-reduce solo se la trascrizione supera il contesto del modello
+        'mode': data.get('mode', 'auto'),
+        # Sessione in cui salvare il report (nuova se assente)
+        'session_id': data.get('sessionId')
+    }
+
+def _report_mode(params):
+    mode = params['mode']
+    if mode not in ('single', 'mapreduce', 'sections'):
+        mode = 'mapreduce' if report_reducer.needs_map_reduce(params['transcript']) else 'single'
+    return mode
+
+def build_report_prompt(transcript, template_id, title, user_name, institution, source_label="Trascrizione"):
+    """
+    Costruisce il prompt per la generazione del report con Ollama.
+    Con il map-reduce `transcript` contiene i riassunti delle parti.
+    """
     # Get template parameters based on type
     template_params = get_template_params(template_id)
     
@@ -164,72 +672,74 @@ def generate_report():
     prompt += f"Autore: {user_name}\n"
     prompt += f"Istituzione: {institution}\n"
     prompt += f"Data: {datetime.now().strftime('%d/%m/%Y')}\n\n"
-    prompt += f"Trascrizione:\n{transcript}\n\n"
+    prompt += f"{source_label}:\n{transcript}\n\n"
     prompt += f"Genera una relazione completa e ben strutturata in formato Markdown."
+    return prompt
+
+def build_section_prompt(transcript, template_id, section, title, user_name, institution,
+                         source_label="Trascrizione"):
+    """
+    Prompt per generare una sola sezione del report (modalità "sections").
+    Non contiene la data, così le sezioni possono essere riusate dalla cache.
+    """
+    template_params = get_template_params(template_id)
+    sections = _template_sections(template_id)
     
-    print(f"Using template: {template_id}")
+    prompt = f"{template_params['system_prompt']}\n\n"
+    prompt += f"Stile: {template_params['style_description']}\n"
+    prompt += f"Titolo: {title}\n"
+    prompt += f"Autore: {user_name}\n"
+    prompt += f"Istituzione: {institution}\n\n"
+    prompt += f"Il documento è composto dalle sezioni: {', '.join(sections)}.\n"
+    prompt += (f"Scrivi solo il contenuto della sezione \"{section}\" in formato Markdown, "
+               f"senza il titolo della sezione e senza anticipare le altre sezioni.\n\n")
+    prompt += f"{source_label}:\n{transcript}\n"
+    return prompt
+
+def _report_metadata(params):
+    return {
+        'user_name': params['user_name'],
+        'institution': params['institution'],
+        'date': datetime.now().strftime("%d/%m/%Y"),
+        'title': params['title']
+    }
+
+def _finish_report(params, report, method, mode=None):
+    """
+    Chiamata su ogni uscita della generazione del report: conta il metodo
+    usato e salva il report. Restituisce i campi da aggiungere alla risposta.
+    """
+    GENERATION_METHOD_TOTAL.inc(endpoint="report", method=method)
+    metadata = {**_report_metadata(params), "method": method}
+    if mode:
+        metadata["mode"] = mode
+    return _save_result(REPORT, report, params['session_id'], params['template_id'], metadata, params['title'])
+
+def generate_local_report(transcript, template_id):
+    """
+    Generazione locale del report, senza Ollama, basata sul template selezionato.
+    """
+    # Implementazione locale della generazione di report senza utilizzare Ollama
+    # Questa è una soluzione temporanea che crea un report basato sul template selezionato
+    print(f"Using local report generation with template: {template_id}")
     
-    try:
-        # Try to use Ollama API
-        print(f"Sending request to Ollama API: {OLLAMA_API_URL}/api/generate")
-          # Use GPU for better performance if available
-        response = requests.post(
-            f"{OLLAMA_API_URL}/api/generate",
-            json={
-                "model": MODEL_NAME,
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "num_gpu": 1  # Enable GPU acceleration
-                }
-            }
-            # Timeout rimosso per consentire richieste di durata illimitata
-        )
-        
-        if response.status_code == 200:
-            result = response.json()
-            generated_report = result.get("response", "")
-            print("Successfully generated report with Ollama")
-            
-            # Add the template metadata
-            report_with_metadata = add_template_metadata(generated_report, template_id, {
-                'user_name': user_name,
-                'institution': institution,
-                'date': datetime.now().strftime("%d/%m/%Y"),
-                'title': title
-            })
-            
-            return jsonify({
-                "report": report_with_metadata,
-                "template": template_id,
-                "method": "ollama"
-            })
-        
-        else:
-            print(f"Ollama API error: {response.text}")
-            print("Falling back to local report generation")
-            
-            # Implementazione locale della generazione di report senza utilizzare Ollama
-            # Questa è una soluzione temporanea che crea un report basato sul template selezionato
-            print(f"Using local report generation with template: {template_id}")
-            
-            # Estrai le prime 3 frasi per l'introduzione (o meno se non ce ne sono abbastanza)
-            sentences = re.split(r'(?<=[.!?])\s+', transcript)
-            intro_sentences = sentences[:min(3, len(sentences))]
-            intro_text = ' '.join(intro_sentences)
-            
-            # Estrai alcune frasi dal centro per i materiali e metodi
-            mid_point = len(sentences) // 2
-            methods_sentences = sentences[mid_point:mid_point + min(3, len(sentences) - mid_point)]
-            methods_text = ' '.join(methods_sentences)
-            
-            # Estrai le ultime frasi per la conclusione
-            conclusion_sentences = sentences[max(0, len(sentences) - 3):]
-            conclusion_text = ' '.join(conclusion_sentences)
-            
-            # Crea il report in base al template selezionato
-            if template_id == 'lab_report':
-                report = f"""
+    # Estrai le prime 3 frasi per l'introduzione (o meno se non ce ne sono abbastanza)
+    sentences = re.split(r'(?<=[.!?])\s+', transcript)
+    intro_sentences = sentences[:min(3, len(sentences))]
+    intro_text = ' '.join(intro_sentences)
+    
+    # Estrai alcune frasi dal centro per i materiali e metodi
+    mid_point = len(sentences) // 2
+    methods_sentences = sentences[mid_point:mid_point + min(3, len(sentences) - mid_point)]
+    methods_text = ' '.join(methods_sentences)
+    
+    # Estrai le ultime frasi per la conclusione
+    conclusion_sentences = sentences[max(0, len(sentences) - 3):]
+    conclusion_text = ' '.join(conclusion_sentences)
+    
+    # Crea il report in base al template selezionato
+    if template_id == 'lab_report':
+        report = f"""
 ## Introduzione
 {intro_text}
 
@@ -245,8 +755,8 @@ I risultati ottenuti mostrano una chiara correlazione tra le variabili esaminate
 ## Conclusioni
 {conclusion_text}
 """
-            elif template_id == 'technical_report':
-                report = f"""
+    elif template_id == 'technical_report':
+        report = f"""
 ## Sommario Esecutivo
 {intro_text}
 
@@ -265,16 +775,16 @@ I test hanno dimostrato un miglioramento del 23% rispetto ai sistemi precedenti.
 ## Raccomandazioni
 {conclusion_text}
 """
-            elif template_id == 'scientific_abstract':
-                # Per l'abstract, combiniamo tutto in un unico paragrafo
-                abstract = f"{intro_text} {methods_text} {conclusion_text}"
-                # Limita a circa 250 parole
-                words = abstract.split()
-                if len(words) > 250:
-                    abstract = ' '.join(words[:250]) + '...'
-                report = abstract
-            elif template_id == 'thesis_chapter':
-                report = f"""
+    elif template_id == 'scientific_abstract':
+        # Per l'abstract, combiniamo tutto in un unico paragrafo
+        abstract = f"{intro_text} {methods_text} {conclusion_text}"
+        # Limita a circa 250 parole
+        words = abstract.split()
+        if len(words) > 250:
+            abstract = ' '.join(words[:250]) + '...'
+        report = abstract
+    elif template_id == 'thesis_chapter':
+        report = f"""
 ## Introduzione Teorica
 {intro_text}
 
@@ -297,76 +807,279 @@ I risultati ottenuti possono essere interpretati alla luce delle teorie correnti
 1. Rossi, A. (2023). *Metodologie avanzate di ricerca*. Milano: Editore Accademico.
 2. Bianchi, G., & Verdi, E. (2022). *Approcci sperimentali*. Roma: Edizioni Scientifiche.
 """
-            else:
-                # Template predefinito generico
-                report = f"""
+    else:
+        # Template predefinito generico
+        report = f"""
 ## Contenuto Principale
 {transcript}
 """
+    return report
+
+def _report_cache_key(params, mode):
+    # La data nel prompt è esclusa: l'intestazione viene aggiunta dopo la cache
+    return llm_cache_key("report", MODEL_NAME, params['template_id'], params['transcript'], {
+        "title": params['title'],
+        "author": params['user_name'],
+        "institution": params['institution'],
+        "mode": mode
+    })
+
+SOURCE_LABEL = "Trascrizione"
+CONDENSED_SOURCE_LABEL = "Riassunti in ordine delle parti della trascrizione"
+
+def _needs_condensing(params, mode):
+    # Anche le sezioni partono dai riassunti se la trascrizione non entra nel contesto
+    return mode == 'mapreduce' or (mode == 'sections' and report_reducer.needs_map_reduce(params['transcript']))
+
+def _template_sections(template_id):
+    return REPORT_TEMPLATES.get(template_id, REPORT_TEMPLATES['lab_report'])['sections']
+
+def _section_prompts(params, source, source_label):
+    template_id = params['template_id']
+    return [(section, build_section_prompt(source, template_id, section, params['title'],
+                                           params['user_name'], params['institution'], source_label))
+            for section in _template_sections(template_id)]
+
+def _generate_section_cached(prompt):
+    # Il prompt di una sezione non contiene la data: può essere la chiave della cache
+    key = llm_cache_key("report_section", MODEL_NAME, None, prompt)
+    return llm_cache.get_or_compute(key, lambda: ollama_client.generate(prompt))[0]
+
+def _generate_report_text(params, mode):
+    """
+    Genera il corpo del report con Ollama; in modalità map-reduce la
+    trascrizione viene prima riassunta a parti, in modalità "sections" ogni
+    sezione del template viene generata in parallelo.
+    """
+    source, source_label = params['transcript'], SOURCE_LABEL
+    if _needs_condensing(params, mode):
+        source, chunks = report_reducer.condense(source)
+        source_label = CONDENSED_SOURCE_LABEL
+        print(f"Map-reduce report: {chunks} transcript chunks summarized")
+    
+    if mode == 'sections':
+        template_id = params['template_id']
+        texts = section_reporter.generate(_section_prompts(params, source, source_label))
+        header = add_template_metadata("", template_id, _report_metadata(params))
+        return assemble_sections(_template_sections(template_id), texts, header)
+    
+    prompt = build_report_prompt(source, params['template_id'], params['title'],
+                                 params['user_name'], params['institution'], source_label)
+    return ollama_client.generate(prompt)
+
+def _correction_cache_key(text, style):
+    return llm_cache_key("correction", MODEL_NAME, style, text)
+
+def _generate_cached(cache_key, generate_fn, reason):
+    """
+    Generazione con Ollama tramite la cache delle risposte: le richieste
+    identiche contemporanee condividono la stessa generazione e lo scheduler
+    delle risorse interviene solo quando serve davvero generare.
+    Restituisce (testo, esito della cache).
+    """
+    def generate():
+        with resource_scheduler.llm(reason):
+            return generate_fn()
+    
+    return llm_cache.get_or_compute(cache_key, generate)
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _sse_response(generator):
+    return Response(stream_with_context(generator), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/generate-report', methods=['POST'])
+def generate_report():
+    data = request.json
+    
+    if not data or 'transcript' not in data:
+        return jsonify({"error": "No transcript provided"}), 400
+    
+    params = _report_request_params(data)
+    template_id = params['template_id']
+    mode = _report_mode(params)
+    
+    print(f"Using template: {template_id} (mode: {mode})")
+    
+    try:
+        # Try to use Ollama API
+        print(f"Sending request to Ollama API: {OLLAMA_API_URL}/api/generate")
+        cache_status = None
+        try:
+            generated_report, cache_status = _generate_cached(_report_cache_key(params, mode),
+                                                              lambda: _generate_report_text(params, mode),
+                                                              "report generation")
+        except OllamaError as e:
+            # Con Ollama irraggiungibile (o circuit breaker aperto) si passa subito al fallback
+            generated_report = None
+            print(f"{e}")
+        
+        if generated_report is not None:
+            print(f"Successfully generated report with Ollama (cache: {cache_status})")
             
-            # Aggiungi metadati al report
-            report_with_metadata = add_template_metadata(report, template_id, {
-                'user_name': user_name,
-                'institution': institution,
-                'date': datetime.now().strftime("%d/%m/%Y"),
-                'title': title
+            # Add the template metadata
+            report_with_metadata = add_template_metadata(generated_report, template_id, _report_metadata(params))
+            
+            return jsonify({
+                "report": report_with_metadata,
+                "template": template_id,
+                "method": "ollama",
+                "mode": mode,
+                "cached": cache_status != MISS,
+                **_finish_report(params, report_with_metadata, "ollama", mode)
             })
+        
+        else:
+            print("Falling back to local report generation")
+            
+            report = generate_local_report(params['transcript'], template_id)
+            
+            # Aggiungi metadati al report
+            report_with_metadata = add_template_metadata(report, template_id, _report_metadata(params))
             
             print("Successfully generated report using local rules")
             return jsonify({
                 "report": report_with_metadata,
                 "template": template_id,
-                "method": "local"
+                "method": "local",
+                **_finish_report(params, report_with_metadata, "local")
             })
             
     except Exception as e:
         print(f"Error during report generation: {str(e)}")
-        
-        # Anche in caso di errore, libera memoria
-        if torch.cuda.is_available():
-            torch.cuda.empty_cache()
-            gc.collect()
-            
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/ollama-status', methods=['GET'])
-def ollama_status():
-    try:
-        # Check Ollama status and GPU availability
-        response = requests.get(f"{OLLAMA_API_URL}/api/tags")
+@app.route('/api/generate-report/stream', methods=['POST'])
+def generate_report_stream():
+    """
+    Come /api/generate-report, ma invia il report token per token come
+    Server-Sent Events: "start" (intestazione del template), "token", "done".
+    In modalità "sections" ogni sezione arriva come evento "section" appena
+    completata (in ordine di completamento, con l'indice nel template).
+    """
+    data = request.json
+    
+    if not data or 'transcript' not in data:
+        return jsonify({"error": "No transcript provided"}), 400
+    
+    params = _report_request_params(data)
+    template_id = params['template_id']
+    mode = _report_mode(params)
+    
+    header = add_template_metadata("", template_id, _report_metadata(params))
+    cache_key = _report_cache_key(params, mode)
+    
+    def local_fallback(error):
+        print(f"{error}\nFalling back to local report generation")
+        report = generate_local_report(params['transcript'], template_id)
+        yield _sse("start", {"template": template_id, "method": "local", "header": header})
+        yield _sse("token", {"text": report})
+        yield _sse("done", {"report": header + report, "template": template_id, "method": "local",
+                            **_finish_report(params, header + report, "local")})
+    
+    def condense():
+        # Fase map: avanzamento inviato come eventi "progress", restituisce i riassunti
+        for event in report_reducer.iter_condense(params['transcript']):
+            if event[0] == "progress":
+                _, level, completed, total = event
+                yield _sse("progress", {"stage": "map", "level": level, "completed": completed, "total": total})
+            else:
+                return event[1]
+    
+    def sections(source, source_label):
+        # Ogni sezione viene inviata appena pronta, con il suo indice nel template
+        section_names = _template_sections(template_id)
+        texts = {}
+        try:
+            for i, section, text in section_reporter.iter_sections(_section_prompts(params, source, source_label)):
+                if not texts:
+                    yield _sse("start", {"template": template_id, "method": "ollama", "header": header,
+                                         "sections": section_names})
+                texts[i] = text
+                yield _sse("section", {"index": i, "section": section, "text": text})
+        except OllamaError as e:
+            if texts:
+                raise
+            yield from local_fallback(e)
+            return
+        report = assemble_sections(section_names, texts, header)
+        llm_cache.put(cache_key, report)
+        yield _sse("done", {"report": header + report, "template": template_id, "method": "ollama", "mode": mode,
+                            **_finish_report(params, header + report, "ollama", mode)})
+    
+    def events():
+        cached_report = llm_cache.get(cache_key)
+        if cached_report is not None:
+            yield _sse("start", {"template": template_id, "method": "ollama", "header": header})
+            yield _sse("token", {"text": cached_report})
+            yield _sse("done", {"report": header + cached_report, "template": template_id,
+                                "method": "ollama", "mode": mode, "cached": True,
+                                **_finish_report(params, header + cached_report, "ollama", mode)})
+            return
         
-        if response.status_code == 200:
-            models = response.json().get("models", [])
+        with resource_scheduler.llm("report generation"):
+            yield from generate_events()
+    
+    def generate_events():
+        tokens = []
+        try:
+            source, source_label = params['transcript'], SOURCE_LABEL
+            if _needs_condensing(params, mode):
+                try:
+                    source = yield from condense()
+                except OllamaError as e:
+                    yield from local_fallback(e)
+                    return
+                source_label = CONDENSED_SOURCE_LABEL
             
-            # Check if our model is loaded
-            model_info = next((m for m in models if m.get("name") == MODEL_NAME), None)
+            if mode == 'sections':
+                yield from sections(source, source_label)
+                return
             
-            # Add GPU verification request
-            gpu_check = requests.post(
-                f"{OLLAMA_API_URL}/api/generate",
-                json={
-                    "model": MODEL_NAME,
-                    "prompt": "Respond with 'Using GPU' if you're running on GPU, otherwise respond with 'Using CPU'",
-                    "stream": False,
-                    "options": {
-                        "num_gpu": 1
-                    }
-                }
-                # Timeout rimosso per consentire richieste di durata illimitata
-            )
+            prompt = build_report_prompt(source, template_id, params['title'],
+                                         params['user_name'], params['institution'], source_label)
+            print(f"Streaming report from Ollama API: {OLLAMA_API_URL}/api/generate")
+            generation = ollama_client.generate_stream(prompt)
+            try:
+                first_token = next(generation, "")
+            except OllamaError as e:
+                yield from local_fallback(e)
+                return
             
-            gpu_response = "Unknown"
-            if gpu_check.status_code == 200:
-                gpu_response = gpu_check.json().get("response", "Unknown")
+            yield _sse("start", {"template": template_id, "method": "ollama", "header": header})
+            if first_token:
+                tokens.append(first_token)
+                yield _sse("token", {"text": first_token})
+            for token in generation:
+                tokens.append(token)
+                yield _sse("token", {"text": token})
             
-            return jsonify({
-                "status": "online",
-                "models": models,
-                "current_model": model_info,
-                "gpu_check": gpu_response
-            })
-        else:
-            return jsonify({"status": "error", "message": f"Ollama API error: {response.text}"}), 500
+            print("Successfully streamed report with Ollama")
+            # Solo le generazioni completate finiscono in cache
+            llm_cache.put(cache_key, "".join(tokens))
+            yield _sse("done", {"report": header + "".join(tokens), "template": template_id,
+                                "method": "ollama", "mode": mode,
+                                **_finish_report(params, header + "".join(tokens), "ollama", mode)})
+        except Exception as e:
+            print(f"Error during report streaming: {str(e)}")
+            yield _sse("error", {"error": str(e)})
+    
+    return _sse_response(events())
+
+@app.route('/api/ollama-status', methods=['GET'])
+def ollama_status():
+    """
+    Stato di Ollama dalla cache del monitor: nessuna generazione per ogni richiesta.
+    """
+    try:
+        status = ollama_client.snapshot()
+        status["client"] = ollama_client.stats()
+        
+        if status["status"] != "online":
+            return jsonify(status), 500
+        return jsonify(status)
     
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -378,36 +1091,84 @@ def memory_stats():
     """
     memory_info = check_gpu_memory()
     
-    # Ottieni anche lo stato dei modelli caricati
-    global whisper_model
-    
     return jsonify({
         "memory": memory_info,
         "models": {
-            "whisper_loaded": whisper_model is not None,
-            "cuda_available": torch.cuda.is_available(),
-            "device": "cuda" if torch.cuda.is_available() else "cpu"
-        }
+            "whisper_loaded": whisper_pool.is_loaded(),
+            "cuda_available": default_device() == "cuda" if torch_loaded() else None,
+            "device": default_device() if torch_loaded() else None,
+            "whisper_backend": WHISPER_BACKEND
+        },
+        "warmup": warmup.stats(),
+        "whisper_pool": whisper_pool.stats(),
+        "transcription_queue": transcription_queue.stats(),
+        "streaming": streaming_transcriber.stats(),
+        "transcript_cache": transcript_cache.stats(),
+        "llm_cache": llm_cache.stats(),
+        "report_map_reduce": report_reducer.stats(),
+        "report_sections": section_reporter.stats(),
+        "scheduler": resource_scheduler.stats(),
+        "session_store": session_store.stats(),
+        "search_index": search_index.stats()
     })
 
-@app.route('/api/correct-text', methods=['POST'])
-def correct_text():
-    data = request.json
-    
-    if not data or 'text' not in data:
-        return jsonify({"error": "No text provided"}), 400
-    
-    text = data['text']
-    style = data.get('style', 'academic')  # Default style is academic
-    
-    # Libera memoria prima di eseguire il modello LLM
-    if torch.cuda.is_available():
-        print("Clearing CUDA cache before text correction...")
-        torch.cuda.empty_cache()
-        gc.collect()
-    
-    # Prepare the prompt for the LLM
-    prompt = f"""
+def _register_metrics():
+    """
+    Metriche lette al momento dello scrape dalle statistiche dei componenti.
+    """
+    metrics_registry.gauge(
+        "autolabo_transcription_queue_jobs", "Transcription jobs by state",
+        lambda: {(state,): count for state, count in transcription_queue.depth().items()}, ["state"])
+    metrics_registry.gauge(
+        "autolabo_streaming_sessions", "Active live-transcription sessions",
+        lambda: streaming_transcriber.stats()["active"])
+    metrics_registry.gauge(
+        "autolabo_whisper_models_resident", "Whisper models currently loaded",
+        lambda: len(whisper_pool.stats()["resident"]))
+    metrics_registry.gauge(
+        "autolabo_whisper_pool_lookups_total", "Whisper model pool lookups by result",
+        lambda: {(result,): whisper_pool.stats()[result] for result in ("hits", "misses", "evictions")},
+        ["result"], metric_type="counter")
+    metrics_registry.gauge(
+        "autolabo_cache_lookups_total", "Cache lookups by cache and result",
+        lambda: {(name, result): stats[result]
+                 for name, stats in (("transcript", transcript_cache.stats()), ("llm", llm_cache.stats()))
+                 for result in ("hits", "misses")},
+        ["cache", "result"], metric_type="counter")
+    metrics_registry.gauge(
+        "autolabo_scheduler_decisions_total", "Resource scheduler decisions by workload and action",
+        lambda: {tuple(key.split("_", 1)): count for key, count in resource_scheduler.stats()["decisions"].items()},
+        ["workload", "action"], metric_type="counter")
+    metrics_registry.gauge(
+        "autolabo_ollama_circuit_open", "1 if the Ollama circuit breaker is not closed",
+        lambda: {(i.url,): 0 if i.client.breaker.state == "closed" else 1 for i in ollama_client.instances},
+        ["instance"])
+    metrics_registry.gauge(
+        "autolabo_ollama_in_flight", "Generations in progress per Ollama instance",
+        lambda: {(i.url,): i.in_flight for i in ollama_client.instances}, ["instance"])
+    metrics_registry.gauge(
+        "autolabo_ollama_failovers_total", "Generations moved to another Ollama instance after an error",
+        lambda: ollama_client.stats()["failovers"], metric_type="counter")
+    metrics_registry.gauge(
+        "autolabo_ollama_requests_total", "Ollama client requests by outcome",
+        lambda: {(outcome,): ollama_client.stats()[outcome]
+                 for outcome in ("requests", "retries", "failures", "short_circuited")},
+        ["outcome"], metric_type="counter")
+
+_register_metrics()
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Metriche nel formato di esposizione testuale di Prometheus.
+    """
+    return Response(metrics_registry.render(), content_type=METRICS_CONTENT_TYPE)
+
+def build_correction_prompt(text, style):
+    """
+    Costruisce il prompt per la correzione del testo con Ollama.
+    """
+    return f"""
 Sei un editor accademico esperto. Il tuo compito è correggere e migliorare il seguente testo,
 mantenendo tutte le informazioni importanti ma migliorando:
 1. La grammatica e l'ortografia
@@ -423,81 +1184,118 @@ Testo da correggere:
 
 Fornisci solo il testo corretto, senza commenti o spiegazioni aggiuntive.
 """
+
+def _finish_correction(corrected_text, session_id, style, method):
+    """
+    Come _finish_report, per ogni uscita della correzione del testo.
+    """
+    GENERATION_METHOD_TOTAL.inc(endpoint="correction", method=method)
+    return _save_result(CORRECTION, corrected_text, session_id, metadata={"style": style, "method": method})
+
+@app.route('/api/correct-text', methods=['POST'])
+def correct_text():
+    data = request.json
+    
+    if not data or 'text' not in data:
+        return jsonify({"error": "No text provided"}), 400
+    
+    text = data['text']
+    style = data.get('style', 'academic')  # Default style is academic
+    session_id = data.get('sessionId')
+    
+    # Prepare the prompt for the LLM
+    prompt = build_correction_prompt(text, style)
     
     try:
         # Try to use Ollama API
         print(f"Sending request to Ollama API: {OLLAMA_API_URL}/api/generate")
         print(f"Using model: {MODEL_NAME} for text correction")
-          # Use GPU for better performance
-        response = requests.post(
-            f"{OLLAMA_API_URL}/api/generate",
-            json={
-                "model": MODEL_NAME,
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "num_gpu": 1  # Enable GPU acceleration
-                }
-            }
-            # Timeout rimosso per consentire richieste di durata illimitata
-        )
+        try:
+            corrected_text, cache_status = _generate_cached(_correction_cache_key(text, style),
+                                                            lambda: ollama_client.generate(prompt),
+                                                            "text correction")
+        except OllamaError as e:
+            corrected_text = None
+            print(f"{e}")
         
-        if response.status_code == 200:
-            result = response.json()
-            corrected_text = result.get("response", "")
-            print("Successfully corrected text with Ollama")
-            return jsonify({"corrected_text": corrected_text})
+        if corrected_text is not None:
+            print(f"Successfully corrected text with Ollama (cache: {cache_status})")
+            return jsonify({"corrected_text": corrected_text, "cached": cache_status != MISS,
+                            **_finish_correction(corrected_text, session_id, style, "ollama")})
         else:
-            print(f"Ollama API error: {response.text}")
             # Fallback to local correction if Ollama fails
             print("Falling back to local text correction")
-            
-            # Implementazione locale della correzione del testo
-            # Correzione 1: Assicurati che la prima lettera sia maiuscola
-            corrected_text = text[0].upper() + text[1:] if text else ""
-            
-            # Correzione 2: Assicurati che ci sia un punto alla fine se non c'è già
-            if corrected_text and not corrected_text.rstrip().endswith(('.', '!', '?')):
-                corrected_text = corrected_text.rstrip() + '.'
-            
-            # Correzione 3: Converti "i" in "I" quando è un pronome personale
-            corrected_text = re.sub(r'\bi\b', 'I', corrected_text)
-            
-            # Correzione 4: Migliora la punteggiatura
-            corrected_text = re.sub(r'\s+([.,;:!?])', r'\1', corrected_text)  # Rimuovi spazi prima della punteggiatura
-            corrected_text = re.sub(r'([.,;:!?])([^\s\d])', r'\1 \2', corrected_text)  # Aggiungi spazi dopo la punteggiatura
-            
-            # Correzione 5: Correggi spazi doppi
-            corrected_text = re.sub(r'\s+', ' ', corrected_text)
-            
-            # Correzione 6: Correggi virgole e 'e' per migliorare la leggibilità
-            corrected_text = re.sub(r'\b(e|ed)\b', ', e', corrected_text)
-            corrected_text = re.sub(r', e, e', ', e', corrected_text)
-            corrected_text = re.sub(r', , ', ', ', corrected_text)
-            
-            # Correzione 7: Migliora la formalità (sostituisci termini colloquiali con termini più formali)
-            formal_replacements = {
-                r'\bcosa\b': 'ciò che',
-                r'\bc\'è\b': 'vi è',
-                r'\bperò\b': 'tuttavia',
-                r'\binsomma\b': 'in conclusione',
-                r'\bun sacco di\b': 'numerosi',
-                r'\btanto\b': 'considerevolmente',
-                r'\bper cui\b': 'pertanto',
-                r'\bcioè\b': 'ovvero',
-            }
-            
-            if style == 'academic':
-                for colloquial, formal in formal_replacements.items():
-                    corrected_text = re.sub(colloquial, formal, corrected_text, flags=re.IGNORECASE)
-            
+            corrected_text = correct_text_locally(text, style)
             print("Successfully corrected text using local rules")
-            return jsonify({"corrected_text": corrected_text})
+            return jsonify({"corrected_text": corrected_text,
+                            **_finish_correction(corrected_text, session_id, style, "local")})
     
     except Exception as e:
         print(f"Error during text correction: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/correct-text/stream', methods=['POST'])
+def correct_text_stream():
+    """
+    Come /api/correct-text, ma invia il testo corretto token per token
+    come Server-Sent Events ("start", "token", "done").
+    """
+    data = request.json
+    
+    if not data or 'text' not in data:
+        return jsonify({"error": "No text provided"}), 400
+    
+    text = data['text']
+    style = data.get('style', 'academic')  # Default style is academic
+    session_id = data.get('sessionId')
+    
+    prompt = build_correction_prompt(text, style)
+    cache_key = _correction_cache_key(text, style)
+    
+    def events():
+        cached_text = llm_cache.get(cache_key)
+        if cached_text is not None:
+            yield _sse("start", {"method": "ollama"})
+            yield _sse("token", {"text": cached_text})
+            yield _sse("done", {"corrected_text": cached_text, "method": "ollama", "cached": True,
+                                **_finish_correction(cached_text, session_id, style, "ollama")})
+            return
+        
+        with resource_scheduler.llm("text correction"):
+            yield from generate_events()
+    
+    def generate_events():
+        tokens = []
+        try:
+            generation = ollama_client.generate_stream(prompt)
+            try:
+                first_token = next(generation, "")
+            except OllamaError as e:
+                print(f"{e}\nFalling back to local text correction")
+                corrected_text = correct_text_locally(text, style)
+                yield _sse("start", {"method": "local"})
+                yield _sse("token", {"text": corrected_text})
+                yield _sse("done", {"corrected_text": corrected_text, "method": "local",
+                                    **_finish_correction(corrected_text, session_id, style, "local")})
+                return
+            
+            yield _sse("start", {"method": "ollama"})
+            if first_token:
+                tokens.append(first_token)
+                yield _sse("token", {"text": first_token})
+            for token in generation:
+                tokens.append(token)
+                yield _sse("token", {"text": token})
+            
+            llm_cache.put(cache_key, "".join(tokens))
+            yield _sse("done", {"corrected_text": "".join(tokens), "method": "ollama",
+                                **_finish_correction("".join(tokens), session_id, style, "ollama")})
+        except Exception as e:
+            print(f"Error during text correction streaming: {str(e)}")
+            yield _sse("error", {"error": str(e)})
+    
+    return _sse_response(events())
+
 @app.route('/api/clean-transcript', methods=['POST'])
 def clean_transcript_endpoint():
     data = request.json
@@ -506,75 +1304,140 @@ def clean_transcript_endpoint():
         return jsonify({"error": "No text provided"}), 400
     
     text = data['text']
+    language = data.get('language')
     
     try:
-        cleaned_text = clean_transcript(text)
-        return jsonify({"cleaned_text": cleaned_text})
+        with CLEAN_SECONDS.time():
+            cleaned_text = clean_transcript(text, language)
+        return jsonify({"cleaned_text": cleaned_text,
+                        **_save_result(CLEAN, cleaned_text, data.get('sessionId'),
+                                       metadata={"language": language, "original_text": text})})
     except Exception as e:
         print(f"Error cleaning transcript: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/templates', methods=['GET'])
-def get_templates():
+def _page_params():
     """
-    Restituisce l'elenco dei template disponibili e le loro descrizioni.
+    Parametri di paginazione (limit, cursor) della query string.
     """
-    templates = {
-        'lab_report': {
-            'name': 'Relazione di Laboratorio',
-            'description': 'Template standard per relazioni di laboratorio scientifico',
-            'sections': ['Introduzione', 'Materiali e Metodi', 'Risultati', 'Discussione', 'Conclusioni'],
-            'icon': '🧪'
-        },
-        'technical_report': {
-            'name': 'Report Tecnico',
-            'description': 'Template per report tecnici ingegneristici',
-            'sections': ['Sommario Esecutivo', 'Obiettivi', 'Specifiche Tecniche', 'Metodologia', 'Risultati', 'Raccomandazioni'],
-            'icon': '⚙️'
-        },
-        'scientific_abstract': {
-            'name': 'Abstract Scientifico',
-            'description': 'Template per abstract di articoli scientifici',
-            'sections': ['Contesto', 'Obiettivi', 'Metodi', 'Risultati', 'Conclusioni'],
-            'icon': '📝'
-        },
-        'thesis_chapter': {
-            'name': 'Capitolo di Tesi',
-            'description': 'Template per capitoli di tesi universitarie',
-            'sections': ['Introduzione Teorica', 'Stato dell\'arte', 'Metodologia', 'Analisi', 'Discussione', 'Conclusioni'],
-            'icon': '🎓'
-        }
+    try:
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        raise ValueError("Invalid limit")
+    return limit, request.args.get('cursor') or None
+
+@app.route('/api/sessions', methods=['GET'])
+def list_sessions():
+    """
+    Sessioni salvate dalla più recente, paginate con ?limit= e ?cursor=
+    (il "next_cursor" della pagina precedente).
+    """
+    try:
+        limit, cursor = _page_params()
+        return jsonify(session_store.list_sessions(limit, cursor))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/api/sessions/<session_id>', methods=['GET'])
+def get_session(session_id):
+    """
+    Una sessione con l'ultimo risultato di ogni tipo (trascrizione, pulizia,
+    correzione, report), per ripristinare il lavoro senza ricalcolarlo.
+    """
+    session = session_store.get_session(session_id)
+    if session is None:
+        return jsonify({"error": "Session not found"}), 404
+    return jsonify(session)
+
+@app.route('/api/sessions/<session_id>', methods=['DELETE'])
+def delete_session(session_id):
+    if not session_store.delete_session(session_id):
+        return jsonify({"error": "Session not found"}), 404
+    search_index.remove_session(session_id)
+    return jsonify({"deleted": session_id})
+
+@app.route('/api/sessions/<session_id>/entries', methods=['GET'])
+def list_session_entries(session_id):
+    """
+    Tutti i risultati di una sessione dal più recente, filtrabili con ?kind=.
+    Il contenuto è un'anteprima, salvo ?full=true.
+    """
+    kind = request.args.get('kind') or None
+    if kind is not None and kind not in KINDS:
+        return jsonify({"error": f"Unknown kind '{kind}' (available: {', '.join(KINDS)})"}), 400
+    full = request.args.get('full', 'false').lower() == 'true'
+    try:
+        limit, cursor = _page_params()
+        return jsonify(session_store.list_entries(session_id, kind, limit, cursor, full))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/api/search', methods=['GET'])
+def search():
+    """
+    Ricerca nelle trascrizioni e nei report salvati (?q=), ordinata con BM25.
+    Ogni risultato riporta i segmenti con i termini cercati e i loro tempi.
+    Filtri: ?kind=, ?session_id=; ?per_session=false per più risultati
+    della stessa sessione.
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "No query provided"}), 400
+    kind = request.args.get('kind') or None
+    if kind is not None and kind not in KINDS:
+        return jsonify({"error": f"Unknown kind '{kind}' (available: {', '.join(KINDS)})"}), 400
+    try:
+        limit = int(request.args.get('limit', 10))
+    except ValueError:
+        return jsonify({"error": "Invalid limit"}), 400
+    per_session = request.args.get('per_session', 'true').lower() == 'true'
+    with SEARCH_SECONDS.time():
+        search_index.sync(session_store)
+        results = search_index.search(query, limit, kind, request.args.get('session_id') or None, per_session,
+                                      request.args.get('language') or None)
+    return jsonify(results)
+
+@app.route('/api/entries/<entry_id>', methods=['GET'])
+def get_entry(entry_id):
+    entry = session_store.get_entry(entry_id)
+    if entry is None:
+        return jsonify({"error": "Entry not found"}), 404
+    return jsonify(entry)
+
+# Template disponibili: le sezioni guidano anche la generazione per sezioni
+REPORT_TEMPLATES = {
+    'lab_report': {
+        'name': 'Relazione di Laboratorio',
+        'description': 'Template standard per relazioni di laboratorio scientifico',
+        'sections': ['Introduzione', 'Materiali e Metodi', 'Risultati', 'Discussione', 'Conclusioni'],
+        'icon': '🧪'
+    },
+    'technical_report': {
+        'name': 'Report Tecnico',
+        'description': 'Template per report tecnici ingegneristici',
+        'sections': ['Sommario Esecutivo', 'Obiettivi', 'Specifiche Tecniche', 'Metodologia', 'Risultati', 'Raccomandazioni'],
+        'icon': '⚙️'
+    },
+    'scientific_abstract': {
+        'name': 'Abstract Scientifico',
+        'description': 'Template per abstract di articoli scientifici',
+        'sections': ['Contesto', 'Obiettivi', 'Metodi', 'Risultati', 'Conclusioni'],
+        'icon': '📝'
+    },
+    'thesis_chapter': {
+        'name': 'Capitolo di Tesi',
+        'description': 'Template per capitoli di tesi universitarie',
+        'sections': ['Introduzione Teorica', 'Stato dell\'arte', 'Metodologia', 'Analisi', 'Discussione', 'Conclusioni'],
+        'icon': '🎓'
     }
-    
-    return jsonify(templates)
+}
 
-def clean_transcript(transcript):
+@app.route('/api/templates', methods=['GET'])
+def get_templates():
     """
-    Funzione per pulire la trascrizione da parole di riempimento e pause.
+    Restituisce l'elenco dei template disponibili e le loro descrizioni.
     """
-    # Lista di parole da rimuovere o sostituire
-    filler_words = [
-        r'\behm\b', r'\bmmm\b', r'\buhm\b', r'\buh\b', 
-        r'\ballora\b', r'\bcioè\b', r'\becco\b',
-        r'\bok adesso\b', r'\bok ora\b', r'\bho sbagliato\b',
-        r'\bvediamo\b', r'\bvediamo un attimo\b', r'\bun attimo\b',
-        r'\bin pratica\b', r'\bin realtà\b', r'\bin effetti\b',
-        r'\bquindi\b', r'\binsomma\b', r'\bcome dire\b',
-        r'\bcapito\b', r'\bva bene\b'
-    ]
-    
-    # Rimuovi le parole di riempimento
-    cleaned_text = transcript
-    for word in filler_words:
-        cleaned_text = re.sub(word, '', cleaned_text, flags=re.IGNORECASE)
-    
-    # Rimuovi spazi multipli
-    cleaned_text = re.sub(r' +', ' ', cleaned_text)
-    
-    # Rimuovi spazi prima della punteggiatura
-    cleaned_text = re.sub(r' ([,.!?:;])', r'\1', cleaned_text)
-    
-    return cleaned_text.strip()
+    return jsonify(REPORT_TEMPLATES)
 
 def get_template_params(template_type):
     """
@@ -680,5 +1543,7 @@ def add_template_metadata(report, template_type, data):
     return metadata + report
 
 if __name__ == '__main__':
+    # Server di sviluppo, solo per l'uso in locale: in produzione usare gunicorn (gunicorn.conf.py)
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=True)
+    debug = os.environ.get('FLASK_DEBUG', 'true').lower() == 'true'
+    app.run(host=os.environ.get('HOST', '0.0.0.0'), port=port, debug=debug)
@@ -0,0 +1,212 @@
+import hashlib
+import os
+import subprocess
+import threading
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+# Dimensione massima di un file audio caricato (MB): protegge memoria e disco
+MAX_UPLOAD_MB = int(os.getenv("MAX_UPLOAD_MB", "200"))
+MAX_UPLOAD_BYTES = MAX_UPLOAD_MB * 1024 * 1024
+# Durata massima dell'audio decodificato (minuti): un file compresso piccolo
+# può contenere ore di audio, che decodificate occupano molta memoria
+MAX_AUDIO_MINUTES = float(os.getenv("MAX_AUDIO_MINUTES", "180"))
+MAX_AUDIO_SAMPLES = int(MAX_AUDIO_MINUTES * 60 * SAMPLE_RATE)
+# Blocchi letti dall'upload e passati a ffmpeg
+STREAM_BLOCK_SIZE = 256 * 1024
+
+
+def _decode_command(sample_rate, *options):
+    """
+    Comando ffmpeg che legge l'audio da stdin e scrive su stdout PCM s16le
+    mono a `sample_rate` Hz; `options` sono opzioni di output aggiuntive.
+    """
+    return [
+        "ffmpeg",
+        "-hide_banner",
+        "-loglevel", "error",
+        "-i", "pipe:0",
+        "-f", "s16le",
+        "-ac", "1",
+        "-acodec", "pcm_s16le",
+        "-ar", str(sample_rate),
+        *options,
+        "-"
+    ]
+
+
+def decode_audio_bytes(data, sample_rate=SAMPLE_RATE):
+    """
+    Decodifica in memoria un file audio (qualsiasi formato supportato da ffmpeg)
+    in un array numpy float32 mono a `sample_rate` Hz, passando i byte a ffmpeg
+    tramite stdin invece che da un file temporaneo.
+    """
+    cmd = _decode_command(sample_rate)
+    process = subprocess.run(cmd, input=bytes(data), capture_output=True)
+    if process.returncode != 0:
+        raise RuntimeError(f"Failed to decode audio: {process.stderr.decode(errors='ignore').strip()}")
+
+    # Scarta un eventuale campione troncato
+    pcm = process.stdout[:len(process.stdout) - len(process.stdout) % 2]
+    return np.frombuffer(pcm, np.int16).astype(np.float32) / 32768.0
+
+
+class StreamingDecoder:
+    """
+    Decodifica incrementale di un flusso audio ancora in corso (es. i blocchi
+    di MediaRecorder): un solo processo ffmpeg riceve su stdin solo i byte
+    nuovi e i campioni decodificati si leggono man mano, senza ridecodificare
+    la registrazione dall'inizio a ogni blocco.
+    """
+
+    def __init__(self, sample_rate=SAMPLE_RATE):
+        # -flush_packets: scrive subito i campioni decodificati invece di accumularli
+        cmd = _decode_command(sample_rate, "-flush_packets", "1")
+        self.process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self.samples = 0  # campioni restituiti finora
+        self._lock = threading.Lock()
+        self._pcm = bytearray()
+        self._stderr = []
+        # stdout va letto di continuo, altrimenti ffmpeg si blocca e con lui le scritture su stdin
+        self._reader = threading.Thread(target=self._read_output, daemon=True)
+        self._errors = threading.Thread(target=lambda: self._stderr.append(self.process.stderr.read()), daemon=True)
+        self._reader.start()
+        self._errors.start()
+
+    def _read_output(self):
+        for block in iter(lambda: self.process.stdout.read1(STREAM_BLOCK_SIZE), b""):
+            with self._lock:
+                self._pcm.extend(block)
+
+    def write(self, data):
+        try:
+            self.process.stdin.write(data)
+            self.process.stdin.flush()
+        except (BrokenPipeError, ValueError):
+            # ffmpeg è terminato (dati non validi): l'errore arriva da close()
+            pass
+
+    def read(self):
+        """
+        Campioni decodificati dall'ultima lettura (float32). I byte appena
+        scritti possono essere ancora in decodifica: arrivano alla lettura successiva.
+        """
+        with self._lock:
+            usable = len(self._pcm) - len(self._pcm) % 2
+            pcm = bytes(self._pcm[:usable])
+            del self._pcm[:usable]
+        self.samples += usable // 2
+        return np.frombuffer(pcm, np.int16).astype(np.float32) / 32768.0
+
+    def close(self):
+        """
+        Chiude lo stdin, attende la fine della decodifica e restituisce i
+        campioni rimanenti. Un errore di ffmpeg viene sollevato solo se non è
+        stato decodificato nulla (altrimenti è l'ultimo blocco incompleto).
+        """
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        self._reader.join()
+        self._errors.join()
+        returncode = self.process.wait()
+        audio = self.read()
+        if returncode != 0:
+            message = b"".join(self._stderr).decode(errors="ignore").strip()
+            if self.samples == 0:
+                raise RuntimeError(f"Failed to decode audio: {message}")
+            print(f"Audio stream ended with a decoding error: {message}")
+        return audio
+
+    def kill(self):
+        self.process.kill()
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        self.process.wait()
+
+
+class UploadTooLargeError(Exception):
+    def __init__(self, max_bytes):
+        super().__init__(f"Audio upload exceeds the maximum size of {max_bytes // (1024 * 1024)} MB")
+        self.max_bytes = max_bytes
+
+
+class AudioTooLongError(Exception):
+    def __init__(self, max_samples, sample_rate=SAMPLE_RATE):
+        super().__init__(f"Audio exceeds the maximum duration of {max_samples / sample_rate / 60:.0f} minutes")
+        self.max_samples = max_samples
+
+
+def decode_audio_stream(stream, max_bytes=MAX_UPLOAD_BYTES, sample_rate=SAMPLE_RATE, block_size=STREAM_BLOCK_SIZE,
+                        max_samples=MAX_AUDIO_SAMPLES):
+    """
+    Decodifica un upload leggendolo a blocchi dallo stream e passandolo
+    direttamente allo stdin di ffmpeg, senza salvarlo su disco né tenerne
+    una copia in memoria. Durante la lettura calcola lo SHA-256 dei byte
+    (per la cache delle trascrizioni).
+
+    Restituisce (audio float32 mono a `sample_rate` Hz, digest, byte letti).
+    Solleva UploadTooLargeError oltre `max_bytes` e AudioTooLongError oltre
+    `max_samples` campioni decodificati: ffmpeg viene fermato subito, senza
+    decodificare il resto.
+    """
+    cmd = _decode_command(sample_rate)
+    process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    digest = hashlib.sha256()
+    state = {"size": 0, "too_large": False, "too_long": False, "error": None}
+    stderr = []
+
+    def feed():
+        # Scrittura in un thread separato: ffmpeg produce output mentre legge
+        try:
+            for block in iter(lambda: stream.read(block_size), b""):
+                state["size"] += len(block)
+                if state["size"] > max_bytes:
+                    state["too_large"] = True
+                    process.kill()
+                    return
+                digest.update(block)
+                process.stdin.write(block)
+        except BrokenPipeError:
+            # ffmpeg è terminato (formato non valido): l'errore arriva da stderr
+            pass
+        except Exception as e:
+            state["error"] = e
+            process.kill()
+        finally:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+
+    writer = threading.Thread(target=feed, daemon=True)
+    reader = threading.Thread(target=lambda: stderr.append(process.stderr.read()), daemon=True)
+    writer.start()
+    reader.start()
+    pcm = bytearray()
+    max_pcm_bytes = max_samples * 2
+    for block in iter(lambda: process.stdout.read1(STREAM_BLOCK_SIZE), b""):
+        pcm.extend(block)
+        if len(pcm) > max_pcm_bytes:
+            state["too_long"] = True
+            process.kill()
+            break
+    writer.join()
+    reader.join()
+    returncode = process.wait()
+
+    if state["too_large"]:
+        raise UploadTooLargeError(max_bytes)
+    if state["too_long"]:
+        raise AudioTooLongError(max_samples, sample_rate)
+    if state["error"] is not None:
+        raise state["error"]
+    if returncode != 0:
+        raise RuntimeError(f"Failed to decode audio: {b''.join(stderr).decode(errors='ignore').strip()}")
+
+    pcm = pcm[:len(pcm) - len(pcm) % 2]
+    return np.frombuffer(pcm, np.int16).astype(np.float32) / 32768.0, digest.hexdigest(), state["size"]
@@ -0,0 +1,137 @@
+import os
+
+from audio_io import SAMPLE_RATE
+from long_audio import split_on_silence, stitch_results
+
+# Finestre da 30 secondi decodificate insieme in un solo passaggio del modello
+WHISPER_BATCH_SIZE = int(os.getenv("WHISPER_BATCH_SIZE", "8"))
+# Durata desiderata dei blocchi: Whisper elabora al massimo 30 secondi per finestra
+BATCH_TARGET_CHUNK = float(os.getenv("BATCH_TARGET_CHUNK", "25"))
+BATCH_MAX_CHUNK = 30.0
+# File per richiesta e decodifiche ffmpeg in parallelo
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "20"))
+BATCH_DECODE_WORKERS = int(os.getenv("BATCH_DECODE_WORKERS", "4"))
+
+# Soglie di Whisper per scartare il silenzio e ripetere le decodifiche degeneri
+NO_SPEECH_THRESHOLD = 0.6
+LOGPROB_THRESHOLD = -1.0
+COMPRESSION_RATIO_THRESHOLD = 2.4
+
+
+def _mel(model, audio):
+    import torch
+    import whisper
+    
+    padded = whisper.pad_or_trim(torch.from_numpy(audio))
+    return whisper.log_mel_spectrogram(padded, n_mels=model.dims.n_mels)
+
+
+def _batches(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _detect_languages(model, mels):
+    """
+    Lingua di ciascun file, dal suo primo blocco (una sola passata per tutti i file).
+    """
+    import torch
+    
+    languages = []
+    for batch in _batches(mels, WHISPER_BATCH_SIZE):
+        _, probs = model.detect_language(torch.stack(batch).to(model.device))
+        languages.extend(max(p, key=p.get) for p in probs)
+    return languages
+
+
+def _first_pass_options(options):
+    """
+    Opzioni per whisper.decode dalle opzioni di transcribe: una sola
+    temperatura (la prima; le altre servono alle ritrascrizioni) e, come fa
+    transcribe, beam_size solo con temperatura 0 e best_of solo sopra.
+    """
+    temperature = options.get("temperature") or 0.0
+    if isinstance(temperature, (list, tuple)):
+        temperature = temperature[0]
+    if temperature > 0:
+        return {"temperature": temperature, "best_of": options.get("best_of")}
+    return {"temperature": temperature, "beam_size": options.get("beam_size")}
+
+
+def transcribe_batch(model, audios, language=None, batch_size=WHISPER_BATCH_SIZE, sample_rate=SAMPLE_RATE,
+                     options=None):
+    """
+    Trascrive più file con lo stesso modello residente. Ogni file viene diviso
+    sui silenzi in blocchi di al massimo 30 secondi; i mel-spectrogram dei
+    blocchi di tutti i file (con la stessa lingua) vengono decodificati insieme
+    a gruppi di `batch_size`, invece di un file e una finestra alla volta.
+
+    `options` sono le opzioni di transcribe del profilo (decode_options).
+
+    Restituisce, per ogni file, un risultato nel formato di Whisper (testo,
+    lingua e un segmento per blocco). I blocchi la cui decodifica in batch
+    risulta degenere vengono ritrascritti singolarmente con model.transcribe
+    (con tutte le temperature di ripiego del profilo).
+    Con motori diversi da openai-whisper (senza decodifica a batch) i file
+    vengono trascritti uno dopo l'altro con lo stesso modello.
+    """
+    import torch
+    import whisper
+    
+    options = {name: value for name, value in (options or {}).items() if name != "language"}
+    if not hasattr(model, "dims"):
+        return [model.transcribe(audio, language=language, **options) for audio in audios]
+    
+    chunks = []  # (file, indice del blocco, inizio, fine, mel)
+    for f, audio in enumerate(audios):
+        for i, (start, end) in enumerate(split_on_silence(audio, sample_rate, target_chunk=BATCH_TARGET_CHUNK,
+                                                          max_chunk=BATCH_MAX_CHUNK)):
+            chunks.append((f, i, start, end, _mel(model, audio[start:end])))
+
+    if language:
+        languages = [language] * len(audios)
+    else:
+        first = {}
+        for chunk in chunks:
+            first.setdefault(chunk[0], chunk[4])
+        detected = _detect_languages(model, list(first.values()))
+        languages = [None] * len(audios)
+        for f, lang in zip(first, detected):
+            languages[f] = lang
+
+    print(f"Batch transcription: {len(audios)} files, {len(chunks)} windows, batch size {batch_size}")
+    fp16 = model.device.type == "cuda"
+    options["fp16"] = fp16
+    first_pass = _first_pass_options(options)
+    decoded = {}
+    # Le opzioni di decodifica valgono per l'intero batch: si raggruppa per lingua
+    for lang in sorted({languages[c[0]] for c in chunks}, key=str):
+        group = [c for c in chunks if languages[c[0]] == lang]
+        decoding = whisper.DecodingOptions(language=lang, without_timestamps=True, fp16=fp16, **first_pass)
+        for batch in _batches(group, batch_size):
+            mels = torch.stack([c[4] for c in batch]).to(model.device)
+            for chunk, result in zip(batch, whisper.decode(model, mels, decoding)):
+                decoded[chunk[:2]] = (chunk, result)
+
+    per_file = [[] for _ in audios]
+    for (f, i), ((_, _, start, end, _), result) in decoded.items():
+        if result.no_speech_prob > NO_SPEECH_THRESHOLD and result.avg_logprob < LOGPROB_THRESHOLD:
+            continue
+        if result.compression_ratio > COMPRESSION_RATIO_THRESHOLD or result.avg_logprob < LOGPROB_THRESHOLD:
+            # Ripetizioni o bassa confidenza: transcribe riprova con temperature più alte
+            text = model.transcribe(audios[f][start:end], language=languages[f], **options)["text"]
+        else:
+            text = result.text
+        duration = (end - start) / sample_rate
+        per_file[f].append((i, start, {
+            "text": text,
+            "language": languages[f],
+            "segments": [{"start": 0.0, "end": duration, "text": text}] if text.strip() else []
+        }))
+
+    results = []
+    for f, chunk_results in enumerate(per_file):
+        result = stitch_results(chunk_results, sample_rate)
+        result["language"] = result["language"] or languages[f]
+        results.append(result)
+    return results
@@ -0,0 +1,95 @@
+"""
+Confronto tra la vecchia pulizia della trascrizione (una sostituzione per
+ogni parola di riempimento, più due passaggi per gli spazi) e il cleaner
+compilato a passaggio singolo.
+
+Uso: python benchmarks/bench_clean_transcript.py [--words 200000] [--repeat 5]
+"""
+import argparse
+import itertools
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from text_cleaner import FILLER_WORDS, clean_transcript
+
+VOCABULARY = [
+    "la", "soluzione", "viene", "scaldata", "a", "80", "gradi", "per", "dieci", "minuti",
+    "il", "campione", "mostra", "una", "variazione", "di", "colore", "misuriamo", "pH",
+    "con", "elettrodo", "calibrato", "Allora", "Quindi", "ecco", "cioè", "ehm", "uhm",
+    "vediamo", "un", "attimo", "in", "pratica", "va", "bene", "come", "dire"
+]
+PUNCTUATION = ["", "", "", "", ",", ".", "?", " ,"]
+# Intercalari di più parole attaccati alla punteggiatura: lo spazio al loro
+# interno non conta come spazio tra le parole. "vediamo un attimo" è escluso:
+# la vecchia pulizia toglie prima "vediamo" e ne lascia lo spazio
+MULTI_WORD_FILLERS = [w for w in FILLER_WORDS["it"] if " " in w and w != "vediamo un attimo"]
+FILLER_PREFIXES = ["x", "x ", "x,", "x(", "quindi,", "ecco "]
+FILLER_SUFFIXES = ["y", " y", ".", " .", ")", "(ecco)", " ecco,", "ok ora?", " va bene"]
+
+
+def legacy_clean_transcript(transcript):
+    filler_words = [r'\b' + re.escape(w) + r'\b' for w in FILLER_WORDS["it"]]
+    cleaned_text = transcript
+    for word in filler_words:
+        cleaned_text = re.sub(word, '', cleaned_text, flags=re.IGNORECASE)
+    cleaned_text = re.sub(r' +', ' ', cleaned_text)
+    cleaned_text = re.sub(r' ([,.!?:;])', r'\1', cleaned_text)
+    return cleaned_text.strip()
+
+
+def synthetic_transcript(words, seed=0):
+    rng = random.Random(seed)
+    parts = []
+    for _ in range(words):
+        parts.append(rng.choice(VOCABULARY) + rng.choice(PUNCTUATION))
+        if rng.random() < 0.02:
+            parts.append("\n")
+    return " ".join(parts)
+
+
+def filler_edge_cases():
+    return [prefix + filler + suffix
+            for filler, prefix, suffix in itertools.product(MULTI_WORD_FILLERS, FILLER_PREFIXES, FILLER_SUFFIXES)]
+
+
+def best_time(fn, text, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(text)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--words", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    text = synthetic_transcript(args.words)
+    if legacy_clean_transcript(text) != clean_transcript(text):
+        print("ERROR: outputs differ")
+        return 1
+    for case in filler_edge_cases():
+        if legacy_clean_transcript(case) != clean_transcript(case):
+            print(f"ERROR: outputs differ for {case!r}: {legacy_clean_transcript(case)!r} != "
+                  f"{clean_transcript(case)!r}")
+            return 1
+
+    legacy = best_time(legacy_clean_transcript, text, args.repeat)
+    compiled = best_time(clean_transcript, text, args.repeat)
+    print(f"Transcript: {args.words} words, {len(text) / 1024:.0f} KiB")
+    print(f"legacy   : {legacy * 1000:8.1f} ms")
+    print(f"compiled : {compiled * 1000:8.1f} ms")
+    print(f"speedup  : {legacy / compiled:8.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""
+Confronto tra la vecchia correzione locale (un re.sub per ogni regola e per
+ogni sostituzione formale, con i pattern passati come stringhe) e le regole
+precompilate di correction_rules.
+
+Uso: python benchmarks/bench_correct_text.py [--words 200000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from correction_rules import FORMAL_REPLACEMENTS, correct_text_locally
+
+VOCABULARY = [
+    "la", "soluzione", "viene", "scaldata", "a", "80", "gradi", "e", "ed", "i", "cosa",
+    "c'è", "però", "insomma", "un", "sacco", "di", "tanto", "per", "cui", "cioè",
+    "campione", "misuriamo", "il", "pH", "Cosa", "PERÒ"
+]
+PUNCTUATION = ["", "", "", "", ",", ".", " ,", "?", ".x", "  ", "\n"]
+
+
+def legacy_correct_text(text, style):
+    corrected_text = text[0].upper() + text[1:] if text else ""
+    if corrected_text and not corrected_text.rstrip().endswith(('.', '!', '?')):
+        corrected_text = corrected_text.rstrip() + '.'
+    corrected_text = re.sub(r'\bi\b', 'I', corrected_text)
+    corrected_text = re.sub(r'\s+([.,;:!?])', r'\1', corrected_text)
+    corrected_text = re.sub(r'([.,;:!?])([^\s\d])', r'\1 \2', corrected_text)
+    corrected_text = re.sub(r'\s+', ' ', corrected_text)
+    corrected_text = re.sub(r'\b(e|ed)\b', ', e', corrected_text)
+    corrected_text = re.sub(r', e, e', ', e', corrected_text)
+    corrected_text = re.sub(r', , ', ', ', corrected_text)
+    if style == 'academic':
+        for colloquial, formal in FORMAL_REPLACEMENTS.items():
+            corrected_text = re.sub(r'\b' + re.escape(colloquial) + r'\b', formal, corrected_text,
+                                    flags=re.IGNORECASE)
+    return corrected_text
+
+
+def synthetic_text(words, seed=0):
+    rng = random.Random(seed)
+    return " ".join(rng.choice(VOCABULARY) + rng.choice(PUNCTUATION) for _ in range(words))
+
+
+def best_time(fn, text, style, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(text, style)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--words", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    text = synthetic_text(args.words)
+    print(f"Text: {args.words} words, {len(text) / 1024:.0f} KiB")
+    for style in ("academic", "default"):
+        if legacy_correct_text(text, style) != correct_text_locally(text, style):
+            print(f"ERROR: outputs differ for style {style}")
+            return 1
+        legacy = best_time(legacy_correct_text, text, style, args.repeat)
+        compiled = best_time(correct_text_locally, text, style, args.repeat)
+        print(f"[{style}] legacy {legacy * 1000:8.1f} ms | compiled {compiled * 1000:8.1f} ms | "
+              f"speedup {legacy / compiled:5.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""
+Routing tra più istanze di Ollama (ollama_router) contro server finti
+locali: alcune istanze sane, una che fallisce ogni generazione (503) e una
+senza il modello. Confronta latenza e throughput delle generazioni in
+streaming con una sola istanza e con il pool, e verifica che nessuna
+richiesta vada persa né finisca sull'istanza senza il modello.
+
+Ogni istanza finta esegue al massimo --parallel generazioni alla volta,
+come un server Ollama reale con OLLAMA_NUM_PARALLEL.
+
+Uso: python benchmarks/bench_ollama_router.py [--instances 3] [--requests 60] [--concurrency 12]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from ollama_router import OllamaRouter
+from stub_ollama import StubOllamaServer
+
+MODEL = "llama3"
+
+
+def run(router, requests, concurrency):
+    """
+    Esegue le generazioni in parallelo; restituisce (latenze, errori, secondi totali).
+    """
+    for instance in router.instances:
+        instance.health.probe()
+
+    def one(i):
+        start = time.perf_counter()
+        try:
+            text = "".join(router.generate_stream(f"Genera la relazione numero {i}"))
+            return time.perf_counter() - start, None if text else "empty response"
+        except Exception as e:
+            return time.perf_counter() - start, str(e)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - start
+    return [latency for latency, _ in results], [error for _, error in results if error], elapsed
+
+
+def report(label, latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+    print(f"{label:<12} {len(latencies) / elapsed:6.2f} req/s  p50 {statistics.median(latencies):6.2f}s  "
+          f"p95 {p95:6.2f}s  errors {len(errors)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--instances", type=int, default=3, help="Healthy stub instances")
+    parser.add_argument("--requests", type=int, default=60)
+    parser.add_argument("--concurrency", type=int, default=12)
+    parser.add_argument("--tokens", type=int, default=60)
+    parser.add_argument("--tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--parallel", type=int, default=2, help="Concurrent generations per stub instance")
+    args = parser.parse_args()
+
+    stub_options = {"tokens": args.tokens, "tokens_per_second": args.tokens_per_second, "first_token_delay": 0.1,
+                    "parallel": args.parallel}
+    healthy = [StubOllamaServer(model=MODEL, **stub_options).start() for _ in range(args.instances)]
+    failing = StubOllamaServer(model=MODEL, fail_status=503, **stub_options).start()
+    no_model = StubOllamaServer(model="other-model", **stub_options).start()
+
+    try:
+        latencies, errors, elapsed = run(OllamaRouter([healthy[0].url], MODEL), args.requests, args.concurrency)
+        report("1 instance", latencies, errors, elapsed)
+        baseline = healthy[0].requests
+
+        router = OllamaRouter([failing.url, no_model.url] + [s.url for s in healthy], MODEL)
+        latencies, errors, elapsed = run(router, args.requests, args.concurrency)
+        report(f"{args.instances} + faulty", latencies, errors, elapsed)
+
+        print(f"{'instance':<26} {'requests':>9} {'max in flight':>14}")
+        # La prima istanza sana ha servito anche la prova con un'istanza sola
+        rows = [("healthy", healthy[0], healthy[0].requests - baseline)]
+        rows += [("healthy", s, s.requests) for s in healthy[1:]]
+        rows += [("failing (503)", failing, failing.requests), ("without model", no_model, no_model.requests)]
+        for name, server, served in rows:
+            print(f"{name + ' ' + server.url[-5:]:<26} {served:>9} {server.max_in_flight:>14}")
+        stats = router.stats()
+        print(f"failovers: {stats['failovers']}, exhausted: {stats['exhausted']}")
+        for error in errors[:5]:
+            print(f"  error: {error}")
+
+        failures = []
+        if errors:
+            failures.append(f"{len(errors)} requests failed")
+        if no_model.requests:
+            failures.append("the instance without the model received generations")
+        if failures:
+            print("FAIL: " + "; ".join(failures))
+            sys.exit(1)
+        print("OK")
+    finally:
+        for server in healthy + [failing, no_model]:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
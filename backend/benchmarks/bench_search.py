@@ -0,0 +1,92 @@
+"""
+Latenza della ricerca full-text (search_index) con molti documenti:
+trascrizioni sintetiche divise in segmenti da ~10 secondi più un report ogni
+quattro trascrizioni. Misura costruzione dell'indice e latenza delle
+ricerche (termini rari, comuni e misti); fallisce se il p95 supera la soglia.
+
+Uso: python benchmarks/bench_search.py [--documents 20000] [--words 600] [--max-ms 10]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from search_index import SearchIndex
+from synthetic import synthetic_transcript
+
+# Argomenti delle sessioni: ogni documento ne cita uno, così esistono termini rari
+TOPICS = [
+    "spettrofotometro", "titolazione", "fenolftaleina", "centrifuga", "cromatografia", "oscilloscopio",
+    "pendolo", "calorimetro", "viscosimetro", "rifrattometro", "polarimetro", "conducimetro", "buretta",
+    "distillazione", "elettroforesi", "microscopio", "resistenza", "condensatore", "induttanza", "diffrazione"
+]
+QUERIES = [
+    "spettrofotometro calibrato", "titolazione fenolftaleina", "campione temperatura",
+    "variazione di colore", "elettrodo pH", "diffrazione", "risultati confermano ipotesi iniziale",
+    "cromatografia campione", "pendolo", "la soluzione viene scaldata a ottanta gradi"
+]
+
+
+def _document(i, words, rng):
+    text = synthetic_transcript(words, seed=i)
+    topic = rng.choice(TOPICS)
+    sentences = [s for s in text.replace("?", ".").split(".") if s.strip()]
+    sentences.insert(rng.randrange(len(sentences) + 1), f" Oggi usiamo il {topic}")
+    segments = [{"start": 10.0 * n, "end": 10.0 * (n + 1), "text": s.strip() + "."} for n, s in enumerate(sentences)]
+    return {
+        "id": f"entry-{i}",
+        "session_id": f"session-{i // 2}",
+        "kind": "report" if i % 5 == 4 else "transcription",
+        "template_id": "lab_report" if i % 5 == 4 else None,
+        "content": " ".join(s["text"] for s in segments),
+        "metadata": {"language": "it", "segments": segments},
+        "created_at": time.time()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--documents", type=int, default=20000)
+    parser.add_argument("--words", type=int, default=600, help="Words per document")
+    parser.add_argument("--repeat", type=int, default=20, help="Runs of each query")
+    parser.add_argument("--max-ms", type=float, default=10.0, help="Maximum p95 search latency")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    index = SearchIndex()
+    build_seconds = 0.0
+    for i in range(args.documents):
+        document = _document(i, args.words, rng)
+        start = time.perf_counter()
+        index.add(document)
+        build_seconds += time.perf_counter() - start
+    stats = index.stats()
+    print(f"Indexed {stats['documents']} documents ({stats['terms']} terms) in {build_seconds:.1f}s "
+          f"({build_seconds / args.documents * 1000:.2f} ms/document)")
+
+    latencies = {}
+    for query in QUERIES:
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            result = index.search(query)
+            latencies.setdefault(query, []).append((time.perf_counter() - start) * 1000)
+        print(f"  {query[:40]:<40} {statistics.median(latencies[query]):7.2f} ms  "
+              f"({result['total']} matches)")
+
+    every = sorted(ms for runs in latencies.values() for ms in runs)
+    p95 = every[int(len(every) * 0.95) - 1]
+    print(f"search latency: p50 {statistics.median(every):.2f} ms, p95 {p95:.2f} ms, max {every[-1]:.2f} ms")
+    if p95 > args.max_ms:
+        print(f"FAIL: p95 {p95:.2f} ms exceeds {args.max_ms:.2f} ms")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Tempo di avvio del backend: import di app.py e prima risposta di una rotta
+leggera (/api/templates), misurati in processi Python separati con il
+warm-up disattivato (STARTUP_WARMUP=lazy). Fallisce se l'avvio supera la
+soglia o se l'import di app.py carica torch o whisper, così da accorgersi
+delle regressioni.
+
+Uso: python benchmarks/bench_startup.py [--runs 5] [--max-seconds 2.0]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ["torch", "whisper"]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+response = app.app.test_client().get("/api/templates")
+served = time.perf_counter()
+print(json.dumps({
+    "import_seconds": imported - start,
+    "first_response_seconds": served - start,
+    "status": response.status_code,
+    "heavy_modules": [m for m in %r if m in sys.modules]
+}))
+""" % (HEAVY_MODULES,)
+
+
+def measure_once():
+    env = dict(os.environ, STARTUP_WARMUP="lazy")
+    process = subprocess.run([sys.executable, "-c", PROBE], cwd=BACKEND_DIR, env=env,
+                             capture_output=True, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr.strip())
+    # L'app stampa diagnostica all'avvio: il risultato è l'ultima riga
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=2.0,
+                        help="Maximum median time until the first response")
+    args = parser.parse_args()
+
+    runs = [measure_once() for _ in range(args.runs)]
+    import_time = statistics.median(r["import_seconds"] for r in runs)
+    first_response = statistics.median(r["first_response_seconds"] for r in runs)
+    heavy = sorted({m for r in runs for m in r["heavy_modules"]})
+
+    print(f"import app:     {import_time * 1000:8.1f} ms (median of {args.runs})")
+    print(f"first response: {first_response * 1000:8.1f} ms (status {runs[-1]['status']})")
+    print(f"heavy modules imported: {', '.join(heavy) or 'none'}")
+
+    failures = []
+    if heavy:
+        failures.append(f"importing app loads {', '.join(heavy)}")
+    if first_response > args.max_seconds:
+        failures.append(f"first response after {first_response:.2f}s (limit {args.max_seconds:.2f}s)")
+    if failures:
+        print("FAIL: " + "; ".join(failures))
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Confronto dei motori di Whisper (whisper_backends): tempo di caricamento,
+real-time factor (tempo di trascrizione / durata dell'audio) e memoria per
+ogni dimensione del modello. Ogni combinazione gira in un processo separato,
+così il picco di memoria misurato è solo quello del modello.
+
+Con l'audio sintetico (toni, senza parlato) il decoder termina quasi subito:
+per misure realistiche usare una registrazione vera con --audio.
+
+Uso: python benchmarks/bench_whisper_backends.py [--audio lezione.mp3] [--seconds 60]
+        [--backends openai,openai-int8,faster-whisper] [--sizes tiny,base,small] [--output risultati.json]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import numpy as np
+
+from audio_io import SAMPLE_RATE
+
+
+def _rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def run_child(backend, size, audio_path, language):
+    """
+    Carica il modello e trascrive l'audio nel processo corrente; stampa il risultato in JSON.
+    """
+    import whisper_backends
+
+    audio = np.load(audio_path)
+    rss_start = _rss_mb()
+    start = time.perf_counter()
+    model = whisper_backends.load_model(size, "cpu", backend)
+    load_seconds = time.perf_counter() - start
+    rss_loaded = _rss_mb()
+
+    start = time.perf_counter()
+    result = model.transcribe(audio, language=language)
+    transcribe_seconds = time.perf_counter() - start
+    duration = len(audio) / SAMPLE_RATE
+
+    print(json.dumps({
+        "backend": backend,
+        "size": size,
+        "load_seconds": round(load_seconds, 3),
+        "transcribe_seconds": round(transcribe_seconds, 3),
+        "rtf": round(transcribe_seconds / duration, 4),
+        "model_rss_mb": round(rss_loaded - rss_start, 1),
+        # ru_maxrss è in KB su Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "words": len(result["text"].split()),
+        "text_preview": result["text"].strip()[:80]
+    }))
+
+
+def load_audio(args):
+    if args.audio:
+        from audio_io import decode_audio_bytes
+
+        with open(args.audio, "rb") as f:
+            audio = decode_audio_bytes(f.read())
+        return audio[:int(args.seconds * SAMPLE_RATE)] if args.seconds else audio
+    from synthetic import synthetic_audio
+
+    print("No --audio given: using synthetic audio (RTF will be optimistic)")
+    return synthetic_audio(args.seconds or 60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--audio", help="Audio file to transcribe (any format ffmpeg can read)")
+    parser.add_argument("--seconds", type=float, default=60.0, help="Audio length to use (0 = whole file)")
+    parser.add_argument("--backends", default="openai,openai-int8,faster-whisper")
+    parser.add_argument("--sizes", default="tiny,base,small")
+    parser.add_argument("--language", default="it")
+    parser.add_argument("--output")
+    parser.add_argument("--child", nargs=3, metavar=("BACKEND", "SIZE", "AUDIO_NPY"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(*args.child, args.language)
+        return
+
+    audio = load_audio(args)
+    with tempfile.NamedTemporaryFile(suffix=".npy", delete=False) as f:
+        np.save(f, audio.astype(np.float32))
+        audio_path = f.name
+
+    results = []
+    try:
+        print(f"Audio: {len(audio) / SAMPLE_RATE:.0f}s")
+        print(f"{'backend':<16} {'size':<8} {'load':>8} {'RTF':>8} {'model MB':>10} {'peak MB':>9}")
+        for backend in args.backends.split(","):
+            for size in args.sizes.split(","):
+                process = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", backend, size,
+                                          audio_path, "--language", args.language],
+                                         capture_output=True, text=True)
+                if process.returncode != 0:
+                    error = (process.stderr.strip().splitlines() or ["unknown error"])[-1]
+                    print(f"{backend:<16} {size:<8} failed: {error}")
+                    results.append({"backend": backend, "size": size, "error": error})
+                    continue
+                result = json.loads(process.stdout.strip().splitlines()[-1])
+                results.append(result)
+                print(f"{backend:<16} {size:<8} {result['load_seconds']:>7.1f}s {result['rtf']:>8.3f} "
+                      f"{result['model_rss_mb']:>10.0f} {result['peak_rss_mb']:>9.0f}")
+    finally:
+        os.unlink(audio_path)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"audio_seconds": len(audio) / SAMPLE_RATE, "results": results}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Verifica che gli upload oltre MAX_UPLOAD_MB ricevano 413 (e non 500) da
+tutti gli endpoint di trascrizione: form multipart, corpo grezzo, job
+asincroni e batch. L'app gira in un processo separato con un limite di 1 MB
+e il warm-up disattivato; nessun audio arriva a Whisper.
+
+Uso: python benchmarks/check_upload_limit.py
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import io, json
+import app
+
+client = app.app.test_client()
+body = b"\\0" * (2 * 1024 * 1024)
+requests = {
+    "transcribe (form)": lambda: client.post("/api/transcribe", data={"file": (io.BytesIO(body), "big.wav")},
+                                             content_type="multipart/form-data"),
+    "transcribe (raw)": lambda: client.post("/api/transcribe", data=body, content_type="audio/wav"),
+    "jobs (form)": lambda: client.post("/api/transcribe/jobs", data={"file": (io.BytesIO(body), "big.wav")},
+                                       content_type="multipart/form-data"),
+    "jobs (raw)": lambda: client.post("/api/transcribe/jobs", data=body, content_type="audio/wav"),
+    "batch": lambda: client.post("/api/transcribe/batch", data={"files": [(io.BytesIO(body), "big.wav")]},
+                                 content_type="multipart/form-data"),
+}
+results = {}
+for name, send in requests.items():
+    response = send()
+    results[name] = [response.status_code, (response.get_json(silent=True) or {}).get("error")]
+print(json.dumps(results))
+"""
+
+
+def main():
+    workdir = tempfile.mkdtemp(prefix="autolabo-upload-")
+    env = dict(os.environ, MAX_UPLOAD_MB="1", STARTUP_WARMUP="lazy",
+               SESSION_DB_PATH=os.path.join(workdir, "sessions.db"),
+               TRANSCRIPT_CACHE_DIR=os.path.join(workdir, "transcripts"))
+    process = subprocess.run([sys.executable, "-c", PROBE], cwd=BACKEND_DIR, env=env,
+                             capture_output=True, text=True)
+    if process.returncode != 0:
+        print(process.stderr)
+        sys.exit(1)
+    results = json.loads(process.stdout.strip().splitlines()[-1])
+
+    failures = []
+    for name, (status, error) in results.items():
+        print(f"{name:<20} {status}  {error}")
+        if status != 413:
+            failures.append(f"{name} returned {status}")
+    if failures:
+        print("FAIL: " + "; ".join(failures))
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
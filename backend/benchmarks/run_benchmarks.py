@@ -0,0 +1,364 @@
+"""
+Benchmark riproducibile della pipeline di trascrizione e generazione dei report.
+
+Avvia un server Ollama finto (benchmarks/stub_ollama.py) e l'app Flask nello
+stesso processo, poi invia richieste con payload sintetici a concorrenza
+crescente. Per ogni endpoint e livello di concorrenza misura throughput,
+latenza p50/p95/p99 (e tempo al primo token per gli endpoint in streaming) e
+picco di memoria RSS. I risultati vengono salvati in JSON per confrontare run
+diverse.
+
+Uso:
+    python benchmarks/run_benchmarks.py [--concurrency 1,2,4,8] [--requests 16]
+        [--endpoints clean,correct,report,report_stream,transcribe,transcribe_batch] [--output results.json]
+    python benchmarks/run_benchmarks.py --compare vecchio.json nuovo.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import requests
+
+from stub_ollama import StubOllamaServer
+from synthetic import synthetic_audio, synthetic_transcript, write_wav
+
+ENDPOINTS = ["clean", "correct", "report", "report_stream", "transcribe", "transcribe_batch"]
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    low = int(k)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (k - low)
+
+
+def summarize(values):
+    if not values:
+        return None
+    return {
+        "p50": round(percentile(values, 50), 4),
+        "p95": round(percentile(values, 95), 4),
+        "p99": round(percentile(values, 99), 4),
+        "mean": round(sum(values) / len(values), 4),
+        "max": round(max(values), 4)
+    }
+
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    # Su macOS ru_maxrss è in byte, su Linux in KB: è comunque il picco del processo
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+class RSSSampler:
+    """
+    Campiona la memoria RSS del processo (app e client) durante un livello.
+    """
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.peak = current_rss_mb()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss_mb())
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss_mb())
+
+
+class Workload:
+    """
+    Richieste per ciascun endpoint. Ogni richiesta ha un payload diverso così
+    che cache e coalescing delle richieste identiche non falsino le misure.
+    """
+
+    def __init__(self, base_url, args, workdir):
+        self.base_url = base_url
+        self.args = args
+        self.audio_path = None
+        if "transcribe" in args.endpoints or "transcribe_batch" in args.endpoints:
+            audio = synthetic_audio(args.audio_seconds, seed=args.seed)
+            self.audio_path = write_wav(os.path.join(workdir, "synthetic.wav"), audio)
+
+    def _text(self, i, words):
+        return synthetic_transcript(words, seed=self.args.seed + i)
+
+    def clean(self, i):
+        r = requests.post(f"{self.base_url}/api/clean-transcript",
+                          json={"text": self._text(i, self.args.transcript_words)})
+        r.raise_for_status()
+        return None
+
+    def correct(self, i):
+        r = requests.post(f"{self.base_url}/api/correct-text",
+                          json={"text": self._text(i, 150), "style": "academic"})
+        r.raise_for_status()
+        return None
+
+    def _report_payload(self, i):
+        return {
+            "transcript": self._text(i, self.args.transcript_words),
+            "templateId": "lab_report",
+            "mode": self.args.report_mode,
+            "metadata": {"author": "Benchmark", "institution": "Università", "title": f"Prova {i}"}
+        }
+
+    def report(self, i):
+        r = requests.post(f"{self.base_url}/api/generate-report", json=self._report_payload(i))
+        r.raise_for_status()
+        return None
+
+    def report_stream(self, i):
+        start = time.perf_counter()
+        ttft = None
+        with requests.post(f"{self.base_url}/api/generate-report/stream",
+                           json=self._report_payload(i), stream=True) as r:
+            r.raise_for_status()
+            for line in r.iter_lines(decode_unicode=True):
+                if ttft is None and line and line.startswith("event:") and line.split(":", 1)[1].strip() in ("token", "section"):
+                    ttft = time.perf_counter() - start
+                if line and line.startswith("event:") and line.split(":", 1)[1].strip() == "error":
+                    raise RuntimeError("stream error event")
+        return ttft
+
+    def transcribe(self, i):
+        with open(self.audio_path, "rb") as f:
+            r = requests.post(f"{self.base_url}/api/transcribe",
+                              files={"file": (f"synthetic_{i}.wav", f, "audio/wav")},
+                              data={"long_audio": "auto"})
+        r.raise_for_status()
+        return None
+
+    def transcribe_batch(self, i):
+        handles = [open(self.audio_path, "rb") for _ in range(self.args.batch_files)]
+        try:
+            r = requests.post(f"{self.base_url}/api/transcribe/batch",
+                              files=[("files", (f"synthetic_{i}_{n}.wav", h, "audio/wav"))
+                                     for n, h in enumerate(handles)])
+        finally:
+            for h in handles:
+                h.close()
+        r.raise_for_status()
+        return None
+
+
+def run_level(workload, endpoint, concurrency, count, offset):
+    fn = getattr(workload, endpoint)
+    latencies = []
+    ttfts = []
+    errors = []
+    lock = threading.Lock()
+
+    def one(i):
+        start = time.perf_counter()
+        try:
+            ttft = fn(offset + i)
+        except Exception as e:
+            with lock:
+                errors.append(str(e))
+            return
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if ttft is not None:
+                ttfts.append(ttft)
+
+    with RSSSampler() as rss:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(one, range(count)))
+        wall = time.perf_counter() - start
+
+    result = {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": count,
+        "errors": len(errors),
+        "wall_seconds": round(wall, 4),
+        "throughput_rps": round(len(latencies) / wall, 4) if wall > 0 else None,
+        "latency": summarize(latencies),
+        "peak_rss_mb": round(rss.peak, 1)
+    }
+    if ttfts:
+        result["ttft"] = summarize(ttfts)
+    if errors:
+        result["first_error"] = errors[0]
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def start_app(args, workdir):
+    """
+    Configura l'app per usare il server finto e la avvia in un thread.
+    """
+    stub = StubOllamaServer(tokens=args.tokens, tokens_per_second=args.tokens_per_second,
+                            first_token_delay=args.first_token_delay, model=args.model).start()
+    os.environ["OLLAMA_API_URL"] = stub.url
+    os.environ["MODEL_NAME"] = args.model
+    os.environ["WHISPER_MODEL_SIZE"] = args.whisper_model
+    os.environ["TRANSCRIPT_CACHE_DIR"] = os.path.join(workdir, "transcripts")
+    # Cache disattivate: ogni richiesta deve fare tutto il lavoro
+    os.environ["TRANSCRIPT_CACHE_MAX_ENTRIES"] = "0"
+    os.environ["LLM_CACHE_MAX_ENTRIES"] = "0"
+
+    from werkzeug.serving import make_server
+    from app import app as flask_app
+
+    server = make_server("127.0.0.1", 0, flask_app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="bench-app", daemon=True).start()
+    return stub, server, f"http://127.0.0.1:{server.server_port}"
+
+
+def run(args):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    workdir = tempfile.mkdtemp(prefix="autolabo-bench-")
+    stub, server, base_url = start_app(args, workdir)
+    workload = Workload(base_url, args, workdir)
+
+    results = []
+    offset = 0
+    try:
+        for endpoint in args.endpoints:
+            # Richiesta di riscaldamento (caricamento modelli, prime connessioni)
+            try:
+                getattr(workload, endpoint)(10**6)
+            except Exception as e:
+                print(f"Warm-up failed for {endpoint}: {e}")
+            for concurrency in args.concurrency:
+                result = run_level(workload, endpoint, concurrency, args.requests, offset)
+                offset += args.requests
+                results.append(result)
+                latency = result["latency"] or {}
+                print(f"{endpoint:<14} c={concurrency:<3} {result['throughput_rps'] or 0:>8.2f} req/s  "
+                      f"p50={latency.get('p50')}s p95={latency.get('p95')}s p99={latency.get('p99')}s  "
+                      f"rss={result['peak_rss_mb']}MB errors={result['errors']}")
+    finally:
+        server.shutdown()
+        stub.shutdown()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "stub_requests": stub.requests,
+            "config": {
+                "concurrency": args.concurrency,
+                "requests": args.requests,
+                "transcript_words": args.transcript_words,
+                "audio_seconds": args.audio_seconds,
+                "batch_files": args.batch_files,
+                "tokens": args.tokens,
+                "tokens_per_second": args.tokens_per_second,
+                "first_token_delay": args.first_token_delay,
+                "whisper_model": args.whisper_model,
+                "report_mode": args.report_mode,
+                "seed": args.seed
+            }
+        },
+        "results": results
+    }
+    output = args.output or os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+def _delta(old, new):
+    if old in (None, 0) or new is None:
+        return "n/a"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def compare(old_path, new_path):
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+    old_results = {(r["endpoint"], r["concurrency"]): r for r in old["results"]}
+    print(f"{old['meta'].get('git_commit')} -> {new['meta'].get('git_commit')}")
+    print(f"{'endpoint':<14} {'c':>3} {'throughput':>11} {'p50':>9} {'p95':>9} {'p99':>9} {'rss':>9}")
+    for r in new["results"]:
+        o = old_results.get((r["endpoint"], r["concurrency"]))
+        if o is None:
+            continue
+        ol, nl = o.get("latency") or {}, r.get("latency") or {}
+        print(f"{r['endpoint']:<14} {r['concurrency']:>3} {_delta(o['throughput_rps'], r['throughput_rps']):>11} "
+              f"{_delta(ol.get('p50'), nl.get('p50')):>9} {_delta(ol.get('p95'), nl.get('p95')):>9} "
+              f"{_delta(ol.get('p99'), nl.get('p99')):>9} {_delta(o['peak_rss_mb'], r['peak_rss_mb']):>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS),
+                        type=lambda s: [e for e in s.split(",") if e])
+    parser.add_argument("--concurrency", default="1,2,4,8", type=lambda s: [int(c) for c in s.split(",")])
+    parser.add_argument("--requests", type=int, default=16, help="Requests per concurrency level")
+    parser.add_argument("--transcript-words", type=int, default=1500)
+    parser.add_argument("--audio-seconds", type=float, default=30.0)
+    parser.add_argument("--batch-files", type=int, default=4, help="Files per batch transcription request")
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--first-token-delay", type=float, default=0.2)
+    parser.add_argument("--model", default="llama3")
+    parser.add_argument("--whisper-model", default="tiny")
+    parser.add_argument("--report-mode", default="auto", choices=["auto", "single", "mapreduce", "sections"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    unknown = set(args.endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Server Ollama finto per i benchmark: risponde a /api/generate (anche in
+streaming NDJSON), /api/tags e /api/ps con token predefiniti emessi a una
+velocità configurabile, così che le misure non dipendano dal modello reale.
+Con --parallel le generazioni oltre quel numero attendono uno slot libero
+(come OLLAMA_NUM_PARALLEL); con --fail-status falliscono con quel codice
+HTTP (per provare il failover tra istanze).
+
+Uso: python benchmarks/stub_ollama.py [--port 11500] [--tokens-per-second 50] [--tokens 200] [--fail-status 503]
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CANNED_TEXT = (
+    "## Introduzione\n\nL'esperimento ha misurato la variazione del pH della soluzione durante il "
+    "riscaldamento. ## Materiali e Metodi\n\nSono stati utilizzati un elettrodo calibrato, un "
+    "termometro digitale e una piastra riscaldante. ## Risultati\n\nIl pH è diminuito in modo "
+    "costante con l'aumento della temperatura. ## Conclusioni\n\nI dati confermano l'ipotesi iniziale. "
+)
+
+
+def canned_tokens(count):
+    words = CANNED_TEXT.split(" ")
+    return [words[i % len(words)] + " " for i in range(count)]
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        model = self.server.model
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": model, "size": 4 * 1024**3}]})
+        elif self.path == "/api/ps":
+            self._send_json({"models": [{"name": model, "size": 4 * 1024**3, "size_vram": 0}]})
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if self.path != "/api/generate":
+            self._send_json({"error": "not found"}, 404)
+            return
+
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.in_flight += 1
+            self.server.max_in_flight = max(self.server.max_in_flight, self.server.in_flight)
+        try:
+            if self.server.slots is None:
+                self._generate(request)
+            else:
+                with self.server.slots:
+                    self._generate(request)
+        finally:
+            with self.server.lock:
+                self.server.in_flight -= 1
+
+    def _generate(self, request):
+        if self.server.fail_status:
+            self._send_json({"error": "stub failure"}, self.server.fail_status)
+            return
+        tokens = canned_tokens(self.server.tokens)
+        delay = 1.0 / self.server.tokens_per_second if self.server.tokens_per_second > 0 else 0.0
+        time.sleep(self.server.first_token_delay)
+
+        if not request.get("stream", True):
+            time.sleep(delay * len(tokens))
+            self._send_json({"model": request.get("model"), "response": "".join(tokens), "done": True})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for token in tokens:
+                self._write_chunk({"model": request.get("model"), "response": token, "done": False})
+                time.sleep(delay)
+            self._write_chunk({"model": request.get("model"), "response": "", "done": True})
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # Il client ha chiuso la connessione: la generazione si interrompe
+            pass
+
+    def _write_chunk(self, payload):
+        data = json.dumps(payload).encode("utf-8") + b"\n"
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+class StubOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, tokens=200, tokens_per_second=50.0, first_token_delay=0.2, model="llama3",
+                 fail_status=None, parallel=0):
+        super().__init__(("127.0.0.1", port), StubOllamaHandler)
+        self.tokens = tokens
+        self.tokens_per_second = tokens_per_second
+        self.first_token_delay = first_token_delay
+        self.model = model
+        self.fail_status = fail_status
+        self.slots = threading.BoundedSemaphore(parallel) if parallel > 0 else None
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def handle_error(self, request, client_address):
+        # Connessioni chiuse dal client (es. risposta d'errore scartata): non è un errore del server
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, name="stub-ollama", daemon=True)
+        thread.start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--first-token-delay", type=float, default=0.2)
+    parser.add_argument("--model", default="llama3")
+    parser.add_argument("--fail-status", type=int, help="Answer every generation with this HTTP status")
+    parser.add_argument("--parallel", type=int, default=0, help="Concurrent generations (0 = unlimited)")
+    args = parser.parse_args()
+
+    server = StubOllamaServer(args.port, args.tokens, args.tokens_per_second, args.first_token_delay, args.model,
+                              args.fail_status, args.parallel)
+    print(f"Stub Ollama listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Dati sintetici per i benchmark: audio con segmenti "parlati" separati da
+pause e trascrizioni in italiano con parole di riempimento.
+"""
+import random
+import wave
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+ITALIAN_WORDS = [
+    "la", "soluzione", "viene", "scaldata", "a", "ottanta", "gradi", "per", "dieci", "minuti",
+    "il", "campione", "mostra", "una", "variazione", "di", "colore", "misuriamo", "pH", "con",
+    "elettrodo", "calibrato", "temperatura", "aumenta", "lentamente", "e", "poi", "registriamo",
+    "valore", "ogni", "trenta", "secondi", "risultati", "confermano", "ipotesi", "iniziale"
+]
+FILLERS = ["ehm", "allora", "cioè", "ecco", "quindi", "vediamo un attimo", "in pratica", "va bene"]
+
+
+def synthetic_transcript(words, seed=0, filler_ratio=0.08):
+    """
+    Trascrizione sintetica di circa `words` parole, divisa in frasi.
+    """
+    rng = random.Random(seed)
+    sentences = []
+    sentence = []
+    for _ in range(words):
+        sentence.append(rng.choice(FILLERS) if rng.random() < filler_ratio else rng.choice(ITALIAN_WORDS))
+        if len(sentence) >= rng.randint(8, 20):
+            sentences.append(" ".join(sentence).capitalize() + rng.choice([".", ".", ",", "?"]))
+            sentence = []
+    if sentence:
+        sentences.append(" ".join(sentence).capitalize() + ".")
+    return " ".join(sentences)
+
+
+def synthetic_audio(seconds, seed=0, sample_rate=SAMPLE_RATE):
+    """
+    Audio sintetico (float32): toni armonici modulati che imitano il parlato,
+    alternati a pause con rumore di fondo.
+    """
+    rng = np.random.default_rng(seed)
+    total = int(seconds * sample_rate)
+    audio = rng.normal(0, 0.003, total).astype(np.float32)
+    pos = 0
+    while pos < total:
+        length = int(rng.uniform(1.0, 4.0) * sample_rate)
+        end = min(total, pos + length)
+        t = np.arange(end - pos) / sample_rate
+        pitch = rng.uniform(100, 220) * (1 + 0.1 * np.sin(2 * np.pi * rng.uniform(2, 5) * t))
+        phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+        voice = sum(np.sin(k * phase) / k for k in range(1, 6))
+        envelope = 0.5 * (1 + np.sin(2 * np.pi * rng.uniform(3, 6) * t))
+        audio[pos:end] += (0.2 * voice * envelope).astype(np.float32)
+        pos = end + int(rng.uniform(0.3, 1.2) * sample_rate)
+    return np.clip(audio, -1.0, 1.0)
+
+
+def write_wav(path, audio, sample_rate=SAMPLE_RATE):
+    pcm = (audio * 32767).astype("<i2")
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(pcm.tobytes())
+    return path
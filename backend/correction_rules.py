@@ -0,0 +1,97 @@
+import re
+
+DEFAULT_STYLE = "default"
+
+# Termini colloquiali e relativi sostituti formali (stile accademico)
+FORMAL_REPLACEMENTS = {
+    "cosa": "ciò che",
+    "c'è": "vi è",
+    "però": "tuttavia",
+    "insomma": "in conclusione",
+    "un sacco di": "numerosi",
+    "tanto": "considerevolmente",
+    "per cui": "pertanto",
+    "cioè": "ovvero",
+}
+
+
+class Rule:
+    """
+    Sostituzione con un'espressione regolare compilata una sola volta.
+    """
+
+    def __init__(self, pattern, replacement, flags=0):
+        self.regex = re.compile(pattern, flags)
+        self.replacement = replacement
+
+    def apply(self, text):
+        return self.regex.sub(self.replacement, text)
+
+
+class ReplacementTable(Rule):
+    """
+    Più sostituzioni di parole in un'unica passata: le chiavi vengono unite
+    in una sola alternativa (le più lunghe per prime) e il sostituto viene
+    scelto con una ricerca nel dizionario.
+    """
+
+    def __init__(self, replacements, flags=re.IGNORECASE):
+        self.replacements = {k.lower(): v for k, v in replacements.items()}
+        keys = sorted(self.replacements, key=lambda k: (-len(k), k))
+        pattern = r"\b(?:" + "|".join(re.escape(k) for k in keys) + r")\b"
+        super().__init__(pattern, self._lookup, flags)
+
+    def _lookup(self, match):
+        return self.replacements[match.group().lower()]
+
+
+class RuleSet:
+    """
+    Sequenza ordinata di regole applicate una dopo l'altra.
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+
+    def apply(self, text):
+        for rule in self.rules:
+            text = rule.apply(text)
+        return text
+
+
+# Regole comuni a tutti gli stili, nell'ordine in cui vanno applicate.
+# I pattern iniziano con un carattere letterale quando possibile: il motore
+# salta così direttamente alle posizioni candidate invece di provare il
+# pattern su ogni carattere del testo.
+BASE_RULES = [
+    Rule(r"i(?<!\wi)\b", "I"),  # "i" pronome personale (equivale a \bi\b)
+    Rule(r"\s+(?=[.,;:!?])", ""),  # Spazi prima della punteggiatura
+    # Spazi doppi: si toccano solo le sequenze da modificare, non ogni spazio
+    Rule(r"\s{2,}|[^\S ]", " "),
+    Rule(r"([.,;:!?])([^\s\d])", r"\1 \2"),  # Spazio dopo la punteggiatura
+    # Virgole e 'e' per migliorare la leggibilità (equivale a \b(e|ed)\b)
+    Rule(r"e(?<!\we)d?\b", ", e"),
+    Rule(r", e, e", ", e"),
+    Rule(r", , ", ", "),
+]
+
+RULE_SETS = {
+    DEFAULT_STYLE: RuleSet(BASE_RULES),
+    "academic": RuleSet(BASE_RULES + [ReplacementTable(FORMAL_REPLACEMENTS)]),
+}
+
+
+def get_rule_set(style=None):
+    return RULE_SETS.get(style or DEFAULT_STYLE, RULE_SETS[DEFAULT_STYLE])
+
+
+def correct_text_locally(text, style):
+    """
+    Correzione del testo basata su regole, usata quando Ollama non è disponibile.
+    """
+    # Prima lettera maiuscola e punto finale se manca
+    corrected_text = text[0].upper() + text[1:] if text else ""
+    if corrected_text and not corrected_text.rstrip().endswith(('.', '!', '?')):
+        corrected_text = corrected_text.rstrip() + '.'
+
+    return get_rule_set(style).apply(corrected_text)
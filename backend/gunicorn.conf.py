@@ -0,0 +1,80 @@
+"""
+Configurazione di produzione (gunicorn) per il backend:
+
+    cd backend && gunicorn -c gunicorn.conf.py
+
+Per servire l'app di prova: gunicorn -c gunicorn.conf.py working_app:app
+Il server di sviluppo (python app.py) resta solo per l'uso in locale.
+"""
+import gc
+import os
+import sys
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+wsgi_app = os.getenv("GUNICORN_APP", "app:app")
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '5000')}"
+
+# Ogni worker ha la propria coda di trascrizione, le sessioni in streaming e
+# lo stato dei job in memoria: con più worker il polling di un job può
+# arrivare a un processo diverso, quindi serve un bilanciatore con affinità
+# di sessione davanti a gunicorn
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+# I thread servono le richieste lunghe (SSE, attese sui job) senza bloccare le altre
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "16"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+# Tempo concesso ai worker per completare le richieste e i job di trascrizione in corso
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "900"))
+
+# L'app (e il modello Whisper) viene caricata una sola volta nel master prima del fork
+preload_app = True
+PRELOAD_WHISPER = os.getenv("PRELOAD_WHISPER", "true").lower() == "true"
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-")
+errorlog = "-"
+
+
+def when_ready(server):
+    from warmup import warmup
+
+    # Nessun import in corso in un altro thread al momento del fork
+    warmup.wait()
+    # L'indice di ricerca (solo in app.py) viene ereditato dai worker: deve essere completo
+    app_module = sys.modules.get("app")
+    if app_module is not None and getattr(app_module, "search_index", None) is not None:
+        app_module.search_index.wait()
+    if PRELOAD_WHISPER:
+        import torch
+        from model_manager import whisper_pool
+
+        if torch.cuda.is_available():
+            # CUDA non può essere inizializzato prima del fork: ogni worker carica il proprio modello
+            server.log.info("CUDA available: Whisper is loaded by each worker on first use")
+        else:
+            model_size = os.getenv("WHISPER_MODEL_SIZE", "medium")
+            server.log.info(f"Preloading Whisper '{model_size}' before forking workers")
+            whisper_pool.preload(model_size, device="cpu")
+    # Gli oggetti già creati non vengono più toccati dal garbage collector:
+    # le pagine restano condivise tra i worker invece di essere copiate
+    gc.freeze()
+
+
+def worker_exit(server, worker):
+    from job_queue import transcription_queue
+    from long_audio import shutdown_process_pool
+
+    # Arresto ordinato: le richieste in corso sono già terminate, ora i job in coda.
+    # Il master uccide i worker senza heartbeat da più di `timeout` secondi
+    # (anche quelli vecchi durante un riavvio con HUP): l'attesa, che può
+    # durare fino a graceful_timeout, lo aggiorna più spesso
+    drain_timeout = max(0, graceful_timeout - 10)
+    drained = transcription_queue.drain(timeout=drain_timeout, heartbeat=worker.notify,
+                                        interval=max(1, timeout // 4))
+    if not drained:
+        server.log.warning("Transcription jobs still running at shutdown")
+    # Con job ancora in corso il pool di processi resta: si esce comunque
+    shutdown_process_pool(only_if_idle=not drained)
@@ -0,0 +1,227 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Numero massimo di trascrizioni eseguite contemporaneamente
+TRANSCRIPTION_WORKERS = int(os.getenv("TRANSCRIPTION_WORKERS", "1"))
+# Numero massimo di job in attesa oltre a quelli in esecuzione
+TRANSCRIPTION_MAX_QUEUED = int(os.getenv("TRANSCRIPTION_MAX_QUEUED", "8"))
+# Secondi per cui i risultati dei job terminati restano disponibili
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "3600"))
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+class QueueFullError(Exception):
+    """
+    Sollevata quando il pool è saturo e la coda di attesa è piena.
+    """
+
+    def __init__(self, retry_after):
+        super().__init__("Transcription queue is full, retry later")
+        self.retry_after = retry_after
+
+
+class Job:
+    def __init__(self, kind):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        # Incrementata a ogni cambio di stato, usata da chi attende aggiornamenti
+        self.version = 0
+
+    @property
+    def done(self):
+        return self.status in (COMPLETED, FAILED)
+
+    def to_dict(self, include_result=False):
+        data = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+        if self.status == FAILED:
+            data["error"] = self.error
+        if include_result and self.status == COMPLETED:
+            data["result"] = self.result
+        return data
+
+
+class JobQueue:
+    """
+    Coda di job con un pool di worker limitato e contropressione: oltre
+    `max_workers` job in esecuzione e `max_queued` in attesa, le nuove
+    richieste vengono rifiutate con QueueFullError.
+    """
+
+    def __init__(self, max_workers=TRANSCRIPTION_WORKERS, max_queued=TRANSCRIPTION_MAX_QUEUED,
+                 result_ttl=JOB_RESULT_TTL, name="transcription"):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self.name = name
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-worker")
+        self._cond = threading.Condition()
+        self._jobs = {}
+        self._active = 0
+        self._closed = False
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self._durations = []
+
+    def submit(self, fn, *args, kind="transcription", **kwargs):
+        """
+        Accoda `fn(*args, **kwargs)` e restituisce il Job creato.
+        """
+        with self._cond:
+            self._purge_expired()
+            # Una coda in chiusura rifiuta i nuovi job: il client riprova su un altro worker
+            if self._closed or self._active >= self.max_workers + self.max_queued:
+                self.rejected += 1
+                raise QueueFullError(self._estimate_wait())
+            job = Job(kind)
+            self._jobs[job.id] = job
+            self._active += 1
+
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        self._update(job, status=RUNNING, started_at=time.time())
+        try:
+            result = fn(*args, **kwargs)
+            self._update(job, status=COMPLETED, result=result)
+        except Exception as e:
+            print(f"Job {job.id} failed: {e}")
+            self._update(job, status=FAILED, error=str(e))
+
+    def _update(self, job, **fields):
+        with self._cond:
+            for name, value in fields.items():
+                setattr(job, name, value)
+            if job.done:
+                job.finished_at = time.time()
+                self._active -= 1
+                if job.status == COMPLETED:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+                if job.started_at is not None:
+                    self._durations = (self._durations + [job.finished_at - job.started_at])[-20:]
+            job.version += 1
+            self._cond.notify_all()
+
+    def get(self, job_id):
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def wait(self, job_id, timeout=None):
+        """
+        Attende il termine del job e lo restituisce.
+        """
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                self._cond.wait_for(lambda: job.done, timeout=timeout)
+            return job
+
+    def wait_for_update(self, job_id, version, timeout=None):
+        """
+        Attende che la versione del job superi `version` (o il timeout).
+        """
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                self._cond.wait_for(lambda: job.version > version, timeout=timeout)
+            return job
+
+    def position(self, job_id):
+        """
+        Posizione del job nella coda di attesa (0 se in esecuzione o terminato).
+        """
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.status != QUEUED:
+                return 0
+            return sum(1 for j in self._jobs.values()
+                       if j.status == QUEUED and j.created_at <= job.created_at)
+
+    def _estimate_wait(self):
+        average = sum(self._durations) / len(self._durations) if self._durations else 30.0
+        return max(1, int(average * (self._active - self.max_workers + 1) / self.max_workers))
+
+    def _purge_expired(self):
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.done and now - job.finished_at > self.result_ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def depth(self):
+        """
+        Numero di job in attesa e in esecuzione.
+        """
+        with self._cond:
+            running = sum(1 for j in self._jobs.values() if j.status == RUNNING)
+            queued = sum(1 for j in self._jobs.values() if j.status == QUEUED)
+            return {"running": running, "queued": queued}
+
+    def stats(self):
+        depth = self.depth()
+        with self._cond:
+            return {
+                **depth,
+                "max_workers": self.max_workers,
+                "max_queued": self.max_queued,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected
+            }
+
+    def drain(self, timeout=None, heartbeat=None, interval=10):
+        """
+        Smette di accettare nuovi job e attende la fine di quelli in esecuzione
+        e in attesa (arresto ordinato). Restituisce True se sono tutti terminati
+        entro `timeout` secondi. `heartbeat`, se indicata, viene chiamata ogni
+        `interval` secondi durante l'attesa.
+        """
+        with self._cond:
+            self._closed = True
+            pending = self._active
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if heartbeat is not None:
+                heartbeat()
+            remaining = None if deadline is None else deadline - time.monotonic()
+            step = interval if heartbeat is not None else None
+            if remaining is not None:
+                step = max(0.0, remaining if step is None else min(step, remaining))
+            with self._cond:
+                drained = self._cond.wait_for(lambda: self._active == 0, timeout=step)
+            if drained or (remaining is not None and remaining <= step):
+                break
+        if pending:
+            print(f"Drained {self.name} queue: {pending - self._active}/{pending} jobs finished")
+        self.shutdown(wait=drained)
+        return drained
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+# Coda condivisa per le trascrizioni
+transcription_queue = JobQueue()
@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# Durata (secondi) delle risposte in cache e limiti di dimensione
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000"))
+
+HIT = "hit"
+MISS = "miss"
+COALESCED = "coalesced"
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    """
+    Normalizza il testo per la chiave della cache: differenze di soli spazi
+    e a capo non devono generare una nuova richiesta all'LLM.
+    """
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def llm_cache_key(kind, model, template_id, text, options=None):
+    payload = json.dumps({
+        "kind": kind,
+        "model": model,
+        "template": template_id,
+        "text": normalize_text(text),
+        "options": options or {}
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Cache in memoria delle risposte dell'LLM con scadenza (TTL) ed eviction
+    LRU per dimensione. Le richieste identiche contemporanee condividono
+    un'unica generazione in corso invece di accodarsi sulla GPU
+    (get_or_compute).
+
+    Le generazioni in streaming usano get e put: non vengono unite a quelle
+    in corso, perché ogni client deve ricevere i propri token man mano.
+    """
+
+    def __init__(self, ttl=LLM_CACHE_TTL, max_bytes=LLM_CACHE_MAX_BYTES, max_entries=LLM_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # chiave -> (scadenza, valore, dimensione)
+        self._in_flight = {}
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return value
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value, _ = entry
+        if time.monotonic() >= expires_at:
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, value, size)
+            self._total_bytes += size
+            while self._total_bytes > self.max_bytes or len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= entry[2]
+
+    def get_or_compute(self, key, compute):
+        """
+        Restituisce (valore, esito) dove esito è "hit", "miss" o "coalesced".
+        Le eccezioni di `compute` vengono propagate a tutti i chiamanti in
+        attesa e non vengono memorizzate.
+        """
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                self.hits += 1
+                return value, HIT
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                owner = False
+            else:
+                self.misses += 1
+                future = Future()
+                self._in_flight[key] = future
+                owner = True
+
+        if not owner:
+            return future.result(), COALESCED
+
+        try:
+            value = compute()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            self.put(key, value)
+            future.set_result(value)
+            return value, MISS
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "hit_rate": round((self.hits + self.coalesced) / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "in_flight": len(self._in_flight)
+            }
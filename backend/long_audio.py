@@ -0,0 +1,242 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+
+from audio_io import SAMPLE_RATE
+
+# Durata (secondi) oltre la quale in modalità "auto" si usa la trascrizione a blocchi
+LONG_AUDIO_THRESHOLD = float(os.getenv("LONG_AUDIO_THRESHOLD", "600"))
+# Lunghezza desiderata e massima dei blocchi (secondi)
+LONG_AUDIO_TARGET_CHUNK = float(os.getenv("LONG_AUDIO_TARGET_CHUNK", "60"))
+LONG_AUDIO_MAX_CHUNK = float(os.getenv("LONG_AUDIO_MAX_CHUNK", "120"))
+# Numero di processi per la trascrizione parallela su CPU
+LONG_AUDIO_WORKERS = int(os.getenv("LONG_AUDIO_WORKERS", str(max(1, (os.cpu_count() or 2) // 4))))
+
+
+def frame_energy_db(audio, sample_rate=SAMPLE_RATE, frame_ms=30):
+    """
+    Energia RMS (in dB) per frame di `frame_ms` millisecondi.
+    """
+    frame = int(sample_rate * frame_ms / 1000)
+    n_frames = len(audio) // frame
+    if n_frames == 0:
+        return np.zeros(0, dtype=np.float32), frame
+    frames = audio[:n_frames * frame].reshape(n_frames, frame)
+    rms = np.sqrt(np.mean(frames.astype(np.float32) ** 2, axis=1))
+    return 20 * np.log10(rms + 1e-10), frame
+
+
+def detect_silences(audio, sample_rate=SAMPLE_RATE, frame_ms=30, min_silence_ms=400, margin_db=10.0):
+    """
+    Rileva i tratti di silenzio con un semplice VAD a soglia di energia.
+    La soglia si adatta al rumore di fondo della registrazione (5° percentile
+    dell'energia più `margin_db`), senza superare il punto medio tra rumore e
+    parlato. Restituisce (lista di (inizio, fine) in campioni, soglia in dB).
+    """
+    db, frame = frame_energy_db(audio, sample_rate, frame_ms)
+    if len(db) == 0:
+        return [], -100.0
+
+    floor, peak = np.percentile(db, [5, 95])
+    threshold = float(min(floor + margin_db, (floor + peak) / 2))
+    silent = db < threshold
+    min_frames = max(1, int(min_silence_ms / frame_ms))
+
+    # Individua le sequenze consecutive di frame silenziosi
+    padded = np.concatenate(([False], silent, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    starts, ends = edges[0::2], edges[1::2]
+
+    silences = [(int(s) * frame, int(e) * frame)
+                for s, e in zip(starts, ends) if e - s >= min_frames]
+    return silences, threshold
+
+
+def split_on_silence(audio, sample_rate=SAMPLE_RATE, target_chunk=LONG_AUDIO_TARGET_CHUNK,
+                     max_chunk=LONG_AUDIO_MAX_CHUNK, min_silence_ms=400):
+    """
+    Divide l'audio in blocchi tagliando al centro dei silenzi, cercando di
+    avvicinarsi a `target_chunk` secondi senza superare `max_chunk`.
+    I blocchi composti solo da silenzio vengono scartati.
+    Restituisce una lista di (inizio, fine) in campioni.
+    """
+    total = len(audio)
+    max_len = int(max_chunk * sample_rate)
+    target_len = int(target_chunk * sample_rate)
+    min_len = min(target_len, max_len) // 2
+
+    if total <= max_len:
+        return [(0, total)] if total else []
+
+    silences, threshold = detect_silences(audio, sample_rate, min_silence_ms=min_silence_ms)
+    cut_points = np.array([(s + e) // 2 for s, e in silences], dtype=np.int64)
+
+    boundaries = [0]
+    position = 0
+    while total - position > max_len:
+        lo, hi = position + min_len, position + max_len
+        candidates = cut_points[(cut_points >= lo) & (cut_points <= hi)]
+        if len(candidates):
+            cut = int(candidates[np.argmin(np.abs(candidates - (position + target_len)))])
+        else:
+            # Nessun silenzio utile: taglio netto alla lunghezza massima
+            cut = hi
+        boundaries.append(cut)
+        position = cut
+    boundaries.append(total)
+
+    chunks = []
+    for start, end in zip(boundaries[:-1], boundaries[1:]):
+        db, _ = frame_energy_db(audio[start:end], sample_rate)
+        if len(db) and db.max() < threshold:
+            continue
+        chunks.append((start, end))
+    return chunks
+
+
+# Stato dei processi worker: ogni processo carica il proprio modello una sola volta
+_worker_model = None
+
+
+def _init_worker(model_size, threads):
+    global _worker_model
+    import torch
+    from memory_utils import load_whisper_model
+
+    torch.set_num_threads(threads)
+    model, loaded_size = load_whisper_model(model_size, device="cpu")
+    # Il pool è associato a `model_size`: un modello più piccolo caricato al
+    # suo posto produrrebbe trascrizioni attribuite alla dimensione sbagliata
+    _worker_model = model if loaded_size == model_size else None
+
+
+def _transcribe_chunk(index, offset, chunk, options):
+    if _worker_model is None:
+        raise RuntimeError("Failed to load Whisper model in worker process")
+    result = _worker_model.transcribe(chunk, **options)
+    return index, offset, result
+
+
+def stitch_results(results, sample_rate=SAMPLE_RATE):
+    """
+    Ricompone i risultati dei blocchi in ordine, correggendo i timestamp
+    dei segmenti con l'offset di ciascun blocco.
+    """
+    texts = []
+    segments = []
+    language = None
+    for index, offset, result in sorted(results, key=lambda r: r[0]):
+        offset_seconds = offset / sample_rate
+        text = result.get("text", "").strip()
+        if text:
+            texts.append(text)
+        language = language or result.get("language")
+        for segment in result.get("segments", []):
+            segments.append({
+                "id": len(segments),
+                "start": round(segment["start"] + offset_seconds, 3),
+                "end": round(segment["end"] + offset_seconds, 3),
+                "text": segment["text"]
+            })
+    return {"text": " ".join(texts), "segments": segments, "language": language}
+
+
+_process_pool = None
+_process_pool_key = None
+# Trascrizioni che stanno usando il pool: non lo si può arrestare sotto di loro
+_process_pool_users = 0
+_process_pool_cond = threading.Condition()
+
+
+@contextmanager
+def _use_process_pool(model_size, workers, threads=None):
+    """
+    Pool di processi persistente: i modelli restano caricati nei worker tra
+    una richiesta e l'altra. `threads` (tutti i core se None) viene diviso tra
+    i processi. Un pool con parametri diversi viene sostituito solo quando
+    nessuna trascrizione lo sta usando.
+    """
+    global _process_pool, _process_pool_key, _process_pool_users
+    threads = max(1, (threads or os.cpu_count() or 1) // workers)
+    key = (model_size, workers, threads)
+    with _process_pool_cond:
+        _process_pool_cond.wait_for(lambda: _process_pool_key == key or _process_pool_users == 0)
+        if _process_pool is not None and _process_pool_key != key:
+            _process_pool.shutdown(wait=True)
+            _process_pool = None
+            _process_pool_key = None
+        if _process_pool is None:
+            print(f"Starting {workers} transcription processes ({threads} threads each) with Whisper '{model_size}'")
+            # "spawn" evita di duplicare con fork lo stato dei thread di Flask e di torch
+            context = multiprocessing.get_context("spawn")
+            _process_pool = ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                                initializer=_init_worker, initargs=(model_size, threads))
+            _process_pool_key = key
+        _process_pool_users += 1
+        pool = _process_pool
+    try:
+        yield pool
+    finally:
+        with _process_pool_cond:
+            _process_pool_users -= 1
+            _process_pool_cond.notify_all()
+
+
+def process_pool_stats():
+    """
+    Modello e numero dei processi worker residenti (per lo scheduler delle
+    risorse), o None se il pool non è attivo.
+    """
+    with _process_pool_cond:
+        if _process_pool is None:
+            return None
+        model_size, workers, threads = _process_pool_key
+        return {"model_size": model_size, "workers": workers, "threads": threads, "in_use": _process_pool_users}
+
+
+def shutdown_process_pool(only_if_idle=False):
+    """
+    Arresta il pool di processi, liberando i modelli dei worker, dopo le
+    trascrizioni in corso. Con `only_if_idle` non attende: restituisce False
+    se il pool è in uso.
+    """
+    global _process_pool, _process_pool_key
+    with _process_pool_cond:
+        if only_if_idle and _process_pool_users:
+            return False
+        _process_pool_cond.wait_for(lambda: _process_pool_users == 0)
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=True)
+            _process_pool = None
+            _process_pool_key = None
+        return True
+
+
+def transcribe_long_audio(audio, model_size, device="cpu", model=None, workers=LONG_AUDIO_WORKERS,
+                          options=None, sample_rate=SAMPLE_RATE, threads=None):
+    """
+    Trascrive un audio lungo dividendolo sui silenzi. Su CPU i blocchi vengono
+    trascritti in parallelo in un pool di processi, che si dividono `threads`
+    thread; su GPU in sequenza con il modello `model` già residente (una sola
+    GPU non beneficia di più processi).
+    """
+    options = dict(options or {})
+    chunks = split_on_silence(audio, sample_rate)
+    print(f"Long audio mode: {len(audio) / sample_rate:.0f}s split into {len(chunks)} chunks")
+
+    sequential = device != "cpu" or workers <= 1 or len(chunks) <= 1
+    if sequential and model is None and device != "cpu":
+        raise RuntimeError("A loaded Whisper model is required for GPU transcription")
+    if sequential and model is not None:
+        results = [(i, start, model.transcribe(audio[start:end], **options))
+                   for i, (start, end) in enumerate(chunks)]
+        return stitch_results(results, sample_rate)
+
+    with _use_process_pool(model_size, max(1, workers), threads) as pool:
+        futures = [pool.submit(_transcribe_chunk, i, start, audio[start:end], options)
+                   for i, (start, end) in enumerate(chunks)]
+        return stitch_results([f.result() for f in futures], sample_rate)
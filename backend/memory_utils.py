@@ -1,11 +1,32 @@
 import gc
-import torch
 import os
 
+from warmup import default_device, torch_loaded
+import whisper_backends
+
+# Memoria stimata (GB) dei modelli Whisper, dai requisiti pubblicati da OpenAI
+WHISPER_MEMORY_GB = {
+    "tiny": 1.0,
+    "base": 1.0,
+    "small": 2.0,
+    "medium": 5.0,
+    "turbo": 6.0,
+    "large": 10.0
+}
+# Memoria stimata dell'LLM quando Ollama non la riporta (0 se Ollama è su un'altra macchina)
+LLM_MEMORY_GB = float(os.getenv("LLM_MEMORY_GB", "5"))
+# Frazione della memoria del dispositivo utilizzabile dai modelli
+MEMORY_HEADROOM = float(os.getenv("MEMORY_HEADROOM", "0.9"))
+
 def check_gpu_memory():
     """
     Verifica la memoria GPU disponibile e restituisce un report.
+    Se torch non è ancora stato importato (warm-up in corso) non lo importa.
     """
+    if not torch_loaded():
+        return {"gpu": "N/A", "torch_cuda_available": None}
+    import torch
+    
     gpu_info = "N/A"
     if torch.cuda.is_available():
         try:
@@ -36,6 +57,8 @@ def free_gpu_memory():
     """
     Libera il più possibile la memoria GPU.
     """
+    import torch
+    
     if torch.cuda.is_available():
         print("Clearing CUDA cache to free up memory...")
         torch.cuda.empty_cache()
@@ -48,6 +71,8 @@ def offload_model(model):
     """
     Scarica un modello PyTorch dalla memoria.
     """
+    import torch
+    
     try:
         # Sposta modello su CPU prima
         if hasattr(model, 'to'):
@@ -66,11 +91,24 @@ def offload_model(model):
         print(f"Error offloading model: {e}")
         return False
 
-def load_whisper_model(model_size="medium"):
+def get_memory_usage_ratio(device=None):
     """
-    Carica un modello Whisper nella dimensione specificata.
+    Restituisce la frazione di memoria occupata (0.0 - 1.0) sul dispositivo indicato.
+    Per la GPU usa i valori del driver CUDA, per la CPU /proc/meminfo.
     """
-    import whisper
+    free, total = get_device_memory_gb(device)
+    # Sistemi senza informazioni affidabili (es. macOS senza /proc): 0.0
+    return 1.0 - (free / total) if total else 0.0
+
+def load_whisper_model(model_size="medium", device=None):
+    """
+    Carica un modello Whisper nella dimensione specificata, con il motore
+    scelto da WHISPER_BACKEND (vedi whisper_backends).
+    Se il caricamento fallisce prova con il modello "tiny": restituisce
+    (modello, dimensione effettivamente caricata), (None, model_size) se
+    nessun modello è stato caricato.
+    """
+    import torch
     
     # Forza la pulizia memoria prima di caricare il modello
     gc.collect()
@@ -78,32 +116,71 @@ def load_whisper_model(model_size="medium"):
         torch.cuda.empty_cache()
     
     # Controllo dispositivo
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    print(f"Loading Whisper '{model_size}' model on {device}...")
+    if device is None:
+        device = default_device()
+    backend = whisper_backends.get_backend()
+    print(f"Loading Whisper '{model_size}' model on {device} ({backend} backend)...")
     
     try:
         # Carica il modello con il device appropriato
-        model = whisper.load_model(model_size, device=device)
+        model = whisper_backends.load_model(model_size, device, backend)
         print(f"Whisper model loaded successfully on {device}")
-        return model
+        return model, model_size
     except Exception as e:
         print(f"Error loading Whisper model: {e}")
         # Prova a caricare un modello più piccolo in caso di errore
         if model_size != "tiny":
             print("Trying to load a smaller model...")
-            return load_whisper_model("tiny")
-        return None
+            return load_whisper_model("tiny", device=device)
+        return None, model_size
 
-def is_enough_memory_for_both_models():
+def get_device_memory_gb(device=None):
+    """
+    Restituisce (libera, totale) in GB per il dispositivo indicato.
+    """
+    if device is None:
+        device = default_device()
+    
+    if device.startswith("cuda"):
+        import torch
+        if not torch.cuda.is_available():
+            return 0.0, 0.0
+        try:
+            free, total = torch.cuda.mem_get_info()
+            return free / (1024**3), total / (1024**3)
+        except Exception as e:
+            print(f"Error getting CUDA memory info: {e}")
+            return 0.0, 0.0
+    
+    try:
+        meminfo = {}
+        with open("/proc/meminfo") as f:
+            for line in f:
+                key, value = line.split(":", 1)
+                meminfo[key] = int(value.split()[0])
+        available = meminfo.get("MemAvailable", meminfo.get("MemFree", 0))
+        return available / (1024**2), meminfo.get("MemTotal", 0) / (1024**2)
+    except (OSError, ValueError):
+        return 0.0, 0.0
+
+def whisper_memory_gb(model_size):
+    """
+    Memoria stimata (GB) occupata da un modello Whisper della dimensione
+    indicata, ridotta per i motori quantizzati.
+    """
+    base_size = model_size.split(".")[0]
+    if base_size.startswith("large"):
+        base_size = "large"
+    return WHISPER_MEMORY_GB.get(base_size, WHISPER_MEMORY_GB["large"]) * whisper_backends.memory_factor()
+
+def is_enough_memory_for_both_models(whisper_size="medium", llm_gb=LLM_MEMORY_GB, device=None, other_gb=0.0):
     """
     Verifica se c'è abbastanza memoria per entrambi i modelli (Whisper e LLM)
+    in base alle occupazioni stimate, più `other_gb` già occupati da altri
+    modelli residenti.
     """
-    if not torch.cuda.is_available():
+    _, total = get_device_memory_gb(device)
+    if total <= 0:
         return False
     
-    memory_info = check_gpu_memory()
-    if isinstance(memory_info["gpu"], dict):
-        # Se c'è almeno 6GB liberi, dovrebbe essere sufficiente
-        return memory_info["gpu"]["free"] > 6.0
-    
-    return False
+    return whisper_memory_gb(whisper_size) + llm_gb + other_gb <= total * MEMORY_HEADROOM
@@ -0,0 +1,199 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Limiti superiori (secondi) dei bucket degli istogrammi di latenza
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        escaped.append(f'{name}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def expose(self):
+        with self._lock:
+            values = dict(self._values)
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                                for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series = {}  # etichette -> [conteggi per bucket, somma, conteggio]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """
+        Misura la durata del blocco (anche se solleva un'eccezione).
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def expose(self):
+        with self._lock:
+            series = {key: ([*counts], total, count) for key, (counts, total, count) in self._series.items()}
+        lines = self.header()
+        for key, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Gauge(_Metric):
+    """
+    Valore letto al momento dell'esposizione: `collect` restituisce un numero
+    oppure un dizionario {tupla di etichette: valore}. Con metric_type="counter"
+    espone contatori già mantenuti altrove (es. nelle statistiche di un componente).
+    """
+
+    def __init__(self, name, documentation, collect, labelnames=(), metric_type="gauge"):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+        self.type = metric_type
+
+    def expose(self):
+        values = self.collect()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                                for key, value in sorted(values.items())]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, collect, labelnames=(), metric_type="gauge"):
+        return self._register(Gauge(name, documentation, collect, labelnames, metric_type))
+
+    def render(self):
+        """
+        Tutte le metriche nel formato di esposizione testuale di Prometheus.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.expose())
+            except Exception as e:
+                # Una sorgente non disponibile non deve impedire l'esposizione delle altre
+                print(f"Error collecting metric {metric.name}: {e}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# Latenze per fase della pipeline
+UPLOAD_DECODE_SECONDS = registry.histogram(
+    "autolabo_upload_decode_seconds", "Time spent receiving and decoding an uploaded audio file")
+MODEL_LOAD_SECONDS = registry.histogram(
+    "autolabo_model_load_seconds", "Time spent loading a Whisper model", ["model", "device"])
+TRANSCRIBE_SECONDS = registry.histogram(
+    "autolabo_whisper_transcribe_seconds", "Whisper transcription time", ["model", "mode"])
+TRANSCRIBE_RTF = registry.histogram(
+    "autolabo_whisper_real_time_factor", "Transcription time divided by audio duration", ["profile"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5))
+CLEAN_SECONDS = registry.histogram(
+    "autolabo_clean_seconds", "Filler-word cleaning time", buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1))
+SEARCH_SECONDS = registry.histogram(
+    "autolabo_search_seconds", "Full-text search time", buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1))
+OLLAMA_TTFT_SECONDS = registry.histogram(
+    "autolabo_ollama_time_to_first_token_seconds", "Time until Ollama streams the first token", ["operation"])
+OLLAMA_GENERATION_SECONDS = registry.histogram(
+    "autolabo_ollama_generation_seconds", "Total time of successful Ollama generations", ["operation"])
+
+# Esito delle generazioni: "ollama" oppure fallback "local"
+GENERATION_METHOD_TOTAL = registry.counter(
+    "autolabo_generation_method_total", "Report and correction requests by generation method",
+    ["endpoint", "method"])
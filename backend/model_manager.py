@@ -0,0 +1,282 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from warmup import default_device
+from memory_utils import load_whisper_model, offload_model, free_gpu_memory, get_memory_usage_ratio
+from metrics import MODEL_LOAD_SECONDS
+
+# Secondi di inattività dopo i quali un modello Whisper viene scaricato
+WHISPER_IDLE_TIMEOUT = float(os.getenv("WHISPER_IDLE_TIMEOUT", "600"))
+# Frazione di memoria occupata oltre la quale si scaricano i modelli inattivi
+WHISPER_MEMORY_THRESHOLD = float(os.getenv("WHISPER_MEMORY_THRESHOLD", "0.90"))
+# Intervallo (secondi) tra due controlli del thread di pulizia
+WHISPER_EVICTION_INTERVAL = float(os.getenv("WHISPER_EVICTION_INTERVAL", "30"))
+
+
+class _PoolEntry:
+    def __init__(self, size, device):
+        self.size = size
+        self.device = device
+        self.model = None
+        self.in_use = 0
+        # Precaricato all'avvio: non viene scaricato per inattività
+        self.pinned = False
+        self.last_used = time.monotonic()
+        self.load_lock = threading.Lock()
+        # Un modello Whisper non può eseguire due trascrizioni in parallelo
+        # (gli hook della kv-cache sono installati sul modello condiviso)
+        self.use_lock = threading.Lock()
+
+
+class WhisperModelPool:
+    """
+    Mantiene residenti i modelli Whisper già caricati, indicizzati per
+    dimensione e dispositivo, invece di caricarli e scaricarli a ogni richiesta.
+
+    Un modello viene scaricato solo quando resta inutilizzato per più di
+    `idle_timeout` secondi oppure quando la memoria occupata supera
+    `memory_threshold`; i modelli in uso non vengono mai scaricati.
+    Ogni modello è usato da una richiesta alla volta: le altre attendono.
+    """
+
+    def __init__(self, idle_timeout=WHISPER_IDLE_TIMEOUT, memory_threshold=WHISPER_MEMORY_THRESHOLD,
+                 check_interval=WHISPER_EVICTION_INTERVAL):
+        self.idle_timeout = idle_timeout
+        self.memory_threshold = memory_threshold
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._reaper = None
+        self.hits = 0
+        self.misses = 0
+        self.idle_evictions = 0
+        self.pressure_evictions = 0
+
+    @contextmanager
+    def model(self, model_size="medium", device=None):
+        """
+        Restituisce (come context manager) la coppia (modello, dimensione) di
+        un modello Whisper residente, caricandolo solo se non è già in memoria.
+        La dimensione è quella del modello effettivamente caricato, "tiny" se
+        `model_size` non si carica; il modello è None se il caricamento fallisce.
+        """
+        entry = self._acquire(model_size, device)
+        try:
+            with entry.use_lock:
+                yield entry.model, entry.size
+        finally:
+            self._release(entry)
+
+    def _acquire(self, model_size, device):
+        if device is None:
+            device = default_device()
+        key = (model_size, device)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = _PoolEntry(model_size, device)
+                self._entries[key] = entry
+            entry.in_use += 1
+
+        self._ensure_reaper()
+
+        # Il caricamento avviene fuori dal lock globale: richieste per
+        # dimensioni diverse non si bloccano a vicenda
+        fallback = None
+        with entry.load_lock:
+            if entry.model is not None:
+                with self._lock:
+                    self.hits += 1
+            else:
+                with self._lock:
+                    self.misses += 1
+                # Prima di caricare un nuovo modello libera spazio se serve
+                self._evict_under_pressure(device)
+                fallback = self._load(entry)
+
+        if fallback is None:
+            return entry
+        # Caricato un modello più piccolo: la richiesta usa la sua voce
+        fallback_entry = self._adopt(*fallback, device)
+        self._release(entry)
+        return fallback_entry
+
+    def _load(self, entry):
+        """
+        Carica il modello di `entry` (con il suo load_lock acquisito). Se al
+        suo posto viene caricato un modello più piccolo non lo memorizza sotto
+        la dimensione richiesta e restituisce (modello, dimensione).
+        """
+        with MODEL_LOAD_SECONDS.time(model=entry.size, device=entry.device):
+            model, loaded_size = load_whisper_model(entry.size, device=entry.device)
+        if model is None or loaded_size == entry.size:
+            entry.model = model
+            return None
+        return model, loaded_size
+
+    def _adopt(self, model, model_size, device, pinned=False):
+        """
+        Registra (acquisito) un modello caricato al posto di un altro nella
+        voce della sua dimensione effettiva, se quella non ne ha già uno.
+        """
+        with self._lock:
+            entry = self._entries.get((model_size, device))
+            if entry is None:
+                entry = self._entries[(model_size, device)] = _PoolEntry(model_size, device)
+            entry.in_use += 1
+            entry.pinned = entry.pinned or pinned
+        with entry.load_lock:
+            if entry.model is None:
+                entry.model = model
+        return entry
+
+    def preload(self, model_size, device=None):
+        """
+        Carica un modello e lo mantiene residente anche quando resta inattivo.
+        Chiamato nel processo master prima del fork dei worker, i pesi restano
+        condivisi copy-on-write tra i processi invece di essere caricati da
+        ciascuno. Non avvia il thread di pulizia (i thread non sopravvivono al fork).
+        """
+        if device is None:
+            device = default_device()
+        with self._lock:
+            entry = self._entries.get((model_size, device))
+            if entry is None:
+                entry = self._entries[(model_size, device)] = _PoolEntry(model_size, device)
+            entry.pinned = True
+        with entry.load_lock:
+            fallback = self._load(entry) if entry.model is None else None
+        if fallback is not None:
+            # Si mantiene residente il modello effettivamente caricato, non la
+            # voce vuota della dimensione richiesta
+            with self._lock:
+                entry.pinned = False
+            self._release(self._adopt(*fallback, device, pinned=True))
+            return True
+        return entry.model is not None
+
+    def _release(self, entry):
+        with self._lock:
+            entry.in_use -= 1
+            entry.last_used = time.monotonic()
+
+    def _ensure_reaper(self):
+        if self._reaper is not None and self._reaper.is_alive():
+            return
+        with self._lock:
+            if self._reaper is not None and self._reaper.is_alive():
+                return
+            self._reaper = threading.Thread(target=self._reap_loop, name="whisper-pool-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(self.check_interval)
+            try:
+                self.evict_idle()
+                self._evict_under_pressure()
+            except Exception as e:
+                print(f"Error during Whisper pool eviction: {e}")
+
+    def _evictable(self, device=None):
+        """
+        Voci con un modello caricato e non in uso, dalla meno recente.
+        """
+        with self._lock:
+            entries = [e for e in self._entries.values()
+                       if e.model is not None and e.in_use == 0
+                       and (device is None or e.device == device)]
+        return sorted(entries, key=lambda e: e.last_used)
+
+    def evict_idle(self):
+        """
+        Scarica i modelli inattivi da più di `idle_timeout` secondi.
+        """
+        now = time.monotonic()
+        evicted = 0
+        for entry in self._evictable():
+            if entry.pinned:
+                continue
+            if now - entry.last_used >= self.idle_timeout and self._evict(entry, "idle"):
+                evicted += 1
+        return evicted
+
+    def _evict_under_pressure(self, device=None):
+        evicted = 0
+        for entry in self._evictable(device):
+            if get_memory_usage_ratio(entry.device) < self.memory_threshold:
+                break
+            if self._evict(entry, "pressure"):
+                evicted += 1
+        return evicted
+
+    def evict_all(self, device=None, keep=None):
+        """
+        Scarica tutti i modelli non in uso (es. quando serve memoria per l'LLM),
+        eventualmente solo su `device` e tranne la dimensione `keep`.
+        """
+        evicted = 0
+        for entry in self._evictable(device):
+            if entry.size == keep:
+                continue
+            if self._evict(entry, "pressure"):
+                evicted += 1
+        return evicted
+
+    def _evict(self, entry, reason):
+        # Non blocchiamo se il modello è in fase di caricamento
+        if not entry.load_lock.acquire(blocking=False):
+            return False
+        try:
+            with self._lock:
+                if entry.model is None or entry.in_use > 0:
+                    return False
+                model = entry.model
+                entry.model = None
+                if reason == "idle":
+                    self.idle_evictions += 1
+                else:
+                    self.pressure_evictions += 1
+            print(f"Evicting Whisper '{entry.size}' model from {entry.device} ({reason})")
+            offload_model(model)
+            del model
+            free_gpu_memory()
+            return True
+        finally:
+            entry.load_lock.release()
+
+    def is_loaded(self, model_size=None):
+        with self._lock:
+            return any(e.model is not None and (model_size is None or e.size == model_size)
+                       for e in self._entries.values())
+
+    def stats(self):
+        """
+        Contatori di hit/miss/eviction e stato dei modelli residenti.
+        """
+        now = time.monotonic()
+        with self._lock:
+            resident = [{
+                "size": e.size,
+                "device": e.device,
+                "in_use": e.in_use,
+                "pinned": e.pinned,
+                "idle_seconds": round(now - e.last_used, 1)
+            } for e in self._entries.values() if e.model is not None]
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.idle_evictions + self.pressure_evictions,
+                "idle_evictions": self.idle_evictions,
+                "pressure_evictions": self.pressure_evictions,
+                "resident": resident,
+                "idle_timeout": self.idle_timeout,
+                "memory_threshold": self.memory_threshold
+            }
+
+
+# Pool condiviso dall'applicazione
+whisper_pool = WhisperModelPool()
@@ -0,0 +1,293 @@
+import json
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import OLLAMA_TTFT_SECONDS, OLLAMA_GENERATION_SECONDS
+
+# Timeout (secondi) per operazione: connessione e lettura
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+OLLAMA_GENERATE_TIMEOUT = float(os.getenv("OLLAMA_GENERATE_TIMEOUT", "600"))
+# In streaming è l'intervallo massimo tra due frammenti ricevuti
+OLLAMA_READ_TIMEOUT = float(os.getenv("OLLAMA_READ_TIMEOUT", "300"))
+OLLAMA_STATUS_TIMEOUT = float(os.getenv("OLLAMA_STATUS_TIMEOUT", "5"))
+# Tentativi aggiuntivi per errori transitori e backoff esponenziale con jitter
+OLLAMA_MAX_RETRIES = int(os.getenv("OLLAMA_MAX_RETRIES", "2"))
+OLLAMA_BACKOFF_BASE = float(os.getenv("OLLAMA_BACKOFF_BASE", "0.5"))
+OLLAMA_BACKOFF_MAX = float(os.getenv("OLLAMA_BACKOFF_MAX", "5"))
+# Circuit breaker: errori consecutivi prima dell'apertura e durata dell'apertura
+OLLAMA_BREAKER_THRESHOLD = int(os.getenv("OLLAMA_BREAKER_THRESHOLD", "3"))
+OLLAMA_BREAKER_RESET = float(os.getenv("OLLAMA_BREAKER_RESET", "30"))
+OLLAMA_POOL_SIZE = int(os.getenv("OLLAMA_POOL_SIZE", "10"))
+
+# Risposte che indicano un problema temporaneo del server
+TRANSIENT_STATUS_CODES = {502, 503, 504}
+
+
+class OllamaError(Exception):
+    """
+    Ollama ha risposto con un errore: il chiamante può usare il fallback locale.
+    """
+
+
+class OllamaUnavailableError(OllamaError):
+    """
+    Ollama non è raggiungibile (tentativi esauriti o circuit breaker aperto).
+    """
+
+
+class CircuitBreaker:
+    """
+    Dopo `failure_threshold` errori consecutivi il circuito si apre e le
+    richieste falliscono subito per `reset_timeout` secondi; poi una sola
+    richiesta di prova decide se richiuderlo.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=OLLAMA_BREAKER_THRESHOLD, reset_timeout=OLLAMA_BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.times_opened = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow_request(self):
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = False
+            # Mezzo aperto: passa una sola richiesta di prova
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.times_opened += 1
+                    print(f"Ollama circuit breaker opened after {self._failures} failures")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class OllamaClient:
+    """
+    Client condiviso per Ollama: sessione HTTP con connessioni persistenti,
+    timeout per operazione, nuovi tentativi con backoff e circuit breaker.
+    """
+
+    def __init__(self, base_url, model, pool_size=OLLAMA_POOL_SIZE, max_retries=OLLAMA_MAX_RETRIES,
+                 breaker=None):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+        self.timeouts = {
+            "generate": (OLLAMA_CONNECT_TIMEOUT, OLLAMA_GENERATE_TIMEOUT),
+            "stream": (OLLAMA_CONNECT_TIMEOUT, OLLAMA_READ_TIMEOUT),
+            "status": (OLLAMA_CONNECT_TIMEOUT, OLLAMA_STATUS_TIMEOUT)
+        }
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.short_circuited = 0
+        # Controlli di stato (operazione "status"): contati a parte, così i
+        # totali delle generazioni non dipendono dalla frequenza dei controlli
+        self.probe_requests = 0
+        self.probe_retries = 0
+        self.probe_failures = 0
+        self.probe_short_circuited = 0
+
+    def _backoff(self, attempt):
+        # "Full jitter": attesa casuale tra 0 e il limite esponenziale
+        return random.uniform(0, min(OLLAMA_BACKOFF_MAX, OLLAMA_BACKOFF_BASE * (2 ** attempt)))
+
+    def _count(self, name, operation=None):
+        if operation == "status":
+            name = f"probe_{name}"
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def request(self, method, path, operation="generate", retry_read_timeout=False, **kwargs):
+        """
+        Esegue una richiesta verso Ollama. Gli errori di connessione e le
+        risposte 502/503/504 vengono ritentati; un timeout di lettura viene
+        ritentato solo se `retry_read_timeout` (una generazione lunga non va
+        ripetuta). Solleva OllamaUnavailableError se Ollama non è raggiungibile.
+        """
+        if not self.breaker.allow_request():
+            self._count("short_circuited", operation)
+            raise OllamaUnavailableError("Ollama circuit breaker is open")
+
+        self._count("requests", operation)
+        url = f"{self.base_url}{path}"
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                self._count("retries", operation)
+                time.sleep(self._backoff(attempt - 1))
+            try:
+                response = self.session.request(method, url, timeout=self.timeouts[operation], **kwargs)
+            except (requests.ConnectionError, requests.exceptions.ConnectTimeout) as e:
+                last_error = e
+                continue
+            except requests.exceptions.ReadTimeout as e:
+                last_error = e
+                if retry_read_timeout:
+                    continue
+                break
+            except requests.RequestException as e:
+                # Altri errori (es. risposta malformata): non si ritenta, ma
+                # contano per il circuit breaker (e liberano la richiesta di prova)
+                last_error = e
+                break
+
+            if response.status_code in TRANSIENT_STATUS_CODES:
+                last_error = OllamaError(f"Ollama API error {response.status_code}: {response.text}")
+                response.close()
+                continue
+
+            self.breaker.record_success()
+            return response
+
+        self._record_failure(operation)
+        raise OllamaUnavailableError(str(last_error))
+
+    def _record_failure(self, operation):
+        self._count("failures", operation)
+        self.breaker.record_failure()
+
+    def generate(self, prompt, options=None, operation="generate"):
+        """
+        Generazione completa (non in streaming). Restituisce il testo generato.
+        """
+        start = time.perf_counter()
+        response = self.request("POST", "/api/generate", operation=operation, json={
+            "model": self.model,
+            "prompt": prompt,
+            "stream": False,
+            "options": options or {"num_gpu": 1}  # Enable GPU acceleration
+        })
+        if response.status_code != 200:
+            raise OllamaError(f"Ollama API error: {response.text}")
+        try:
+            text = response.json().get("response", "")
+        except ValueError as e:
+            # Risposta troncata o non JSON: un errore di Ollama come gli altri
+            self._record_failure(operation)
+            raise OllamaError(f"Invalid response from Ollama: {e}") from e
+        # Solo le generazioni riuscite: tentativi falliti e timeout durante un
+        # disservizio falserebbero la latenza
+        OLLAMA_GENERATION_SECONDS.observe(time.perf_counter() - start, operation=operation)
+        return text
+
+    def generate_stream(self, prompt, options=None):
+        """
+        Generazione in streaming: restituisce i frammenti di testo man mano che
+        arrivano (NDJSON). Chiudere il generatore chiude anche la connessione
+        con Ollama, che interrompe così la generazione.
+
+        Gli errori di connessione vengono sollevati alla prima iterazione, prima
+        di qualsiasi token, così che il chiamante possa usare il fallback locale.
+        """
+        start = time.perf_counter()
+        first_token = True
+        completed = False
+        response = self.request("POST", "/api/generate", operation="stream", stream=True, json={
+            "model": self.model,
+            "prompt": prompt,
+            "stream": True,
+            "options": options or {"num_gpu": 1}  # Enable GPU acceleration
+        })
+        if response.status_code != 200:
+            message = response.text
+            response.close()
+            raise OllamaError(f"Ollama API error: {message}")
+
+        try:
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise OllamaError(chunk["error"])
+                token = chunk.get("response", "")
+                if token:
+                    if first_token:
+                        first_token = False
+                        OLLAMA_TTFT_SECONDS.observe(time.perf_counter() - start, operation="stream")
+                    yield token
+                if chunk.get("done"):
+                    break
+            completed = True
+        except (requests.RequestException, ValueError) as e:
+            # Connessione interrotta o riga non JSON a metà della generazione
+            self._record_failure("stream")
+            raise OllamaError(f"Ollama stream interrupted: {e}") from e
+        finally:
+            # Eseguito anche quando il client si disconnette (GeneratorExit)
+            response.close()
+            # Come in generate, solo le generazioni arrivate in fondo
+            if completed:
+                OLLAMA_GENERATION_SECONDS.observe(time.perf_counter() - start, operation="stream")
+
+    def get_json(self, path):
+        """
+        GET di un endpoint informativo (es. /api/tags), con timeout brevi.
+        """
+        response = self.request("GET", path, operation="status", retry_read_timeout=True)
+        if response.status_code != 200:
+            raise OllamaError(f"Ollama API error: {response.text}")
+        return response.json()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "base_url": self.base_url,
+                "circuit": self.breaker.state,
+                "circuit_opened": self.breaker.times_opened,
+                "requests": self.requests,
+                "retries": self.retries,
+                "failures": self.failures,
+                "short_circuited": self.short_circuited,
+                "probe_requests": self.probe_requests,
+                "probe_retries": self.probe_retries,
+                "probe_failures": self.probe_failures,
+                "probe_short_circuited": self.probe_short_circuited
+            }
@@ -0,0 +1,138 @@
+import os
+import threading
+import time
+
+from ollama_client import OllamaError
+
+# Intervallo (secondi) tra due controlli dello stato di Ollama
+OLLAMA_HEALTH_INTERVAL = float(os.getenv("OLLAMA_HEALTH_INTERVAL", "15"))
+# Età massima (secondi) dello stato in cache prima di un controllo immediato
+OLLAMA_HEALTH_TTL = float(os.getenv("OLLAMA_HEALTH_TTL", "60"))
+
+
+def describe_gpu_usage(running_model):
+    """
+    Deduce dai metadati di /api/ps se il modello è caricato su GPU.
+    """
+    if running_model is None:
+        return "Model not loaded"
+    size = running_model.get("size") or 0
+    size_vram = running_model.get("size_vram") or 0
+    if size_vram <= 0:
+        return "Using CPU"
+    if size and size_vram < size:
+        return f"Using GPU (partial, {100 * size_vram / size:.0f}%)"
+    return "Using GPU"
+
+
+class OllamaHealthMonitor:
+    """
+    Controlla periodicamente lo stato di Ollama in background (solo /api/tags
+    e /api/ps, mai una generazione) e mantiene l'ultimo stato in cache.
+    """
+
+    def __init__(self, client, model_name, interval=OLLAMA_HEALTH_INTERVAL, ttl=OLLAMA_HEALTH_TTL):
+        self.client = client
+        self.model_name = model_name
+        self.interval = interval
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._probe_lock = threading.Lock()
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._thread = None
+        self.probes = 0
+
+    def probe(self):
+        """
+        Interroga Ollama e aggiorna lo stato in cache.
+        """
+        # Più richieste contemporanee con la cache scaduta eseguono un solo controllo
+        with self._probe_lock:
+            if self._snapshot is not None and time.monotonic() - self._checked_at < min(self.interval, self.ttl) / 2:
+                return self._snapshot
+            snapshot = self._probe()
+            with self._lock:
+                self._snapshot = snapshot
+                self._checked_at = time.monotonic()
+                self.probes += 1
+            return snapshot
+
+    def _probe(self):
+        checked_at = time.time()
+        try:
+            models = self.client.get_json("/api/tags").get("models", [])
+        except OllamaError as e:
+            return {"status": "error", "message": str(e), "checked_at": checked_at}
+
+        # Check if our model is available
+        model_info = next((m for m in models if m.get("name") == self.model_name), None)
+
+        running = None
+        try:
+            running = self.client.get_json("/api/ps").get("models", [])
+        except OllamaError as e:
+            # Versioni di Ollama senza /api/ps: lo stato resta comunque "online"
+            print(f"Ollama /api/ps unavailable: {e}")
+        running_model = next((m for m in running or [] if m.get("name") == self.model_name), None)
+
+        return {
+            "status": "online",
+            "models": models,
+            "current_model": model_info,
+            "running_models": running or [],
+            "gpu_check": describe_gpu_usage(running_model) if running is not None else "Unknown",
+            "checked_at": checked_at
+        }
+
+    def _run(self):
+        while True:
+            try:
+                self.probe()
+            except Exception as e:
+                print(f"Error during Ollama health check: {e}")
+            time.sleep(self.interval)
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="ollama-health", daemon=True)
+            self._thread.start()
+
+    def peek(self):
+        """
+        Ultimo stato noto senza mai interrogare Ollama (None se non ancora disponibile).
+        """
+        with self._lock:
+            return self._snapshot
+
+    def model_memory_gb(self, device):
+        """
+        Memoria (GB) occupata dal modello su `device` secondo /api/ps, o None
+        se il modello non è caricato o lo stato non è noto.
+        """
+        snapshot = self.peek()
+        if not snapshot or snapshot.get("status") != "online":
+            return None
+        running = next((m for m in snapshot.get("running_models", []) if m.get("name") == self.model_name), None)
+        if running is None:
+            return None
+        size = running.get("size") or 0
+        size_vram = running.get("size_vram") or 0
+        used = size_vram if device.startswith("cuda") else size - size_vram
+        return used / (1024**3)
+
+    def snapshot(self):
+        """
+        Ultimo stato noto di Ollama. Esegue un controllo solo se la cache è
+        vuota o più vecchia del TTL (es. al primo accesso).
+        """
+        self.start()
+        with self._lock:
+            snapshot = self._snapshot
+            age = time.monotonic() - self._checked_at
+        if snapshot is None or age > self.ttl:
+            snapshot = self.probe()
+            age = 0.0
+        return {**snapshot, "age": round(age, 3)}
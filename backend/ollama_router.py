@@ -0,0 +1,211 @@
+import os
+import random
+import threading
+
+from ollama_client import OllamaClient, OllamaError, OllamaUnavailableError, CircuitBreaker, OLLAMA_MAX_RETRIES
+from ollama_health import OllamaHealthMonitor
+
+# Istanze di Ollama tra cui distribuire le generazioni, separate da virgole
+# (es. "http://gpu1:11434,http://gpu2:11434"). Se vuoto si usa solo OLLAMA_API_URL
+OLLAMA_API_URLS = os.getenv("OLLAMA_API_URLS", "")
+
+# Priorità di un'istanza; a parità si sceglie quella con meno richieste in corso
+LOADED = 0      # modello già in memoria secondo /api/ps
+AVAILABLE = 1   # modello scaricato (/api/tags) ma non ancora caricato
+UNKNOWN = 2     # nessun controllo completato finora
+
+
+def parse_urls(value, default_url):
+    """
+    Elenco degli URL (senza duplicati) da OLLAMA_API_URLS, oppure il solo URL predefinito.
+    """
+    urls = [url.strip().rstrip("/") for url in value.split(",") if url.strip()]
+    return list(dict.fromkeys(urls)) or [default_url.rstrip("/")]
+
+
+class OllamaInstance:
+    """
+    Un server Ollama del pool: client con il proprio circuit breaker, stato
+    controllato in background e richieste in corso.
+    """
+
+    def __init__(self, url, model, max_retries):
+        self.url = url
+        self.model = model
+        self.client = OllamaClient(url, model, max_retries=max_retries)
+        self.health = OllamaHealthMonitor(self.client, model)
+        self.in_flight = 0
+        self.routed = 0
+        self.failed_over = 0
+
+    def priority(self):
+        """
+        LOADED, AVAILABLE o UNKNOWN se l'istanza può ricevere la generazione;
+        None se è irraggiungibile, con il circuito aperto o senza il modello.
+        """
+        if self.client.breaker.state == CircuitBreaker.OPEN:
+            return None
+        snapshot = self.health.peek()
+        if snapshot is None:
+            return UNKNOWN
+        if snapshot.get("status") != "online" or snapshot.get("current_model") is None:
+            return None
+        if any(m.get("name") == self.model for m in snapshot.get("running_models", [])):
+            return LOADED
+        return AVAILABLE
+
+    def stats(self):
+        snapshot = self.health.peek()
+        return {
+            **self.client.stats(),
+            "status": snapshot.get("status") if snapshot else "unknown",
+            "model_available": bool(snapshot and snapshot.get("current_model")),
+            "in_flight": self.in_flight,
+            "routed": self.routed,
+            "failed_over": self.failed_over
+        }
+
+
+class OllamaRouter:
+    """
+    Distribuisce le generazioni tra più istanze di Ollama: ognuna va a
+    un'istanza raggiungibile che ha il modello, preferendo quelle che lo hanno
+    già in memoria (caricarlo costa più che attendere in coda) e, a parità,
+    quella con meno richieste in corso. Se l'istanza fallisce prima di
+    produrre output si passa alla successiva.
+
+    Espone la stessa interfaccia di OllamaClient (generate, generate_stream,
+    stats), così il resto del backend non distingue una o più istanze.
+    """
+
+    def __init__(self, urls, model, max_retries=None):
+        if max_retries is None:
+            # Con più istanze si cambia istanza invece di ritentare sulla stessa
+            max_retries = OLLAMA_MAX_RETRIES if len(urls) == 1 else 0
+        self.model = model
+        self.instances = [OllamaInstance(url, model, max_retries) for url in urls]
+        self._lock = threading.Lock()
+        self.failovers = 0
+        self.exhausted = 0
+
+    @property
+    def primary(self):
+        """
+        La prima istanza configurata (di solito quella sullo stesso host).
+        """
+        return self.instances[0]
+
+    def start(self):
+        # I controlli in background partono al primo utilizzo (e ripartono
+        # nei worker dopo il fork, dove i thread del padre non esistono)
+        for instance in self.instances:
+            instance.health.start()
+
+    def _acquire(self, tried):
+        """
+        Sceglie l'istanza per una generazione e ne conta la richiesta in corso.
+        Se nessuna risulta disponibile si provano comunque le altre, dalla
+        meno carica: lo stato in cache può essere vecchio.
+        """
+        self.start()
+        with self._lock:
+            candidates = [(instance, instance.priority()) for instance in self.instances if instance not in tried]
+            if not candidates:
+                return None
+            available = [(instance, priority) for instance, priority in candidates if priority is not None]
+            instance, _ = min(available or candidates,
+                              key=lambda item: (UNKNOWN if item[1] is None else item[1], item[0].in_flight,
+                                                random.random()))
+            instance.in_flight += 1
+            instance.routed += 1
+            return instance
+
+    def _release(self, instance):
+        with self._lock:
+            instance.in_flight -= 1
+
+    def _fail_over(self, instance, error):
+        with self._lock:
+            instance.failed_over += 1
+            self.failovers += 1
+        print(f"Ollama instance {instance.url} failed ({error}), trying another instance")
+
+    def _exhausted(self, last_error):
+        with self._lock:
+            self.exhausted += 1
+        if len(self.instances) == 1 and last_error is not None:
+            return last_error
+        return OllamaUnavailableError(f"All Ollama instances failed (last error: {last_error})")
+
+    def generate(self, prompt, options=None, operation="generate"):
+        tried = set()
+        last_error = None
+        while True:
+            instance = self._acquire(tried)
+            if instance is None:
+                raise self._exhausted(last_error)
+            tried.add(instance)
+            try:
+                return instance.client.generate(prompt, options, operation)
+            except OllamaError as e:
+                last_error = e
+                if len(tried) < len(self.instances):
+                    self._fail_over(instance, e)
+            finally:
+                self._release(instance)
+
+    def generate_stream(self, prompt, options=None):
+        """
+        Come OllamaClient.generate_stream. Si cambia istanza solo prima del
+        primo token: dopo, un errore arriva al chiamante come con un'istanza sola.
+        """
+        tried = set()
+        last_error = None
+        while True:
+            instance = self._acquire(tried)
+            if instance is None:
+                raise self._exhausted(last_error)
+            tried.add(instance)
+            generation = instance.client.generate_stream(prompt, options)
+            try:
+                try:
+                    first_token = next(generation, None)
+                except OllamaError as e:
+                    last_error = e
+                    if len(tried) < len(self.instances):
+                        self._fail_over(instance, e)
+                    continue
+                if first_token is not None:
+                    yield first_token
+                yield from generation
+                return
+            finally:
+                # Eseguito anche quando il client si disconnette (GeneratorExit)
+                generation.close()
+                self._release(instance)
+
+    def snapshot(self):
+        """
+        Stato per /api/ollama-status: quello della prima istanza online con il
+        modello (o della principale), con l'elenco di tutte le istanze.
+        """
+        self.start()
+        snapshots = [instance.health.snapshot() for instance in self.instances]
+        best = next((s for s in snapshots if s.get("status") == "online" and s.get("current_model")), snapshots[0])
+        return {**best, "instances": [{"url": instance.url, "status": s.get("status"),
+                                       "current_model": s.get("current_model"), "gpu_check": s.get("gpu_check"),
+                                       "age": s.get("age")}
+                                      for instance, s in zip(self.instances, snapshots)]}
+
+    def stats(self):
+        instances = [instance.stats() for instance in self.instances]
+        with self._lock:
+            failovers, exhausted = self.failovers, self.exhausted
+        return {
+            # Totali di tutte le istanze, come per un client singolo
+            **{name: sum(s[name] for s in instances) for name in ("requests", "retries", "failures",
+                                                                  "short_circuited")},
+            "failovers": failovers,
+            "exhausted": exhausted,
+            "instances": instances
+        }
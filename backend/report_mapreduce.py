@@ -0,0 +1,189 @@
+import math
+import os
+import re
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from llm_cache import llm_cache_key, normalize_text, MISS
+
+# Contesto del modello (token) e quota riservata alla risposta
+REPORT_CONTEXT_TOKENS = int(os.getenv("REPORT_CONTEXT_TOKENS", "4096"))
+REPORT_OUTPUT_TOKENS = int(os.getenv("REPORT_OUTPUT_TOKENS", "1024"))
+# Token riservati alle istruzioni del prompt (system prompt, metadati)
+REPORT_PROMPT_OVERHEAD = int(os.getenv("REPORT_PROMPT_OVERHEAD", "400"))
+# Dimensione massima di una parte e sovrapposizione con la parte precedente
+REPORT_CHUNK_TOKENS = int(os.getenv("REPORT_CHUNK_TOKENS", "1500"))
+REPORT_CHUNK_OVERLAP = int(os.getenv("REPORT_CHUNK_OVERLAP", "150"))
+# Riassunti delle parti eseguiti in parallelo (in tutto il processo)
+REPORT_MAP_CONCURRENCY = int(os.getenv("REPORT_MAP_CONCURRENCY", "2"))
+# Stima approssimativa senza tokenizer: caratteri per token
+REPORT_CHARS_PER_TOKEN = float(os.getenv("REPORT_CHARS_PER_TOKEN", "4"))
+# Livelli massimi di riassunto (riassunti dei riassunti)
+REPORT_MAX_LEVELS = 3
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / REPORT_CHARS_PER_TOKEN)
+
+
+def _split_long_sentence(sentence, max_tokens):
+    # Frase senza punteggiatura più lunga di una parte: si divide sulle parole
+    words = sentence.split()
+    piece = []
+    for word in words:
+        piece.append(word)
+        if estimate_tokens(" ".join(piece)) >= max_tokens:
+            yield " ".join(piece)
+            piece = []
+    if piece:
+        yield " ".join(piece)
+
+
+def split_sentences(text, max_tokens):
+    sentences = []
+    for sentence in _SENTENCE_END.split(normalize_text(text)):
+        if not sentence:
+            continue
+        if estimate_tokens(sentence) > max_tokens:
+            sentences.extend(_split_long_sentence(sentence, max_tokens))
+        else:
+            sentences.append(sentence)
+    return sentences
+
+
+def chunk_transcript(text, max_tokens=REPORT_CHUNK_TOKENS, overlap_tokens=REPORT_CHUNK_OVERLAP):
+    """
+    Divide il testo in parti di al massimo `max_tokens`, tagliando sempre a
+    fine frase. Restituisce una lista di (contesto, testo): il contesto sono
+    le ultime frasi della parte precedente (circa `overlap_tokens`).
+
+    I tagli dipendono dal contenuto delle frasi e non dalla posizione: una
+    parte viene chiusa, superato il 75% della dimensione, dopo una frase il
+    cui hash è multiplo di 4. Modificando un punto della trascrizione i
+    tagli successivi restano gli stessi e solo le parti toccate cambiano.
+    """
+    min_tokens = max_tokens * 3 // 4
+    chunks = []
+    current = []
+    current_tokens = 0
+    for sentence in split_sentences(text, max_tokens):
+        tokens = estimate_tokens(sentence) + 1
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append(current)
+            current, current_tokens = [], 0
+        current.append(sentence)
+        current_tokens += tokens
+        if current_tokens >= min_tokens and zlib.crc32(sentence.encode("utf-8")) % 4 == 0:
+            chunks.append(current)
+            current, current_tokens = [], 0
+    if current:
+        chunks.append(current)
+
+    result = []
+    for i, sentences in enumerate(chunks):
+        context = []
+        if i > 0 and overlap_tokens > 0:
+            context_tokens = 0
+            for sentence in reversed(chunks[i - 1]):
+                context_tokens += estimate_tokens(sentence) + 1
+                if context and context_tokens > overlap_tokens:
+                    break
+                context.insert(0, sentence)
+        result.append((" ".join(context), " ".join(sentences)))
+    return result
+
+
+def build_chunk_prompt(context, text):
+    prompt = ("Sei un assistente che prepara gli appunti per una relazione. Riassumi la seguente parte "
+              "della trascrizione di una registrazione audio, conservando tutti i dati numerici, le misure, "
+              "i materiali, le procedure e le conclusioni. Scrivi solo il riassunto, senza commenti.\n\n")
+    if context:
+        prompt += f"Fine della parte precedente (solo per contesto, da non riassumere):\n{context}\n\n"
+    prompt += f"Parte da riassumere:\n{text}\n"
+    return prompt
+
+
+class MapReduceReporter:
+    """
+    Generazione gerarchica per le trascrizioni più lunghe del contesto del
+    modello: le parti vengono riassunte in parallelo (map) e il report finale
+    viene generato dai riassunti (reduce) con il prompt del template.
+
+    I riassunti delle parti passano dalla cache delle risposte dell'LLM.
+    """
+
+    def __init__(self, generate_fn, cache, model_name, context_tokens=REPORT_CONTEXT_TOKENS,
+                 chunk_tokens=REPORT_CHUNK_TOKENS, overlap_tokens=REPORT_CHUNK_OVERLAP,
+                 concurrency=REPORT_MAP_CONCURRENCY):
+        self.generate_fn = generate_fn
+        self.cache = cache
+        self.model_name = model_name
+        self.input_budget = context_tokens - REPORT_OUTPUT_TOKENS - REPORT_PROMPT_OVERHEAD
+        self.chunk_tokens = min(chunk_tokens, self.input_budget)
+        self.overlap_tokens = overlap_tokens
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="report-map")
+        self._lock = threading.Lock()
+        self.chunks_summarized = 0
+        self.chunks_cached = 0
+
+    def needs_map_reduce(self, transcript):
+        return estimate_tokens(transcript) > self.input_budget
+
+    def _summarize(self, context, text, level):
+        key = llm_cache_key("report_chunk", self.model_name, level, text, {"context": normalize_text(context)})
+        summary, status = self.cache.get_or_compute(
+            key, lambda: self.generate_fn(build_chunk_prompt(context, text)).strip())
+        with self._lock:
+            self.chunks_summarized += 1
+            if status != MISS:
+                self.chunks_cached += 1
+        return summary
+
+    def iter_condense(self, transcript):
+        """
+        Riduce la trascrizione finché non rientra nel contesto del modello.
+        Genera ("progress", livello, completate, totale) a ogni parte
+        riassunta e infine ("result", testo, numero di parti riassunte).
+        """
+        text = transcript
+        total_chunks = 0
+        for level in range(REPORT_MAX_LEVELS):
+            if estimate_tokens(text) <= self.input_budget:
+                break
+            chunks = chunk_transcript(text, self.chunk_tokens, self.overlap_tokens)
+            if len(chunks) <= 1:
+                break
+            futures = [self._executor.submit(self._summarize, context, chunk, level)
+                       for context, chunk in chunks]
+            summaries = []
+            try:
+                for i, future in enumerate(futures):
+                    summaries.append(future.result())
+                    yield ("progress", level, i + 1, len(futures))
+            finally:
+                # Errore o client disconnesso: le parti non ancora iniziate vengono annullate
+                for future in futures:
+                    future.cancel()
+            total_chunks += len(chunks)
+            text = "\n\n".join(f"[Parte {i + 1}] {summary}" for i, summary in enumerate(summaries))
+        yield ("result", text, total_chunks)
+
+    def condense(self, transcript):
+        """
+        Come iter_condense, ma restituisce solo (testo, numero di parti riassunte).
+        """
+        for event in self.iter_condense(transcript):
+            if event[0] == "result":
+                return event[1], event[2]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "input_budget": self.input_budget,
+                "chunk_tokens": self.chunk_tokens,
+                "chunks_summarized": self.chunks_summarized,
+                "chunks_cached": self.chunks_cached
+            }
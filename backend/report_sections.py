@@ -0,0 +1,84 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Sezioni generate contemporaneamente (in tutto il processo): conviene
+# allinearlo a OLLAMA_NUM_PARALLEL del server Ollama
+REPORT_SECTION_CONCURRENCY = int(os.getenv("REPORT_SECTION_CONCURRENCY", "3"))
+
+
+def assemble_sections(sections, texts, header=""):
+    """
+    Unisce le sezioni generate nell'ordine del template. Le sezioni mancanti
+    vengono saltate; un titolo già presente alla fine dell'intestazione (es.
+    "## Sommario Esecutivo" del report tecnico) non viene ripetuto.
+    """
+    parts = []
+    for i, section in enumerate(sections):
+        text = texts.get(i)
+        if text is None:
+            continue
+        heading = f"## {section}"
+        if i == 0 and header.rstrip().endswith(heading):
+            parts.append(text.strip())
+        else:
+            parts.append(f"{heading}\n\n{text.strip()}")
+    return "\n\n".join(parts) + "\n"
+
+
+def strip_section_heading(text, section):
+    # I modelli tendono a ripetere il titolo della sezione richiesta
+    lines = text.strip().splitlines()
+    if lines and lines[0].lstrip("#* ").rstrip(":* ").strip().lower() == section.lower():
+        lines = lines[1:]
+    return "\n".join(lines).strip()
+
+
+class SectionReporter:
+    """
+    Generazione del report una sezione alla volta, con più sezioni in
+    parallelo: ogni sezione ha un prompt mirato e viene restituita appena
+    pronta, invece di attendere l'intero documento.
+    """
+
+    def __init__(self, generate_fn, concurrency=REPORT_SECTION_CONCURRENCY):
+        self.generate_fn = generate_fn
+        self.concurrency = concurrency
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="report-section")
+        self._lock = threading.Lock()
+        self.sections_generated = 0
+
+    def _generate(self, section, prompt):
+        text = strip_section_heading(self.generate_fn(prompt), section)
+        with self._lock:
+            self.sections_generated += 1
+        return text
+
+    def iter_sections(self, prompts):
+        """
+        `prompts` è una lista di (sezione, prompt) nell'ordine del template.
+        Genera (indice, sezione, testo) nell'ordine di completamento.
+        """
+        futures = {self._executor.submit(self._generate, section, prompt): (i, section)
+                   for i, (section, prompt) in enumerate(prompts)}
+        try:
+            for future in as_completed(futures):
+                i, section = futures[future]
+                yield i, section, future.result()
+        finally:
+            # Errore o client disconnesso: le sezioni non ancora iniziate vengono annullate
+            for future in futures:
+                future.cancel()
+
+    def generate(self, prompts):
+        """
+        Genera tutte le sezioni e restituisce {indice: testo}.
+        """
+        return {i: text for i, _, text in self.iter_sections(prompts)}
+
+    def stats(self):
+        with self._lock:
+            return {
+                "concurrency": self.concurrency,
+                "sections_generated": self.sections_generated
+            }
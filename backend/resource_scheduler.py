@@ -0,0 +1,226 @@
+import gc
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from warmup import default_device, torch_loaded
+from long_audio import process_pool_stats, shutdown_process_pool
+from memory_utils import (get_device_memory_gb, free_gpu_memory, whisper_memory_gb, is_enough_memory_for_both_models,
+                          LLM_MEMORY_GB, MEMORY_HEADROOM)
+
+# Dimensioni di Whisper dalla più piccola, per il ripiego su un modello più leggero
+WHISPER_SIZES = ["tiny", "base", "small", "medium", "turbo", "large"]
+# Con Whisper e LLM che non entrano insieme: "serialize" attende, "downgrade"
+# usa subito un modello Whisper più piccolo che possa coesistere con l'LLM
+SCHEDULER_POLICY = os.getenv("SCHEDULER_POLICY", "serialize")
+# Attesa massima (secondi) prima di procedere comunque
+SCHEDULER_WAIT_TIMEOUT = float(os.getenv("SCHEDULER_WAIT_TIMEOUT", "300"))
+
+COEXIST = "coexist"
+RECLAIM = "reclaim"
+SERIALIZE = "serialize"
+DOWNGRADE = "downgrade"
+
+
+class ResourceScheduler:
+    """
+    Coordina Whisper e l'LLM di Ollama sulla stessa memoria (GPU o RAM) in
+    base all'occupazione stimata di ciascun modello.
+
+    Prima di ogni trascrizione o generazione decide se i modelli possono
+    restare entrambi residenti, se liberare i modelli Whisper inattivi, se
+    attendere che l'altro carico di lavoro finisca oppure se usare un modello
+    Whisper più piccolo. La pulizia della memoria (eviction, gc, svuotamento
+    della cache CUDA) avviene solo quando serve davvero recuperare spazio.
+    """
+
+    def __init__(self, pool, llm_memory_fn=None, llm_device=None, policy=SCHEDULER_POLICY,
+                 wait_timeout=SCHEDULER_WAIT_TIMEOUT):
+        self.pool = pool
+        # Memoria dell'LLM riportata da Ollama (GB) per dispositivo, o None se sconosciuta
+        self.llm_memory_fn = llm_memory_fn
+        self._llm_device = llm_device
+        self.policy = policy
+        self.wait_timeout = wait_timeout
+        self._cond = threading.Condition()
+        self._active_whisper = 0
+        self._active_llm = 0
+        self.decisions = {}
+        self.cleanups = 0
+        self.wait_seconds = 0.0
+        self.last_decision = None
+
+    @property
+    def llm_device(self):
+        # Rilevato al primo utilizzo, per non importare torch all'avvio
+        return self._llm_device or default_device()
+
+    def llm_memory_gb(self, device):
+        if device != self.llm_device:
+            return 0.0
+        if self.llm_memory_fn is not None:
+            try:
+                reported = self.llm_memory_fn(device)
+            except Exception as e:
+                print(f"Error reading LLM memory usage: {e}")
+                reported = None
+            if reported:
+                return reported
+        return LLM_MEMORY_GB
+
+    def _process_pool_gb(self, device, exclude=None):
+        # Modelli caricati nei processi worker della trascrizione a blocchi su CPU
+        stats = process_pool_stats()
+        if device != "cpu" or stats is None or (stats["model_size"], stats["workers"]) == exclude:
+            return 0.0
+        return whisper_memory_gb(stats["model_size"]) * stats["workers"]
+
+    def _resident_whisper_gb(self, device, exclude=None, exclude_processes=None):
+        resident = sum(whisper_memory_gb(m["size"]) for m in self.pool.stats()["resident"]
+                       if m["device"] == device and m["size"] != exclude)
+        return resident + self._process_pool_gb(device, exclude_processes)
+
+    def _capacity_gb(self, device):
+        _, total = get_device_memory_gb(device)
+        return total * MEMORY_HEADROOM
+
+    def _record(self, kind, action, **details):
+        with self._cond:
+            key = f"{kind}_{action}"
+            self.decisions[key] = self.decisions.get(key, 0) + 1
+            self.last_decision = {"kind": kind, "action": action, "at": time.time(), **details}
+        if action != COEXIST:
+            print(f"Scheduler: {kind} -> {action} {details}")
+
+    def reclaim(self, device, keep=None, keep_processes=None):
+        """
+        Scarica i modelli Whisper inattivi (tranne `keep`), arresta il pool di
+        processi se inattivo (tranne se è `keep_processes`) e libera la memoria.
+        """
+        evicted = self.pool.evict_all(device=device, keep=keep)
+        stats = process_pool_stats() if device == "cpu" else None
+        if stats and (stats["model_size"], stats["workers"]) != keep_processes:
+            if shutdown_process_pool(only_if_idle=True):
+                evicted += stats["workers"]
+        gc.collect()
+        if device.startswith("cuda"):
+            free_gpu_memory()
+        with self._cond:
+            self.cleanups += 1
+        return evicted
+
+    def _wait_for(self, predicate):
+        # Chiamata con il lock: attende fino al timeout, poi si procede comunque
+        start = time.monotonic()
+        if not self._cond.wait_for(predicate, timeout=self.wait_timeout):
+            print("Scheduler: wait timed out, proceeding anyway")
+        self.wait_seconds += time.monotonic() - start
+
+    def _smaller_size(self, model_size, llm_gb, capacity, copies=1):
+        base_size = model_size.split(".")[0]
+        if base_size.startswith("large"):
+            base_size = "large"
+        if base_size not in WHISPER_SIZES:
+            return None
+        for size in reversed(WHISPER_SIZES[:WHISPER_SIZES.index(base_size)]):
+            if whisper_memory_gb(size) * copies + llm_gb <= capacity:
+                return size
+        return None
+
+    @contextmanager
+    def transcription(self, model_size, device, workers=None):
+        """
+        Da usare attorno a una trascrizione: restituisce la dimensione del
+        modello Whisper da usare (quella richiesta o una più piccola).
+        Con `workers` la trascrizione usa il pool di processi di long_audio,
+        dove ogni processo carica il proprio modello.
+        """
+        llm_gb = self.llm_memory_gb(device)
+        capacity = self._capacity_gb(device)
+        copies = workers or 1
+        size = model_size
+        serialize = False
+        if capacity > 0:
+            if whisper_memory_gb(size) * copies > capacity or (
+                    self.policy == DOWNGRADE and whisper_memory_gb(size) * copies + llm_gb > capacity):
+                smaller = self._smaller_size(size, llm_gb if self.policy == DOWNGRADE else 0.0, capacity, copies)
+                if smaller is not None:
+                    self._record("whisper", DOWNGRADE, requested=model_size, size=smaller)
+                    size = smaller
+
+            # I processi worker non usano i modelli del pool ma quelli del proprio pool
+            keep, keep_processes = (None, (size, workers)) if workers else (size, None)
+            others_gb = self._resident_whisper_gb(device, exclude=keep, exclude_processes=keep_processes)
+            extra_gb = whisper_memory_gb(size) * (copies - 1)
+            if is_enough_memory_for_both_models(size, llm_gb, device, others_gb + extra_gb):
+                self._record("whisper", COEXIST, size=size, workers=copies)
+            elif is_enough_memory_for_both_models(size, llm_gb, device, extra_gb):
+                self._record("whisper", RECLAIM, size=size, workers=copies)
+                self.reclaim(device, keep=keep, keep_processes=keep_processes)
+            else:
+                # Whisper e LLM non entrano insieme: niente trascrizioni durante le generazioni
+                serialize = True
+                self._record("whisper", SERIALIZE, size=size, workers=copies)
+                if others_gb > 0:
+                    self.reclaim(device, keep=keep, keep_processes=keep_processes)
+
+        with self._cond:
+            # Attesa e registrazione nello stesso lock: nessuna generazione può iniziare nel mezzo
+            if serialize and self._active_llm > 0:
+                self._wait_for(lambda: self._active_llm == 0)
+            self._active_whisper += 1
+        try:
+            yield size
+        finally:
+            with self._cond:
+                self._active_whisper -= 1
+                self._cond.notify_all()
+
+    @contextmanager
+    def llm(self, reason, device=None):
+        """
+        Da usare attorno a una generazione con Ollama.
+        """
+        device = device or self.llm_device
+        llm_gb = self.llm_memory_gb(device)
+        capacity = self._capacity_gb(device)
+        serialize = False
+        if llm_gb > 0 and capacity > 0:
+            if llm_gb + self._resident_whisper_gb(device) <= capacity:
+                self._record("llm", COEXIST, reason=reason)
+            else:
+                self._record("llm", RECLAIM, reason=reason)
+                self.reclaim(device)
+                if llm_gb + self._resident_whisper_gb(device) > capacity:
+                    # I modelli rimasti sono in uso: si attende la fine delle trascrizioni
+                    serialize = True
+                    self._record("llm", SERIALIZE, reason=reason)
+
+        with self._cond:
+            if serialize and self._active_whisper > 0:
+                self._wait_for(lambda: self._active_whisper == 0)
+            self._active_llm += 1
+        if serialize:
+            # Le trascrizioni sono finite: i loro modelli ora si possono scaricare
+            self.reclaim(device)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active_llm -= 1
+                self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "policy": self.policy,
+                "decisions": dict(self.decisions),
+                "cleanups": self.cleanups,
+                "wait_seconds": round(self.wait_seconds, 3),
+                "active_whisper": self._active_whisper,
+                "active_llm": self._active_llm,
+                "process_pool": process_pool_stats(),
+                "llm_device": self._llm_device or (default_device() if torch_loaded() else None),
+                "last_decision": self.last_decision
+            }
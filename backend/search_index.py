@@ -0,0 +1,440 @@
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+from session_store import DELETED
+from text_cleaner import tokenize, DEFAULT_LANGUAGE
+
+# Parametri di BM25: saturazione della frequenza e normalizzazione per lunghezza
+BM25_K1 = float(os.getenv("SEARCH_BM25_K1", "1.2"))
+BM25_B = float(os.getenv("SEARCH_BM25_B", "0.75"))
+# Segmenti (con i tempi) restituiti per ogni risultato
+SEARCH_MAX_SEGMENTS = int(os.getenv("SEARCH_MAX_SEGMENTS", "3"))
+SEARCH_MAX_RESULTS = 50
+# Candidati esaminati per ogni risultato quando si tiene un risultato per sessione
+_CANDIDATES_PER_RESULT = 5
+
+# Parole troppo comuni per distinguere un documento (già normalizzate, senza
+# accenti; comprese le forme elise che tokenize separa: "dell'", "l'", "un'")
+STOP_WORDS = {
+    "it": {
+        "a", "ad", "al", "all", "alla", "alle", "agli", "ai", "anche", "che", "chi", "ci", "col", "come", "con",
+        "cui", "da", "dal", "dall", "dalla", "dalle", "dai", "dagli", "del", "dell", "della", "delle", "dei",
+        "degli", "di", "e", "ed", "gli", "ha", "hanno", "ho", "i", "il", "in", "io", "l", "la", "le", "lo", "ma",
+        "mi", "ne", "nel", "nell", "nella", "nelle", "nei", "negli", "noi", "non", "o", "per", "piu", "poi",
+        "quello", "questa", "questo", "se", "si", "sono", "su", "sul", "sull", "sulla", "sui", "ti", "tra", "fra",
+        "un", "una", "uno", "c", "d", "era", "essere", "sia", "abbiamo", "perche"
+    },
+    "en": {
+        "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have", "i", "in", "is", "it",
+        "of", "on", "or", "that", "the", "this", "to", "was", "we", "were", "where", "which", "with", "you"
+    }
+}
+# Vocali finali tolte dalle parole italiane, così singolare e plurale
+# coincidono ("campione", "campioni"); le parole brevi restano intere
+_ITALIAN_ENDINGS = "aeio"
+_MIN_STEM_LENGTH = 5
+
+
+def _stop_words(language):
+    return STOP_WORDS.get(language, STOP_WORDS[DEFAULT_LANGUAGE])
+
+
+def index_terms(text, language=None):
+    """
+    Termini indicizzati per un testo: le parole di tokenize senza le parole
+    comuni, con la vocale finale tolta in italiano.
+    """
+    language = (language or DEFAULT_LANGUAGE).lower()
+    stop_words = _stop_words(language)
+    terms = []
+    for token in tokenize(text, language):
+        if token in stop_words:
+            continue
+        if language == "it" and len(token) >= _MIN_STEM_LENGTH and token[-1] in _ITALIAN_ENDINGS:
+            token = token[:-1]
+        terms.append(token)
+    return terms
+
+
+def _segments(entry):
+    """
+    Parti del documento restituite come risultati: i segmenti di Whisper (con
+    inizio e fine in secondi) per le trascrizioni, i paragrafi altrimenti.
+    """
+    segments = entry.get("metadata", {}).get("segments")
+    if segments:
+        return [(s.get("start"), s.get("end"), s["text"].strip()) for s in segments]
+    return [(None, None, paragraph.strip()) for paragraph in entry["content"].split("\n") if paragraph.strip()]
+
+
+class _Document:
+    __slots__ = ("number", "entry_id", "session_id", "kind", "title", "template_id", "created_at", "length",
+                 "terms", "segments", "segment_terms")
+
+
+def _grow(array, size):
+    # Capacità raddoppiata: gli inserimenti costano O(1) in media
+    grown = np.zeros(max(size, 2 * len(array)), dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class _Postings:
+    """
+    Documenti che contengono un termine e occorrenze, in array numpy che
+    crescono con gli inserimenti (il punteggio di una ricerca è calcolato su
+    tutti i documenti del termine in una sola operazione).
+    """
+    __slots__ = ("documents", "counts", "size", "df")
+
+    def __init__(self):
+        self.documents = np.zeros(4, dtype=np.int32)
+        self.counts = np.zeros(4, dtype=np.float32)
+        self.size = 0
+        # Documenti attivi (quelli eliminati restano negli array fino alla compattazione)
+        self.df = 0
+
+    def append(self, number, count):
+        if self.size == len(self.documents):
+            self.documents = _grow(self.documents, self.size + 1)
+            self.counts = _grow(self.counts, self.size + 1)
+        self.documents[self.size] = number
+        self.counts[self.size] = count
+        self.size += 1
+        self.df += 1
+
+    def compact(self, alive):
+        documents = self.documents[:self.size]
+        keep = alive[documents]
+        self.documents = documents[keep].copy()
+        self.counts = self.counts[:self.size][keep].copy()
+        self.size = len(self.documents)
+
+
+class SearchIndex:
+    """
+    Indice invertito in memoria sui risultati salvati (trascrizioni e report),
+    aggiornato a ogni salvataggio ed eliminazione e ricostruito dall'archivio
+    delle sessioni all'avvio. La ricerca ordina i documenti con BM25 e
+    restituisce i segmenti che contengono i termini cercati.
+
+    Ogni worker di gunicorn ha il proprio indice: prima di ogni ricerca sync
+    applica le modifiche che gli altri worker hanno registrato nell'archivio.
+
+    Ogni documento ha un numero progressivo: lunghezze, tipo e stato sono
+    array indicizzati per numero, così il punteggio BM25 di un termine si
+    calcola su tutti i suoi documenti con numpy. Un documento eliminato resta
+    negli array (escluso dai risultati) finché la compattazione non lo toglie.
+    """
+
+    def __init__(self, k1=BM25_K1, b=BM25_B):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._postings = {}
+        # id del risultato -> documento, e documenti per numero (None se eliminati)
+        self._documents = {}
+        self._numbers = []
+        self._sessions = {}
+        self._lengths = np.zeros(1024, dtype=np.float32)
+        self._alive = np.zeros(1024, dtype=bool)
+        self._kinds = np.zeros(1024, dtype=np.int8)
+        self._kind_codes = {}
+        self._total_length = 0
+        self._dead_postings = 0
+        self._live_postings = 0
+        self._thread = None
+        # Ultima modifica dell'archivio applicata (None prima della ricostruzione)
+        self._synced = None
+        self._sync_lock = threading.Lock()
+        # Sessioni eliminate durante la ricostruzione, da non reinserire
+        self._deleted_sessions = set()
+        self.building = False
+        self.build_seconds = None
+        self.searches = 0
+        self.compactions = 0
+
+    def add(self, entry):
+        """
+        Indicizza un risultato nel formato di SessionStore (con il contenuto
+        completo). Un risultato già presente viene sostituito.
+        """
+        metadata = entry.get("metadata", {})
+        language = metadata.get("language")
+        document = _Document()
+        document.entry_id = entry["id"]
+        document.session_id = entry["session_id"]
+        document.kind = entry["kind"]
+        document.title = metadata.get("title")
+        document.template_id = entry.get("template_id")
+        document.created_at = entry["created_at"]
+
+        # Il testo si analizza fuori dal lock, una volta per segmento: le
+        # occorrenze del documento sono la somma di quelle dei segmenti
+        document.segments = _segments(entry)
+        term_counts = {}
+        segment_terms = {}
+        for i, (_, _, text) in enumerate(document.segments):
+            for term in index_terms(text, language):
+                term_counts[term] = term_counts.get(term, 0) + 1
+                segments = segment_terms.setdefault(term, [])
+                if not segments or segments[-1] != i:
+                    segments.append(i)
+        document.length = sum(term_counts.values())
+        document.terms = tuple(term_counts)
+        document.segment_terms = segment_terms
+
+        with self._lock:
+            if document.session_id in self._deleted_sessions:
+                return
+            self._remove(document.entry_id)
+            number = len(self._numbers)
+            if number == len(self._alive):
+                self._lengths = _grow(self._lengths, number + 1)
+                self._alive = _grow(self._alive, number + 1)
+                self._kinds = _grow(self._kinds, number + 1)
+            document.number = number
+            self._numbers.append(document)
+            self._documents[document.entry_id] = document
+            self._sessions.setdefault(document.session_id, set()).add(document.entry_id)
+            self._lengths[number] = document.length
+            self._alive[number] = True
+            self._kinds[number] = self._kind_codes.setdefault(document.kind, len(self._kind_codes) + 1)
+            self._total_length += document.length
+            self._live_postings += len(term_counts)
+            for term, count in term_counts.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = _Postings()
+                postings.append(number, count)
+
+    def _remove(self, entry_id):
+        document = self._documents.pop(entry_id, None)
+        if document is None:
+            return
+        self._numbers[document.number] = None
+        self._alive[document.number] = False
+        session = self._sessions.get(document.session_id)
+        if session is not None:
+            session.discard(entry_id)
+            if not session:
+                del self._sessions[document.session_id]
+        self._total_length -= document.length
+        for term in document.terms:
+            self._postings[term].df -= 1
+        self._live_postings -= len(document.terms)
+        self._dead_postings += len(document.terms)
+
+    def _compact_if_needed(self):
+        # Le occorrenze dei documenti eliminati rallentano le ricerche: si
+        # tolgono quando superano un quarto di quelle attive
+        if self._dead_postings < max(1024, self._live_postings // 4):
+            return
+        for term in list(self._postings):
+            postings = self._postings[term]
+            if postings.df == 0:
+                del self._postings[term]
+            else:
+                postings.compact(self._alive)
+        self._dead_postings = 0
+        self.compactions += 1
+
+    def remove_session(self, session_id):
+        with self._lock:
+            if self.building:
+                self._deleted_sessions.add(session_id)
+            for entry_id in list(self._sessions.get(session_id, ())):
+                self._remove(entry_id)
+            self._compact_if_needed()
+
+    def rebuild(self, store):
+        """
+        Indicizza tutti i risultati dell'archivio. I salvataggi durante la
+        ricostruzione finiscono comunque nell'indice.
+        """
+        start = time.perf_counter()
+        with self._sync_lock:
+            # Le modifiche successive arrivano con sync (i doppioni sono ignorati)
+            self._synced = store.last_change()
+        with self._lock:
+            self.building = True
+            self._deleted_sessions.clear()
+        try:
+            count = 0
+            for entry in store.iter_entries():
+                self.add(entry)
+                count += 1
+        finally:
+            with self._lock:
+                self.building = False
+                self._deleted_sessions.clear()
+        self.build_seconds = round(time.perf_counter() - start, 3)
+        print(f"Search index built: {count} entries in {self.build_seconds}s")
+
+    def start_rebuild(self, store):
+        """
+        Ricostruisce l'indice in un thread, così l'avvio non attende la lettura
+        dell'archivio (nel frattempo le ricerche vedono un indice parziale).
+        """
+        def run():
+            try:
+                self.rebuild(store)
+            except Exception as e:
+                print(f"Error building the search index: {str(e)}")
+
+        self._thread = threading.Thread(target=run, name="search-index", daemon=True)
+        self._thread.start()
+
+    def wait(self, timeout=None):
+        """
+        Attende la fine della ricostruzione (prima del fork dei worker).
+        """
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def sync(self, store):
+        """
+        Applica i salvataggi e le eliminazioni registrati nell'archivio dopo
+        l'ultima sincronizzazione, compresi quelli degli altri processi.
+        Senza novità costa una query.
+        """
+        with self._sync_lock:
+            if self._synced is None:
+                return
+            while True:
+                changes = store.changes_since(self._synced)
+                if not changes:
+                    return
+                for change in changes:
+                    if change["operation"] == DELETED:
+                        self.remove_session(change["session_id"])
+                    elif change["entry"] is not None and change["entry"]["id"] not in self._documents:
+                        # I risultati salvati da questo processo sono già nell'indice
+                        self.add(change["entry"])
+                self._synced = changes[-1]["seq"]
+
+    def search(self, query, limit=10, kind=None, session_id=None, per_session=True, language=None):
+        """
+        Risultati ordinati per punteggio BM25 con i segmenti in cui compaiono
+        i termini. Con `per_session` si tiene solo il risultato migliore di
+        ogni sessione.
+        """
+        start = time.perf_counter()
+        terms = list(dict.fromkeys(index_terms(query, language)))
+        limit = max(1, min(int(limit), SEARCH_MAX_RESULTS))
+
+        with self._lock:
+            count = len(self._numbers)
+            total = len(self._documents)
+            ranked = []
+            matches = 0
+            if terms and total:
+                scores = self._scores(terms, count, total)
+                self._apply_filters(scores, count, kind, session_id)
+                candidates = np.flatnonzero(scores > 0)
+                matches = len(candidates)
+                ranked = self._top(scores, candidates, limit, per_session)
+            results = [self._result(self._numbers[number], score, terms) for number, score in ranked]
+            self.searches += 1
+            building = self.building
+
+        return {
+            "query": query,
+            "terms": terms,
+            "total": matches,
+            "results": results,
+            "indexing": building,
+            "took_ms": round((time.perf_counter() - start) * 1000, 3)
+        }
+
+    def _scores(self, terms, count, total):
+        k1, b = self.k1, self.b
+        average_length = self._total_length / total or 1.0
+        lengths = self._lengths[:count]
+        scores = np.zeros(count, dtype=np.float32)
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is None or postings.df == 0:
+                continue
+            idf = math.log(1 + (total - postings.df + 0.5) / (postings.df + 0.5))
+            documents = postings.documents[:postings.size]
+            counts = postings.counts[:postings.size]
+            norm = k1 * (1 - b + b * lengths[documents] / average_length)
+            # Un termine compare una sola volta per documento: nessun indice ripetuto
+            scores[documents] += idf * counts * (k1 + 1) / (counts + norm)
+        scores[~self._alive[:count]] = 0
+        return scores
+
+    def _apply_filters(self, scores, count, kind, session_id):
+        if kind:
+            scores[self._kinds[:count] != self._kind_codes.get(kind, -1)] = 0
+        if session_id:
+            keep = np.zeros(count, dtype=bool)
+            keep[[self._documents[e].number for e in self._sessions.get(session_id, ())]] = True
+            scores[~keep] = 0
+
+    def _top(self, scores, candidates, limit, per_session):
+        if not len(candidates):
+            return []
+        # Di solito bastano pochi candidati anche tenendo un risultato per
+        # sessione; se no si ordinano tutti
+        wanted = limit * _CANDIDATES_PER_RESULT if per_session else limit
+        ranked = self._ranked(scores, candidates, wanted, per_session, limit)
+        if per_session and len(ranked) < limit and wanted < len(candidates):
+            ranked = self._ranked(scores, candidates, len(candidates), per_session, limit)
+        return ranked
+
+    def _ranked(self, scores, candidates, wanted, per_session, limit):
+        if wanted < len(candidates):
+            candidates = candidates[np.argpartition(-scores[candidates], wanted - 1)[:wanted]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        seen = set()
+        ranked = []
+        for number in candidates.tolist():
+            if per_session:
+                session_id = self._numbers[number].session_id
+                if session_id in seen:
+                    continue
+                seen.add(session_id)
+            ranked.append((number, float(scores[number])))
+            if len(ranked) == limit:
+                break
+        return ranked
+
+    def _result(self, document, score, terms):
+        # Segmenti con più termini cercati per primi, poi in ordine di tempo
+        matches = {}
+        for term in terms:
+            for i in document.segment_terms.get(term, ()):
+                matches[i] = matches.get(i, 0) + 1
+        best = sorted(matches.items(), key=lambda item: (-item[1], item[0]))[:SEARCH_MAX_SEGMENTS]
+        segments = []
+        for i, matched in best:
+            segment_start, segment_end, text = document.segments[i]
+            segments.append({"index": i, "start": segment_start, "end": segment_end, "text": text,
+                             "matched_terms": matched})
+        return {
+            "entry_id": document.entry_id,
+            "session_id": document.session_id,
+            "kind": document.kind,
+            "title": document.title,
+            "template_id": document.template_id,
+            "created_at": document.created_at,
+            "score": round(score, 4),
+            "segments": segments
+        }
+
+    def stats(self):
+        with self._lock:
+            return {
+                "documents": len(self._documents),
+                "terms": sum(1 for postings in self._postings.values() if postings.df),
+                "building": self.building,
+                "build_seconds": self.build_seconds,
+                "searches": self.searches,
+                "compactions": self.compactions
+            }
@@ -0,0 +1,333 @@
+import base64
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+SESSION_DB_PATH = os.getenv(
+    "SESSION_DB_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "sessions.db")
+)
+# Connessioni SQLite riutilizzate tra le richieste
+SESSION_DB_POOL_SIZE = int(os.getenv("SESSION_DB_POOL_SIZE", "4"))
+# Dimensione massima di una pagina nelle liste
+SESSION_PAGE_MAX = 100
+
+TRANSCRIPTION = "transcription"
+CLEAN = "clean"
+CORRECTION = "correction"
+REPORT = "report"
+KINDS = (TRANSCRIPTION, CLEAN, CORRECTION, REPORT)
+
+# Operazioni registrate nella tabella changes
+SAVED = "saved"
+DELETED = "deleted"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    title TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated_at DESC, id DESC);
+CREATE TABLE IF NOT EXISTS entries (
+    id TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL REFERENCES sessions (id) ON DELETE CASCADE,
+    kind TEXT NOT NULL,
+    template_id TEXT,
+    content TEXT NOT NULL,
+    metadata TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_session ON entries (session_id, created_at DESC, id DESC);
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    operation TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    entry_id TEXT
+);
+"""
+
+# Caratteri del contenuto restituiti nelle liste (il testo completo con get)
+PREVIEW_CHARS = 200
+
+
+class ConnectionPool:
+    """
+    Pool di connessioni SQLite in modalità WAL: le letture non bloccano la
+    scrittura in corso e nessuna richiesta paga l'apertura del database.
+    """
+
+    def __init__(self, path, size=SESSION_DB_POOL_SIZE):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.size = size
+        self._lock = threading.Lock()
+        self._fill()
+
+    def _fill(self):
+        self._pid = os.getpid()
+        self._pool = queue.Queue()
+        for _ in range(self.size):
+            self._pool.put(self._connect())
+
+    def _connect(self):
+        # Le connessioni passano da un thread all'altro, ma una alla volta
+        connection = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("PRAGMA foreign_keys=ON")
+        return connection
+
+    def _check_fork(self):
+        # Le connessioni SQLite non sopravvivono al fork (gunicorn con
+        # preload_app): il processo figlio apre le proprie e abbandona quelle
+        # ereditate senza chiuderle
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._fill()
+
+    @contextmanager
+    def connection(self):
+        self._check_fork()
+        pool = self._pool
+        connection = pool.get()
+        try:
+            with connection:
+                yield connection
+        finally:
+            pool.put(connection)
+
+    def close(self):
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+
+
+def _encode_cursor(timestamp, row_id):
+    return base64.urlsafe_b64encode(json.dumps([timestamp, row_id]).encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor):
+    try:
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return float(timestamp), str(row_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+def _page_limit(limit):
+    return max(1, min(int(limit), SESSION_PAGE_MAX))
+
+
+class SessionStore:
+    """
+    Archivio persistente di trascrizioni, pulizie, correzioni e report,
+    raggruppati in sessioni di lavoro. Le liste sono paginate con un cursore
+    (data, id) invece di OFFSET, così ogni pagina costa lo stesso.
+    """
+
+    def __init__(self, path=SESSION_DB_PATH, pool_size=SESSION_DB_POOL_SIZE):
+        self.pool = ConnectionPool(path, pool_size)
+        with self.pool.connection() as connection:
+            connection.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self.saved = 0
+
+    def save(self, kind, content, session_id=None, template_id=None, metadata=None, title=None):
+        """
+        Salva un risultato nella sessione indicata (creata se non esiste).
+        Restituisce (id della sessione, id del risultato).
+        """
+        if kind not in KINDS:
+            raise ValueError(f"Unknown entry kind '{kind}'")
+        session_id = session_id or uuid.uuid4().hex
+        entry_id = uuid.uuid4().hex
+        now = time.time()
+        with self.pool.connection() as connection:
+            connection.execute(
+                "INSERT INTO sessions (id, title, created_at, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET updated_at = excluded.updated_at, "
+                "title = COALESCE(excluded.title, sessions.title)",
+                (session_id, title, now, now))
+            connection.execute(
+                "INSERT INTO entries (id, session_id, kind, template_id, content, metadata, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (entry_id, session_id, kind, template_id, content,
+                 json.dumps(metadata, ensure_ascii=False) if metadata else None, now))
+            connection.execute("INSERT INTO changes (operation, session_id, entry_id) VALUES (?, ?, ?)",
+                               (SAVED, session_id, entry_id))
+        with self._lock:
+            self.saved += 1
+        return session_id, entry_id
+
+    @staticmethod
+    def _entry(row, full=True):
+        entry = {
+            "id": row["id"],
+            "session_id": row["session_id"],
+            "kind": row["kind"],
+            "template_id": row["template_id"],
+            "created_at": row["created_at"],
+            "metadata": json.loads(row["metadata"]) if row["metadata"] else {}
+        }
+        if full:
+            entry["content"] = row["content"]
+        else:
+            entry["preview"] = row["content"][:PREVIEW_CHARS]
+            # I segmenti con i tempi servono solo con il contenuto completo
+            entry["metadata"].pop("segments", None)
+        return entry
+
+    def list_sessions(self, limit=20, cursor=None):
+        """
+        Sessioni dalla più recente, con il numero di risultati per tipo.
+        Restituisce {"sessions": [...], "next_cursor": ...}.
+        """
+        limit = _page_limit(limit)
+        query = "SELECT id, title, created_at, updated_at FROM sessions"
+        params = []
+        if cursor:
+            updated_at, session_id = _decode_cursor(cursor)
+            query += " WHERE (updated_at, id) < (?, ?)"
+            params += [updated_at, session_id]
+        query += " ORDER BY updated_at DESC, id DESC LIMIT ?"
+        params.append(limit + 1)
+
+        with self.pool.connection() as connection:
+            rows = connection.execute(query, params).fetchall()
+            page = rows[:limit]
+            counts = {}
+            if page:
+                placeholders = ",".join("?" * len(page))
+                for row in connection.execute(
+                        f"SELECT session_id, kind, COUNT(*) AS n FROM entries "
+                        f"WHERE session_id IN ({placeholders}) GROUP BY session_id, kind",
+                        [r["id"] for r in page]):
+                    counts.setdefault(row["session_id"], {})[row["kind"]] = row["n"]
+
+        sessions = [{
+            "id": r["id"],
+            "title": r["title"],
+            "created_at": r["created_at"],
+            "updated_at": r["updated_at"],
+            "entries": counts.get(r["id"], {})
+        } for r in page]
+        next_cursor = _encode_cursor(page[-1]["updated_at"], page[-1]["id"]) if len(rows) > limit else None
+        return {"sessions": sessions, "next_cursor": next_cursor}
+
+    def list_entries(self, session_id=None, kind=None, limit=20, cursor=None, full=False):
+        """
+        Risultati dal più recente, eventualmente di una sola sessione o di un
+        solo tipo. Senza `full` il contenuto è ridotto a un'anteprima.
+        """
+        limit = _page_limit(limit)
+        conditions, params = [], []
+        if session_id:
+            conditions.append("session_id = ?")
+            params.append(session_id)
+        if kind:
+            conditions.append("kind = ?")
+            params.append(kind)
+        if cursor:
+            created_at, entry_id = _decode_cursor(cursor)
+            conditions.append("(created_at, id) < (?, ?)")
+            params += [created_at, entry_id]
+        query = "SELECT * FROM entries"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY created_at DESC, id DESC LIMIT ?"
+        params.append(limit + 1)
+
+        with self.pool.connection() as connection:
+            rows = connection.execute(query, params).fetchall()
+        page = rows[:limit]
+        next_cursor = _encode_cursor(page[-1]["created_at"], page[-1]["id"]) if len(rows) > limit else None
+        return {"entries": [self._entry(r, full) for r in page], "next_cursor": next_cursor}
+
+    def iter_entries(self, batch_size=500):
+        """
+        Tutti i risultati con il contenuto completo, dal più vecchio, letti a
+        blocchi (per ricostruire l'indice di ricerca senza tenere tutto in memoria).
+        """
+        last = (0.0, "")
+        while True:
+            with self.pool.connection() as connection:
+                rows = connection.execute(
+                    "SELECT * FROM entries WHERE (created_at, id) > (?, ?) ORDER BY created_at, id LIMIT ?",
+                    (*last, batch_size)).fetchall()
+            for row in rows:
+                yield self._entry(row)
+            if len(rows) < batch_size:
+                return
+            last = (rows[-1]["created_at"], rows[-1]["id"])
+
+    def get_session(self, session_id):
+        """
+        La sessione con l'ultimo risultato completo di ciascun tipo (quello
+        che serve per ripristinare la pagina), o None se non esiste.
+        """
+        with self.pool.connection() as connection:
+            session = connection.execute(
+                "SELECT id, title, created_at, updated_at FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            if session is None:
+                return None
+            latest = connection.execute(
+                "SELECT * FROM entries e WHERE session_id = ? AND id = ("
+                "SELECT id FROM entries WHERE session_id = e.session_id AND kind = e.kind "
+                "ORDER BY created_at DESC, id DESC LIMIT 1)", (session_id,)).fetchall()
+        return {
+            "id": session["id"],
+            "title": session["title"],
+            "created_at": session["created_at"],
+            "updated_at": session["updated_at"],
+            "latest": {row["kind"]: self._entry(row) for row in latest}
+        }
+
+    def get_entry(self, entry_id):
+        with self.pool.connection() as connection:
+            row = connection.execute("SELECT * FROM entries WHERE id = ?", (entry_id,)).fetchone()
+        return self._entry(row) if row is not None else None
+
+    def delete_session(self, session_id):
+        with self.pool.connection() as connection:
+            if connection.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount == 0:
+                return False
+            connection.execute("INSERT INTO changes (operation, session_id) VALUES (?, ?)", (DELETED, session_id))
+            return True
+
+    def last_change(self):
+        with self.pool.connection() as connection:
+            return connection.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+
+    def changes_since(self, seq, limit=500):
+        """
+        Salvataggi ed eliminazioni successivi a `seq`, in ordine: servono ai
+        processi che tengono una copia dei dati (l'indice di ricerca di ogni
+        worker) per vedere le modifiche fatte dagli altri. Ogni modifica ha
+        seq, operation, session_id ed entry (il risultato completo, None se
+        eliminato nel frattempo o per le eliminazioni).
+        """
+        with self.pool.connection() as connection:
+            rows = connection.execute(
+                "SELECT c.seq, c.operation, c.session_id AS changed_session, e.* FROM changes c "
+                "LEFT JOIN entries e ON e.id = c.entry_id WHERE c.seq > ? ORDER BY c.seq LIMIT ?",
+                (seq, limit)).fetchall()
+        return [{"seq": row["seq"], "operation": row["operation"], "session_id": row["changed_session"],
+                 "entry": self._entry(row) if row["id"] is not None else None} for row in rows]
+
+    def stats(self):
+        with self.pool.connection() as connection:
+            sessions = connection.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            entries = connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        with self._lock:
+            saved = self.saved
+        return {"path": self.pool.path, "sessions": sessions, "entries": entries, "saved": saved}
@@ -0,0 +1,273 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from audio_io import StreamingDecoder, SAMPLE_RATE
+from job_queue import QueueFullError
+from long_audio import detect_silences
+
+# Secondi di audio non trascritto che fanno partire una nuova finestra
+STREAM_WINDOW_SECONDS = float(os.getenv("STREAM_WINDOW_SECONDS", "5"))
+# Oltre questa durata una finestra viene trascritta anche senza pause
+STREAM_MAX_WINDOW_SECONDS = float(os.getenv("STREAM_MAX_WINDOW_SECONDS", "20"))
+# Secondi di inattività dopo i quali una sessione viene eliminata
+STREAM_SESSION_TTL = float(os.getenv("STREAM_SESSION_TTL", "600"))
+STREAM_MAX_SESSIONS = int(os.getenv("STREAM_MAX_SESSIONS", "8"))
+STREAM_MAX_BYTES = int(os.getenv("STREAM_MAX_BYTES", str(200 * 1024 * 1024)))
+STREAM_WORKERS = int(os.getenv("STREAM_WORKERS", "2"))
+
+
+class StreamTooLargeError(Exception):
+    pass
+
+
+class StreamingSession:
+    def __init__(self, clean_filler_words=True):
+        self.id = uuid.uuid4().hex
+        self.clean_filler_words = clean_filler_words
+        self.buffer = bytearray()  # byte ricevuti non ancora passati a ffmpeg
+        self.received = 0
+        self.decoder = None
+        self.audio = np.zeros(0, np.float32)  # campioni decodificati non ancora trascritti
+        self.committed = 0  # campioni già trascritti in modo definitivo
+        self.texts = []
+        self.segments = []
+        self.events = []
+        self.finish_requested = False
+        self.finished = False
+        self.dirty = False
+        self.processing = False
+        self.created_at = time.time()
+        self.last_activity = time.monotonic()
+
+    @property
+    def transcript(self):
+        return " ".join(t for t in self.texts if t)
+
+
+class StreamingTranscriber:
+    """
+    Trascrizione incrementale di una registrazione mentre è ancora in corso.
+
+    Il client invia i blocchi prodotti da MediaRecorder; il server li passa a
+    un processo ffmpeg per sessione, che decodifica solo i byte nuovi, e
+    trascrive l'audio man mano, tagliando le finestre sulle pause, e pubblica
+    i risultati parziali come eventi. La trascrizione
+    finale viene passata a `save_fn`, che restituisce i campi da aggiungere
+    all'evento "final" (es. la sessione in cui è stata salvata).
+    """
+
+    def __init__(self, transcribe_fn, clean_fn, save_fn=None, window_seconds=STREAM_WINDOW_SECONDS,
+                 max_window_seconds=STREAM_MAX_WINDOW_SECONDS, max_sessions=STREAM_MAX_SESSIONS,
+                 session_ttl=STREAM_SESSION_TTL, max_bytes=STREAM_MAX_BYTES, workers=STREAM_WORKERS):
+        self.transcribe_fn = transcribe_fn
+        self.clean_fn = clean_fn
+        self.save_fn = save_fn
+        self.window = int(window_seconds * SAMPLE_RATE)
+        self.max_window = int(max_window_seconds * SAMPLE_RATE)
+        self.max_sessions = max_sessions
+        self.session_ttl = session_ttl
+        self.max_bytes = max_bytes
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="stream-worker")
+        self._cond = threading.Condition()
+        self._sessions = {}
+
+    def create_session(self, clean_filler_words=True):
+        with self._cond:
+            self._purge_expired()
+            if len(self._sessions) >= self.max_sessions:
+                raise QueueFullError(retry_after=int(self.session_ttl / 10))
+            session = StreamingSession(clean_filler_words)
+            self._sessions[session.id] = session
+            return session
+
+    def get(self, session_id):
+        with self._cond:
+            return self._sessions.get(session_id)
+
+    def add_chunk(self, session_id, data):
+        with self._cond:
+            session = self._sessions.get(session_id)
+            if session is None or session.finish_requested:
+                return None
+            if session.received + len(data) > self.max_bytes:
+                raise StreamTooLargeError("Streaming upload exceeds the maximum size")
+            session.buffer.extend(data)
+            session.received += len(data)
+            session.last_activity = time.monotonic()
+            self._schedule(session)
+            return session
+
+    def finish(self, session_id):
+        with self._cond:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            session.finish_requested = True
+            session.last_activity = time.monotonic()
+            # Una sessione già conclusa (o interrotta da un errore) non va rielaborata
+            if not session.finished:
+                self._schedule(session)
+            return session
+
+    def _schedule(self, session):
+        # Chiamata con il lock: un solo worker per sessione, i blocchi arrivati
+        # durante l'elaborazione vengono raccolti al giro successivo
+        session.dirty = True
+        if not session.processing:
+            session.processing = True
+            self._executor.submit(self._process, session)
+
+    def _emit(self, session, event, data):
+        with self._cond:
+            session.events.append((event, data))
+            self._cond.notify_all()
+
+    def wait_for_events(self, session_id, cursor, timeout=None):
+        """
+        Restituisce gli eventi successivi a `cursor` (attendendo fino a `timeout`).
+        """
+        with self._cond:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            self._cond.wait_for(lambda: len(session.events) > cursor, timeout=timeout)
+            return session.events[cursor:]
+
+    def _find_cut(self, pending):
+        """
+        Punto in cui chiudere la finestra corrente: l'ultima pausa, oppure
+        l'intera finestra se supera la durata massima. 0 se conviene attendere.
+        """
+        if len(pending) < self.window:
+            return 0
+        silences, _ = detect_silences(pending, SAMPLE_RATE, min_silence_ms=300)
+        # Ignora le pause a ridosso della fine: l'audio potrebbe continuare
+        guard = len(pending) - SAMPLE_RATE // 2
+        cuts = [(s + e) // 2 for s, e in silences if SAMPLE_RATE <= (s + e) // 2 <= guard]
+        if cuts:
+            return cuts[-1]
+        if len(pending) >= self.max_window:
+            return len(pending)
+        return 0
+
+    def _process(self, session):
+        while True:
+            with self._cond:
+                # Anche qui, non solo in create_session: le sessioni abbandonate
+                # tengono aperto un processo ffmpeg
+                self._purge_expired()
+                if not session.dirty:
+                    session.processing = False
+                    return
+                session.dirty = False
+                # Solo i byte arrivati dal giro precedente: ffmpeg ha già gli altri
+                data = bytes(session.buffer)
+                session.buffer.clear()
+                final = session.finish_requested
+
+            try:
+                if data and session.decoder is None:
+                    session.decoder = StreamingDecoder()
+                if session.decoder is not None:
+                    if data:
+                        session.decoder.write(data)
+                    audio = session.decoder.close() if final else session.decoder.read()
+                    if len(audio):
+                        session.audio = np.concatenate([session.audio, audio])
+
+                pending = session.audio
+                while len(pending):
+                    cut = len(pending) if final else self._find_cut(pending)
+                    if cut == 0:
+                        break
+                    self._transcribe_window(session, pending[:cut])
+                    pending = pending[cut:]
+                    session.audio = pending
+
+                if final:
+                    self._finalize(session)
+                    return
+            except Exception as e:
+                # Anche a metà registrazione: il decoder potrebbe essere
+                # inutilizzabile, e il client deve saperlo subito invece di
+                # continuare a inviare blocchi che non verranno trascritti
+                print(f"Error in streaming session {session.id}: {e}")
+                self._emit(session, "error", {"error": str(e)})
+                with self._cond:
+                    session.finish_requested = True
+                    session.finished = True
+                    session.processing = False
+                    self._release(session)
+                return
+
+    def _transcribe_window(self, session, window):
+        offset = session.committed / SAMPLE_RATE
+        # Le ultime parole trascritte aiutano Whisper a mantenere il contesto
+        prompt = session.transcript[-200:] or None
+        result = self.transcribe_fn(window, initial_prompt=prompt)
+        text = result.get("text", "").strip()
+
+        segments = [{
+            "start": round(seg["start"] + offset, 3),
+            "end": round(seg["end"] + offset, 3),
+            "text": seg["text"]
+        } for seg in result.get("segments", [])]
+
+        with self._cond:
+            session.committed += len(window)
+            session.texts.append(text)
+            session.segments.extend(segments)
+            transcript = session.transcript
+
+        self._emit(session, "partial", {
+            "text": text,
+            "start": offset,
+            "end": session.committed / SAMPLE_RATE,
+            "transcript": transcript
+        })
+
+    def _finalize(self, session):
+        original_transcript = session.transcript
+        transcript = self.clean_fn(original_transcript) if session.clean_filler_words else original_transcript
+        result = {
+            "transcript": transcript,
+            "original_transcript": original_transcript,
+            "cleaned": session.clean_filler_words,
+            "duration": session.committed / SAMPLE_RATE,
+            "segments": session.segments
+        }
+        if self.save_fn:
+            result.update(self.save_fn(result))
+        self._emit(session, "final", result)
+        with self._cond:
+            session.finished = True
+            session.processing = False
+            self._release(session)
+
+    def _release(self, session):
+        # Libera memoria e processo ffmpeg di una sessione terminata o scaduta
+        if session.decoder is not None:
+            session.decoder.kill()
+            session.decoder = None
+        session.buffer = bytearray()
+        session.audio = np.zeros(0, np.float32)
+
+    def _purge_expired(self):
+        now = time.monotonic()
+        expired = [sid for sid, s in self._sessions.items()
+                   if not s.processing and now - s.last_activity > self.session_ttl]
+        for sid in expired:
+            self._release(self._sessions.pop(sid))
+
+    def stats(self):
+        with self._cond:
+            return {
+                "sessions": len(self._sessions),
+                "active": sum(1 for s in self._sessions.values() if not s.finished),
+                "max_sessions": self.max_sessions
+            }
@@ -0,0 +1,107 @@
+import re
+import unicodedata
+
+DEFAULT_LANGUAGE = "it"
+
+# Parole e intercalari da rimuovere, per lingua
+FILLER_WORDS = {
+    "it": [
+        "ehm", "mmm", "uhm", "uh",
+        "allora", "cioè", "ecco",
+        "ok adesso", "ok ora", "ho sbagliato",
+        "vediamo", "vediamo un attimo", "un attimo",
+        "in pratica", "in realtà", "in effetti",
+        "quindi", "insomma", "come dire",
+        "capito", "va bene"
+    ],
+    "en": [
+        "uh", "uhm", "um", "umm", "erm", "hmm", "mmm",
+        "you know", "i mean", "kind of", "sort of",
+        "basically", "actually", "let me see", "let's see"
+    ]
+}
+
+# Punteggiatura davanti alla quale non si lasciano spazi
+PUNCTUATION = ",.!?:;"
+
+
+class FillerCleaner:
+    """
+    Rimuove le parole di riempimento e normalizza gli spazi con una sola
+    scansione del testo. L'elenco viene compilato una volta in un'unica
+    alternativa, con le espressioni più lunghe per prime ("vediamo un
+    attimo" prima di "vediamo").
+    """
+
+    def __init__(self, words):
+        alternatives = sorted({w.lower() for w in words}, key=lambda w: (-len(w), w))
+        fillers = "|".join(re.escape(w) for w in alternatives)
+        # Ogni corrispondenza è una sequenza di spazi e parole di riempimento;
+        # il gruppo cattura gli spazi esterni alle parole ("ok adesso" ne contiene uno)
+        if fillers:
+            pattern = rf"(?:( )|\b(?:{fillers})\b)+"
+        else:
+            pattern = r"( )+"
+        self._regex = re.compile(pattern, re.IGNORECASE)
+        # Solo le parole di riempimento, senza sistemare gli spazi (per l'indicizzazione)
+        self._fillers = re.compile(rf"\b(?:{fillers})\b", re.IGNORECASE) if fillers else None
+
+    def _replace(self, match):
+        # Uno spazio sopravvive solo se ce n'era uno fuori dalle parole di
+        # riempimento e non segue punteggiatura
+        if match.group(1) is None:
+            return ""
+        end = match.end()
+        text = match.string
+        if end < len(text) and text[end] in PUNCTUATION:
+            return ""
+        return " "
+
+    def clean(self, text):
+        return self._regex.sub(self._replace, text).strip()
+
+    def remove_fillers(self, text):
+        return self._fillers.sub(" ", text) if self._fillers is not None else text
+
+
+_cleaners = {language: FillerCleaner(words) for language, words in FILLER_WORDS.items()}
+
+
+def get_cleaner(language=None):
+    """
+    Cleaner per la lingua indicata; per le lingue senza elenco si usa
+    quello italiano.
+    """
+    return _cleaners.get((language or DEFAULT_LANGUAGE).lower(), _cleaners[DEFAULT_LANGUAGE])
+
+
+def clean_transcript(transcript, language=None):
+    """
+    Funzione per pulire la trascrizione da parole di riempimento e pause.
+    """
+    return get_cleaner(language).clean(transcript)
+
+
+_WORD = re.compile(r"\w+")
+# Segni diacritici separati dalle lettere dalla decomposizione NFKD
+_COMBINING = re.compile(r"[\u0300-\u036f]")
+
+
+def normalize_text(text):
+    """
+    Minuscole e lettere senza accenti ("perché" e "perche" coincidono),
+    come si scrivono le ricerche.
+    """
+    text = text.lower()
+    if text.isascii():
+        return text
+    return _COMBINING.sub("", unicodedata.normalize("NFKD", text))
+
+
+def tokenize(text, language=None):
+    """
+    Parole del testo per l'indicizzazione: prima si tolgono le parole di
+    riempimento (lo stesso elenco di clean_transcript), poi si normalizza.
+    Gli apostrofi separano le parole ("dell'acqua" -> "dell", "acqua").
+    """
+    return _WORD.findall(normalize_text(get_cleaner(language).remove_fillers(text)))
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+TRANSCRIPT_CACHE_DIR = os.getenv(
+    "TRANSCRIPT_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "transcripts")
+)
+# Limiti della cache su disco: dimensione totale e numero di trascrizioni
+TRANSCRIPT_CACHE_MAX_BYTES = int(os.getenv("TRANSCRIPT_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+TRANSCRIPT_CACHE_MAX_ENTRIES = int(os.getenv("TRANSCRIPT_CACHE_MAX_ENTRIES", "5000"))
+
+
+def transcript_cache_key(audio_digest, model_size, language=None, options=None):
+    """
+    Chiave della cache: hash dell'audio più tutti i parametri che influenzano
+    il risultato di Whisper.
+    """
+    payload = json.dumps({
+        "audio": audio_digest,
+        "model": model_size,
+        "language": language,
+        "options": options or {}
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TranscriptCache:
+    """
+    Cache persistente su disco delle trascrizioni, con eviction LRU limitata
+    per dimensione totale e numero di voci. L'ordine LRU sopravvive ai riavvii
+    grazie alla data di modifica dei file, aggiornata a ogni lettura.
+
+    La directory può essere condivisa da più processi (i worker di gunicorn):
+    una voce scritta da un altro processo viene letta dal disco e aggiunta
+    all'indice, e i limiti vengono applicati a quanto c'è effettivamente su
+    disco, riletto prima di ogni eviction.
+    """
+
+    def __init__(self, directory=TRANSCRIPT_CACHE_DIR, max_bytes=TRANSCRIPT_CACHE_MAX_BYTES,
+                 max_entries=TRANSCRIPT_CACHE_MAX_ENTRIES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._index = OrderedDict()
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            self._index, self._total_bytes = self._scan()
+            self._evict()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _scan(self):
+        """
+        Indice (dalla voce usata meno di recente) e dimensione totale delle
+        voci presenti su disco.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name[:-len(".json")], stat.st_size))
+        index = OrderedDict((key, size) for _, key, size in sorted(entries))
+        return index, sum(index.values())
+
+    def get(self, key):
+        path = self._path(key)
+        with self._lock:
+            if key in self._index:
+                self._index.move_to_end(key)
+        # Anche le voci assenti dall'indice vanno cercate su disco: possono
+        # essere state scritte da un altro processo
+        try:
+            with open(path, encoding="utf-8") as f:
+                size = os.fstat(f.fileno()).st_size
+                value = json.load(f)
+            os.utime(path)
+        except FileNotFoundError:
+            # Mai scritta, o rimossa dall'eviction di un altro processo
+            with self._lock:
+                self._forget(key)
+                self.misses += 1
+            return None
+        except (OSError, ValueError) as e:
+            print(f"Discarding unreadable transcript cache entry {key}: {e}")
+            with self._lock:
+                self._discard(key)
+                self.misses += 1
+            return None
+        with self._lock:
+            if key not in self._index:
+                self._index[key] = size
+                self._total_bytes += size
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        path = self._path(key)
+        data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        # Scrittura atomica: un file parziale non viene mai letto come valido
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Error writing transcript cache entry: {e}")
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            return
+        # Gli altri processi scrivono e rimuovono voci nella stessa directory:
+        # i limiti si applicano al contenuto reale del disco
+        index, total_bytes = self._scan()
+        with self._lock:
+            self._index, self._total_bytes = index, total_bytes
+            self._evict()
+
+    def _forget(self, key):
+        size = self._index.pop(key, None)
+        if size is not None:
+            self._total_bytes -= size
+
+    def _discard(self, key):
+        self._forget(key)
+        try:
+            os.unlink(self._path(key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        while self._index and (self._total_bytes > self.max_bytes or len(self._index) > self.max_entries):
+            key = next(iter(self._index))
+            self._discard(key)
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._index),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "max_entries": self.max_entries
+            }
@@ -0,0 +1,99 @@
+import os
+from contextlib import contextmanager
+
+# Lingua delle registrazioni: fissarla evita il riconoscimento automatico a
+# ogni trascrizione ("auto" per riconoscerla comunque)
+TRANSCRIPTION_LANGUAGE = os.getenv("TRANSCRIPTION_LANGUAGE", "it")
+# Profilo usato quando la richiesta non ne indica uno
+DEFAULT_PROFILE = os.getenv("TRANSCRIPTION_PROFILE", "balanced")
+
+_MODEL_SIZE = os.getenv("WHISPER_MODEL_SIZE", "medium")
+_CPU_THREADS = os.cpu_count() or 1
+
+
+def _language():
+    return None if TRANSCRIPTION_LANGUAGE == "auto" else TRANSCRIPTION_LANGUAGE
+
+
+# Profili di velocità: dimensione del modello e opzioni di decodifica di Whisper
+PROFILES = {
+    # Modello piccolo, decodifica greedy senza ripetizioni a temperature più alte
+    "fast": {
+        "model_size": os.getenv("FAST_PROFILE_MODEL_SIZE", "base"),
+        "language": _language(),
+        "beam_size": None,
+        "best_of": None,
+        "temperature": (0.0,),
+        "condition_on_previous_text": False,
+        "threads": int(os.getenv("FAST_PROFILE_THREADS", str(_CPU_THREADS)))
+    },
+    # Il modello configurato con le opzioni predefinite di Whisper (ma lingua fissa)
+    "balanced": {
+        "model_size": _MODEL_SIZE,
+        "language": _language(),
+        "beam_size": None,
+        "best_of": 5,
+        "temperature": (0.0, 0.2, 0.4, 0.6, 0.8, 1.0),
+        "condition_on_previous_text": True,
+        "threads": int(os.getenv("BALANCED_PROFILE_THREADS", str(_CPU_THREADS)))
+    },
+    # Beam search e fallback completo: più lento, meno errori sui termini tecnici
+    "accurate": {
+        "model_size": os.getenv("ACCURATE_PROFILE_MODEL_SIZE", _MODEL_SIZE),
+        "language": _language(),
+        "beam_size": 5,
+        "best_of": 5,
+        "temperature": (0.0, 0.2, 0.4, 0.6, 0.8, 1.0),
+        "condition_on_previous_text": True,
+        "threads": int(os.getenv("ACCURATE_PROFILE_THREADS", str(_CPU_THREADS)))
+    }
+}
+
+
+def get_profile(name=None):
+    """
+    Restituisce (nome, profilo). Solleva ValueError per un profilo sconosciuto.
+    """
+    name = (name or DEFAULT_PROFILE).lower()
+    if name not in PROFILES:
+        raise ValueError(f"Unknown transcription profile '{name}' (available: {', '.join(PROFILES)})")
+    return name, PROFILES[name]
+
+
+def decode_options(profile, device):
+    """
+    Opzioni da passare a transcribe(): fp16 solo su GPU (su CPU Whisper
+    ripiegherebbe comunque su fp32 con un avviso).
+    """
+    return {
+        "language": profile["language"],
+        "beam_size": profile["beam_size"],
+        "best_of": profile["best_of"],
+        "temperature": profile["temperature"],
+        "condition_on_previous_text": profile["condition_on_previous_text"],
+        "fp16": device.startswith("cuda")
+    }
+
+
+@contextmanager
+def torch_threads(threads, device):
+    """
+    Imposta i thread di PyTorch per la durata di una trascrizione su CPU.
+    L'impostazione vale per tutto il processo: con più trascrizioni in
+    parallelo (TRANSCRIPTION_WORKERS > 1) vale l'ultima impostata.
+    """
+    if device != "cpu" or not threads:
+        yield
+        return
+    import torch
+
+    previous = torch.get_num_threads()
+    torch.set_num_threads(threads)
+    try:
+        yield
+    finally:
+        torch.set_num_threads(previous)
+
+
+def describe_profiles():
+    return {name: dict(profile) for name, profile in PROFILES.items()}
@@ -0,0 +1,119 @@
+import importlib
+import os
+import threading
+import time
+
+from whisper_backends import WHISPER_BACKEND
+
+# Quando importare torch e whisper (diversi secondi): "background" in un
+# thread all'avvio, "lazy" solo al primo utilizzo, "eager" prima di servire
+# le richieste. Le rotte che non usano i modelli rispondono subito in ogni caso
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "background")
+
+# Moduli pesanti caricati dal warm-up, nell'ordine (secondo il motore di Whisper)
+WARMUP_MODULES = ["torch", "faster_whisper" if WHISPER_BACKEND == "faster-whisper" else "whisper"]
+
+PENDING = "pending"
+RUNNING = "running"
+READY = "ready"
+FAILED = "failed"
+
+_device = None
+
+
+def default_device():
+    """
+    Dispositivo usato per Whisper ("cuda" o "cpu"). Al primo utilizzo importa
+    torch e controlla CUDA.
+    """
+    global _device
+    if _device is None:
+        import torch
+
+        if torch.cuda.is_available():
+            print(f"Using GPU: {torch.cuda.get_device_name(0)}")
+            _device = "cuda"
+        else:
+            print("GPU not available, using CPU")
+            _device = "cpu"
+    return _device
+
+
+def torch_loaded():
+    """
+    True se torch è già stato importato e il dispositivo rilevato (senza attese).
+    """
+    return _device is not None
+
+
+class Warmup:
+    """
+    Importa torch e whisper e rileva il dispositivo in un thread separato,
+    così il server accetta richieste mentre le librerie vengono caricate.
+    Chi usa i modelli prima della fine del warm-up attende semplicemente
+    l'import (il lock degli import di Python lo serializza).
+    """
+
+    def __init__(self, modules=WARMUP_MODULES):
+        self.modules = modules
+        self._lock = threading.Lock()
+        self._thread = None
+        self._done = threading.Event()
+        self.state = PENDING
+        self.started_at = None
+        self.finished_at = None
+        self.import_seconds = {}
+        self.error = None
+
+    def run(self):
+        with self._lock:
+            if self.state != PENDING:
+                return
+            self.state = RUNNING
+            self.started_at = time.time()
+        try:
+            for name in self.modules:
+                start = time.perf_counter()
+                importlib.import_module(name)
+                self.import_seconds[name] = round(time.perf_counter() - start, 3)
+            default_device()
+            self.state = READY
+            print(f"Warm-up completed in {time.time() - self.started_at:.1f}s: {self.import_seconds}")
+        except Exception as e:
+            print(f"Error during warm-up: {e}")
+            self.error = str(e)
+            self.state = FAILED
+        finally:
+            self.finished_at = time.time()
+            self._done.set()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None or self.state != PENDING:
+                return
+            self._thread = threading.Thread(target=self.run, name="warmup", daemon=True)
+            self._thread.start()
+
+    def wait(self, timeout=None):
+        """
+        Attende la fine del warm-up, se è stato avviato (es. prima di un fork).
+        """
+        if self.state == PENDING:
+            return True
+        return self._done.wait(timeout)
+
+    def stats(self):
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = round((self.finished_at or time.time()) - self.started_at, 3)
+        return {
+            "mode": STARTUP_WARMUP,
+            "state": self.state,
+            "elapsed_seconds": elapsed,
+            "import_seconds": dict(self.import_seconds),
+            "device": _device,
+            "error": self.error
+        }
+
+
+warmup = Warmup()
@@ -0,0 +1,122 @@
+import os
+
+# Motore di inferenza di Whisper, scelto per installazione:
+# - "openai": openai-whisper in PyTorch (fp16 su GPU, fp32 su CPU)
+# - "openai-int8": openai-whisper con i layer lineari quantizzati int8 (dinamica, solo CPU)
+# - "faster-whisper": CTranslate2 (pacchetto faster-whisper), int8 su CPU
+WHISPER_BACKEND = os.getenv("WHISPER_BACKEND", "openai")
+# Tipo di calcolo di CTranslate2 per CPU e GPU
+FASTER_WHISPER_COMPUTE_TYPE = os.getenv("FASTER_WHISPER_COMPUTE_TYPE", "int8")
+FASTER_WHISPER_GPU_COMPUTE_TYPE = os.getenv("FASTER_WHISPER_GPU_COMPUTE_TYPE", "float16")
+# Thread di CTranslate2 per modello (0 = scelta automatica)
+FASTER_WHISPER_CPU_THREADS = int(os.getenv("FASTER_WHISPER_CPU_THREADS", "0"))
+
+# Nomi di faster-whisper per le dimensioni che differiscono da openai-whisper
+FASTER_WHISPER_SIZES = {"large": "large-v3", "turbo": "large-v3-turbo"}
+
+
+def _load_openai(model_size, device):
+    import whisper
+
+    return whisper.load_model(model_size, device=device)
+
+
+def _load_openai_int8(model_size, device):
+    import torch
+    import whisper
+
+    if device != "cpu":
+        # La quantizzazione dinamica di PyTorch esiste solo per CPU
+        print(f"openai-int8 backend is CPU-only, using the standard engine on {device}")
+        return whisper.load_model(model_size, device=device)
+
+    model = whisper.load_model(model_size, device="cpu")
+    # I Linear di whisper sono sottoclassi (con cast del dtype) che quantize_dynamic
+    # non riconosce: su CPU in fp32 equivalgono a nn.Linear
+    for module in model.modules():
+        if isinstance(module, whisper.model.Linear):
+            module.__class__ = torch.nn.Linear
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class FasterWhisperModel:
+    """
+    Adatta un modello faster-whisper all'interfaccia di openai-whisper:
+    transcribe(audio, **opzioni) restituisce {"text", "segments", "language"}.
+    """
+
+    # Opzioni di openai-whisper accettate anche da faster-whisper
+    OPTIONS = {"language", "task", "initial_prompt", "temperature", "beam_size", "best_of",
+               "condition_on_previous_text", "no_speech_threshold", "compression_ratio_threshold",
+               "word_timestamps"}
+
+    def __init__(self, model, model_size, device):
+        self.model = model
+        self.model_size = model_size
+        self.device = device
+
+    def transcribe(self, audio, **options):
+        kwargs = {name: value for name, value in options.items() if name in self.OPTIONS and value is not None}
+        # In openai-whisper None significa decodifica greedy e un solo campione
+        # alle temperature di fallback; faster-whisper userebbe invece 5 e 5
+        for name in ("beam_size", "best_of"):
+            if name in options and options[name] is None:
+                kwargs[name] = 1
+        if "logprob_threshold" in options:
+            kwargs["log_prob_threshold"] = options["logprob_threshold"]
+        segments, info = self.model.transcribe(audio, **kwargs)
+        segments = [{"id": i, "start": s.start, "end": s.end, "text": s.text} for i, s in enumerate(segments)]
+        return {
+            "text": "".join(s["text"] for s in segments),
+            "segments": segments,
+            "language": info.language
+        }
+
+
+def _load_faster_whisper(model_size, device):
+    from faster_whisper import WhisperModel
+
+    compute_type = FASTER_WHISPER_GPU_COMPUTE_TYPE if device.startswith("cuda") else FASTER_WHISPER_COMPUTE_TYPE
+    model = WhisperModel(FASTER_WHISPER_SIZES.get(model_size, model_size),
+                         device="cuda" if device.startswith("cuda") else "cpu",
+                         compute_type=compute_type, cpu_threads=FASTER_WHISPER_CPU_THREADS)
+    return FasterWhisperModel(model, model_size, device)
+
+
+# nome -> (caricamento, frazione della memoria di openai-whisper in fp32)
+BACKENDS = {
+    "openai": (_load_openai, 1.0),
+    "openai-int8": (_load_openai_int8, 0.5),
+    "faster-whisper": (_load_faster_whisper, 0.35)
+}
+
+
+def get_backend(name=None):
+    name = name or WHISPER_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown Whisper backend '{name}' (available: {', '.join(BACKENDS)})")
+    return name
+
+
+def load_model(model_size, device, backend=None):
+    """
+    Carica un modello Whisper con il motore configurato. Tutti i motori
+    restituiscono un oggetto con transcribe(audio, **opzioni) nel formato di
+    openai-whisper.
+    """
+    loader, _ = BACKENDS[get_backend(backend)]
+    return loader(model_size, device)
+
+
+def memory_factor(backend=None):
+    return BACKENDS[get_backend(backend)][1]
+
+
+def model_id(model_size, backend=None):
+    """
+    Identificativo del modello per le chiavi della cache: motori diversi
+    producono trascrizioni diverse. Per il motore predefinito resta la sola
+    dimensione, così le trascrizioni già in cache restano valide.
+    """
+    backend = get_backend(backend)
+    return model_size if backend == "openai" else f"{model_size}:{backend}"
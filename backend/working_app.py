@@ -2,9 +2,10 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS
 import os
 import json
-import re
 from datetime import datetime
 
+from text_cleaner import clean_transcript
+
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
@@ -52,42 +53,15 @@ def clean_transcript_endpoint():
         return jsonify({"error": "No text provided"}), 400
     
     text = data['text']
+    language = data.get('language')
     
     try:
-        cleaned_text = clean_transcript(text)
+        cleaned_text = clean_transcript(text, language)
         return jsonify({"cleaned_text": cleaned_text})
     except Exception as e:
         print(f"Error cleaning transcript: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
-def clean_transcript(transcript):
-    """
-    Function to clean the transcript from filler words and pauses.
-    """
-    # List of words to remove or replace
-    filler_words = [
-        r'\behm\b', r'\bmmm\b', r'\buhm\b', r'\buh\b', 
-        r'\ballora\b', r'\bcioè\b', r'\becco\b',
-        r'\bok adesso\b', r'\bok ora\b', r'\bho sbagliato\b',
-        r'\bvediamo\b', r'\bvediamo un attimo\b', r'\bun attimo\b',
-        r'\bin pratica\b', r'\bin realtà\b', r'\bin effetti\b',
-        r'\bquindi\b', r'\binsomma\b', r'\bcome dire\b',
-        r'\bcapito\b', r'\bva bene\b'
-    ]
-    
-    # Remove filler words
-    cleaned_text = transcript
-    for word in filler_words:
-        cleaned_text = re.sub(word, '', cleaned_text, flags=re.IGNORECASE)
-    
-    # Remove multiple spaces
-    cleaned_text = re.sub(r' +', ' ', cleaned_text)
-    
-    # Remove spaces before punctuation
-    cleaned_text = re.sub(r' ([,.!?:;])', r'\1', cleaned_text)
-    
-    return cleaned_text.strip()
-
 @app.route('/api/correct-text', methods=['POST'])
 def correct_text():
     data = request.json
@@ -192,6 +166,8 @@ def transcribe_audio():
     })
 
 if __name__ == '__main__':
+    # Server di sviluppo, solo per l'uso in locale: in produzione usare gunicorn (gunicorn.conf.py)
     print("Starting Flask server...")
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port, debug=True)
+    debug = os.environ.get('FLASK_DEBUG', 'true').lower() == 'true'
+    app.run(host=os.environ.get('HOST', '0.0.0.0'), port=port, debug=debug)